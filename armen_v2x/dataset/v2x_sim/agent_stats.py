@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import os.path as osp
+import numpy as np
+from typing import Dict, List, Sequence, Union
+from armen_v2x.utils.bev import get_pixels_id
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.v2x_sim_dataset import prepare_sample
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+from armen_v2x.dataset.v2x_sim.process_pool import make_process_pool, run_in_worker
+
+
+def _get_masks_table(num_agents: int) -> np.ndarray:
+    # (2^A, A) - table[m, a] is True if bit a of agents mask m is set
+    return (np.arange(1 << num_agents)[:, np.newaxis] >> np.arange(num_agents)) & 1 == 1
+
+
+def compute_agent_stats(samples: Sequence[Dict[str, np.ndarray]], num_agents: int, point_cloud_range: np.ndarray,
+                        resolution: float, min_points_per_box: int = 1) -> Dict[str, np.ndarray]:
+    """
+    Quantify what each agent's point cloud adds, for several samples at once. Every (sample, BEV pixel) &
+    (sample, box) gets a mask of the agents seeing it, one bit per agent, so that statistics are counts of masks
+    :param samples: S samples made by prepare_sample
+    :param num_agents: A, 1 + the largest j of LIDAR_TOP_id_j
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max of the BEV grid
+    :param resolution: size of a BEV pixel measured by meter
+    :param min_points_per_box: number of points an agent must have inside a box to see it
+    :return: {
+        num_points: (S, A) - number of points collected by each agent
+        coverage: (S, A) - number of BEV pixels occupied by each agent's points
+        exclusive_coverage: (S, A) - number of BEV pixels occupied by this agent only
+        overlap: (S, A, A) - overlap[s, i, j] is the number of BEV pixels occupied by both agents i & j
+        union_coverage: (S,) - number of BEV pixels occupied by any agent
+        num_boxes: (S,)
+        num_visible_boxes: (S, A) - number of boxes seen by each agent
+        num_exclusive_boxes: (S, A) - number of boxes seen by this agent only, i.e. that would be missed without it
+        num_visible_boxes_union: (S,) - number of boxes seen by any agent
+    }
+    """
+    assert num_agents < 16, f"agents masks are counted on 2^num_agents bins, get {num_agents} agents"
+    n_samples, n_masks = len(samples), 1 << num_agents
+    masks_table = _get_masks_table(num_agents)  # (2^A, A)
+    agents_bit = 1 << np.arange(num_agents)
+
+    # BEV pixels: one id space for the pixels of all samples
+    bev_size = np.ceil((point_cloud_range[3: 5] - point_cloud_range[:2]) / resolution).astype(np.int64)
+    n_pixels = int(bev_size[0] * bev_size[1])
+    pixels_id, points_src_idx = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for s, sample in enumerate(samples):
+        sample_pixels_id, mask_inside, _ = get_pixels_id(sample['points'], point_cloud_range, resolution)
+        pixels_id.append(sample_pixels_id + s * n_pixels)
+        points_src_idx.append(sample['points_src_idx'][mask_inside])
+    pixels_id = np.concatenate(pixels_id)
+    points_src_idx = np.concatenate(points_src_idx).astype(np.int64)
+
+    # agents mask of each occupied (sample, pixel): OR of the bits of distinct (pixel, agent) pairs
+    pixels_agent = np.unique(pixels_id * num_agents + points_src_idx)
+    occupied_pixels_id, pixels_agent_idx = np.unique(pixels_agent // num_agents, return_inverse=True)
+    pixels_mask = np.bincount(pixels_agent_idx.reshape(-1), weights=agents_bit[pixels_agent % num_agents],
+                              minlength=occupied_pixels_id.shape[0]).astype(np.int64)
+    # number of pixels of each (sample, mask), then counts of masks give every statistic
+    masks_count = np.bincount((occupied_pixels_id // n_pixels) * n_masks + pixels_mask,
+                              minlength=n_samples * n_masks).reshape(n_samples, n_masks)
+    overlap = (masks_count @ (masks_table[:, :, np.newaxis] & masks_table[:, np.newaxis, :])
+               .reshape(n_masks, -1)).reshape(n_samples, num_agents, num_agents)
+
+    # boxes: one id space for the boxes of all samples
+    num_boxes = np.array([sample['boxes'].shape[0] for sample in samples], dtype=np.int64)
+    boxes_offsets = np.cumsum(num_boxes) - num_boxes
+    points_box_idx = np.concatenate([np.zeros(0, dtype=np.int64)] + [
+        np.where(sample['points_box_idx'] > -1, sample['points_box_idx'] + boxes_offsets[s], -1)
+        for s, sample in enumerate(samples)])
+    mask_fg = points_box_idx > -1
+    all_points_src_idx = np.concatenate([np.zeros(0, dtype=np.int64)] + [sample['points_src_idx']
+                                                                        for sample in samples]).astype(np.int64)
+    boxes_points_count = np.bincount(points_box_idx[mask_fg] * num_agents + all_points_src_idx[mask_fg],
+                                     minlength=int(num_boxes.sum()) * num_agents).reshape(-1, num_agents)
+    boxes_visible = boxes_points_count >= min_points_per_box  # (B_tot, A)
+    boxes_mask = boxes_visible @ agents_bit  # (B_tot,)
+    boxes_masks_count = np.bincount(np.repeat(np.arange(n_samples), num_boxes) * n_masks + boxes_mask,
+                                    minlength=n_samples * n_masks).reshape(n_samples, n_masks)
+
+    return {
+        'num_points': np.array([np.bincount(sample['points_src_idx'], minlength=num_agents) for sample in samples],
+                               dtype=np.int64).reshape(n_samples, num_agents),
+        'coverage': masks_count @ masks_table,
+        'exclusive_coverage': masks_count[:, agents_bit],
+        'overlap': overlap,
+        'union_coverage': masks_count[:, 1:].sum(axis=1),
+        'num_boxes': num_boxes,
+        'num_visible_boxes': boxes_masks_count @ masks_table,
+        'num_exclusive_boxes': boxes_masks_count[:, agents_bit],
+        'num_visible_boxes_union': boxes_masks_count[:, 1:].sum(axis=1)
+    }
+
+
+def compute_scene_agent_stats(index: V2XSimIndex, scene_token: str, ref_sensor_name: str,
+                              thresh_dist_to_lidar: float, point_cloud_range: np.ndarray, resolution: float,
+                              min_points_per_box: int = 1) -> Dict[str, np.ndarray]:
+    """
+    compute_agent_stats over every sample of a scene having ref_sensor_name
+    :return: see compute_agent_stats, with an extra sample_tokens: (S,) entry
+    """
+    tf_table = SceneTransformTable(index, scene_token, ref_sensor_name)
+    sample_tokens = tf_table.ref_sample_tokens
+    samples = [prepare_sample(index, token, ref_sensor_name, thresh_dist_to_lidar, tf_table=tf_table)
+               for token in sample_tokens]
+    stats = compute_agent_stats(samples, index.num_lidars, point_cloud_range, resolution, min_points_per_box)
+    stats['sample_tokens'] = np.array(sample_tokens)
+    return stats
+
+
+class AgentStatsEngine:
+    """
+    Compute agents' statistics (see compute_agent_stats) over scenes of a split & cache them per scene as .npz files,
+    keyed by the scene & a hash of the configuration. Missing scenes are computed by a pool of processes, one scene
+    per task.
+    """
+
+    def __init__(self, index: V2XSimIndex, ref_sensor_name: str, thresh_dist_to_lidar: float,
+                 point_cloud_range: np.ndarray, resolution: float, min_points_per_box: int = 1,
+                 cache_dir: str = None):
+        """
+        :param index: V2X-Sim index
+        :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+        :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+        :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max of the BEV grid
+        :param resolution: size of a BEV pixel measured by meter
+        :param min_points_per_box: number of points an agent must have inside a box to see it
+        :param cache_dir: directory of cached statistics, created if not exist. If None, nothing is cached
+        """
+        self.index = index
+        self.config = {'ref_sensor_name': ref_sensor_name, 'thresh_dist_to_lidar': float(thresh_dist_to_lidar),
+                       'point_cloud_range': [float(v) for v in point_cloud_range], 'resolution': float(resolution),
+                       'min_points_per_box': int(min_points_per_box)}
+        self.config_key = hashlib.md5(json.dumps(self.config, sort_keys=True).encode()).hexdigest()[:8]
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_cache_file(self, scene_token: str) -> Union[str, None]:
+        if self.cache_dir is None:
+            return None
+        return osp.join(self.cache_dir, f"{scene_token}_{self.config_key}.npz")
+
+    def _compute_args(self, scene_token: str) -> tuple:
+        config = self.config
+        return (scene_token, config['ref_sensor_name'], config['thresh_dist_to_lidar'],
+                np.array(config['point_cloud_range']), config['resolution'], config['min_points_per_box'])
+
+    def _save(self, scene_token: str, stats: Dict[str, np.ndarray]) -> None:
+        cache_file = self._get_cache_file(scene_token)
+        if cache_file is None:
+            return
+        with open(f"{cache_file}.tmp", 'wb') as f:
+            np.savez(f, **stats)
+        os.replace(f"{cache_file}.tmp", cache_file)
+
+    def _load(self, scene_token: str) -> Union[Dict[str, np.ndarray], None]:
+        cache_file = self._get_cache_file(scene_token)
+        if cache_file is None or not osp.isfile(cache_file):
+            return None
+        with np.load(cache_file) as data:
+            return {name: data[name] for name in data.files}
+
+    def scene_stats(self, scene_token: str) -> Dict[str, np.ndarray]:
+        """
+        :param scene_token:
+        :return: see compute_scene_agent_stats
+        """
+        stats = self._load(scene_token)
+        if stats is None:
+            stats = compute_scene_agent_stats(self.index, *self._compute_args(scene_token))
+            self._save(scene_token, stats)
+        return stats
+
+    def __call__(self, scene_tokens: List[str] = None, num_workers: int = 1) -> Dict[str, np.ndarray]:
+        """
+        :param scene_tokens: scenes to compute statistics of. Default: every scene
+        :param num_workers: number of worker processes computing scenes that are not cached
+        :return: statistics of every sample of the scenes, concatenated along the first axis (see
+            compute_scene_agent_stats), with an extra scene_tokens: (S,) entry
+        """
+        if scene_tokens is None:
+            scene_tokens = self.index.scene_token.tolist()
+        scenes_stats = {token: self._load(token) for token in scene_tokens}
+        todo = [token for token, stats in scenes_stats.items() if stats is None]
+        if len(todo) > 0 and num_workers > 1:
+            with make_process_pool(self.index, num_workers) as executor:
+                futures = {token: executor.submit(run_in_worker, compute_scene_agent_stats, *self._compute_args(token))
+                           for token in todo}
+                for token, future in futures.items():
+                    scenes_stats[token] = future.result()
+                    self._save(token, scenes_stats[token])
+        else:
+            for token in todo:
+                scenes_stats[token] = self.scene_stats(token)
+
+        out = {name: np.concatenate([scenes_stats[token][name] for token in scene_tokens])
+               for name in scenes_stats[scene_tokens[0]].keys()}
+        out['scene_tokens'] = np.concatenate([np.full(scenes_stats[token]['num_boxes'].shape[0], token)
+                                              for token in scene_tokens])
+        return out
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import os.path as osp
+import numpy as np
+from concurrent.futures import as_completed
+from typing import Dict, Iterator, List, Union
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.v2x_sim_dataset import prepare_sample
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+from armen_v2x.dataset.v2x_sim.process_pool import make_process_pool, run_in_worker
+
+
+MANIFEST_FILENAME = 'manifest.json'
+# bumped when arrays of shards change, so that shards of another format are not mixed in the same directory
+SHARD_FORMAT = 2
+
+
+def bake_scene(index: V2XSimIndex, scene_token: str, out_dir: str, ref_sensor_name: str,
+               thresh_dist_to_lidar: float, max_samples_per_shard: int) -> List[Dict[str, Union[str, int]]]:
+    """
+    Prepare every sample of a scene (see prepare_sample) & write them to shards of up to max_samples_per_shard
+    samples. A shard is a .npz file where arrays of its samples are concatenated, sample i owning
+    points[points_offsets[i]: points_offsets[i + 1]] & boxes[boxes_offsets[i]: boxes_offsets[i + 1]]
+    :param index: V2X-Sim index
+    :param scene_token:
+    :param out_dir: directory of shards
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param max_samples_per_shard:
+    :return: [{filename, num_samples}] - shards of the scene, in order
+    """
+    tf_table = SceneTransformTable(index, scene_token, ref_sensor_name)
+    sample_tokens = tf_table.ref_sample_tokens
+    shards = []
+    for shard_idx, start in enumerate(range(0, len(sample_tokens), max_samples_per_shard)):
+        samples = [prepare_sample(index, token, ref_sensor_name, thresh_dist_to_lidar, tf_table=tf_table)
+                   for token in sample_tokens[start: start + max_samples_per_shard]]
+        filename = f"{scene_token}_{shard_idx:04d}.npz"
+        tmp_file = osp.join(out_dir, f"{filename}.tmp")
+        with open(tmp_file, 'wb') as f:
+            np.savez(f,
+                     sample_tokens=np.array([sample['sample_token'] for sample in samples]),
+                     points=np.concatenate([sample['points'] for sample in samples]).astype(np.float32),
+                     points_src_idx=np.concatenate([sample['points_src_idx'] for sample in samples]).astype(np.int8),
+                     points_cls=np.concatenate([sample['points_cls'] for sample in samples]).astype(np.int8),
+                     points_box_idx=np.concatenate([sample['points_box_idx'] for sample in samples])
+                     .astype(np.int32),
+                     points_offsets=np.cumsum([0] + [sample['points'].shape[0] for sample in samples]),
+                     boxes=np.concatenate([sample['boxes'].reshape(-1, 8) for sample in samples]),
+                     boxes_offsets=np.cumsum([0] + [sample['boxes'].shape[0] for sample in samples]))
+        os.replace(tmp_file, osp.join(out_dir, filename))
+        shards.append({'filename': filename, 'num_samples': len(samples)})
+    return shards
+
+
+def load_manifest(out_dir: str) -> dict:
+    """
+    :param out_dir: directory of shards
+    :return: {config: {...}, scenes: {scene_token: [{filename, num_samples}]}} - scenes in the order they were baked
+    """
+    manifest_file = osp.join(out_dir, MANIFEST_FILENAME)
+    if not osp.isfile(manifest_file):
+        return {'config': None, 'scenes': dict()}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def _save_manifest(out_dir: str, manifest: dict) -> None:
+    manifest_file = osp.join(out_dir, MANIFEST_FILENAME)
+    with open(f"{manifest_file}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+
+
+def bake(index: V2XSimIndex, out_dir: str, ref_sensor_name: str, thresh_dist_to_lidar: float,
+         scene_tokens: List[str] = None, max_samples_per_shard: int = 64, num_workers: int = 4) -> dict:
+    """
+    Bake scenes into shards, one scene per task of a process pool. The manifest is updated as soon as a scene is
+    done, so an interrupted bake resumes from the scenes that are not in the manifest yet
+    :param index: V2X-Sim index
+    :param out_dir: directory of shards, created if not exist
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param scene_tokens: scenes to bake. Default: every scene
+    :param max_samples_per_shard:
+    :param num_workers: number of worker processes
+    :return: manifest, see load_manifest
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    config = {'ref_sensor_name': ref_sensor_name, 'thresh_dist_to_lidar': thresh_dist_to_lidar,
+              'max_samples_per_shard': max_samples_per_shard, 'shard_format': SHARD_FORMAT}
+    manifest = load_manifest(out_dir)
+    if manifest['config'] is not None:
+        assert manifest['config'] == config, f"{out_dir} was baked with {manifest['config']}, not {config}"
+    manifest['config'] = config
+
+    if scene_tokens is None:
+        scene_tokens = index.scene_token.tolist()
+    todo = [token for token in scene_tokens if token not in manifest['scenes'] or
+            not all(osp.isfile(osp.join(out_dir, shard['filename'])) for shard in manifest['scenes'][token])]
+    print(f"baking {len(todo)} scenes, {len(scene_tokens) - len(todo)} already done")
+
+    with make_process_pool(index, num_workers) as executor:
+        futures = {executor.submit(run_in_worker, bake_scene, token, out_dir, ref_sensor_name, thresh_dist_to_lidar,
+                                   max_samples_per_shard): token for token in todo}
+        for i, future in enumerate(as_completed(futures)):
+            manifest['scenes'][futures[future]] = future.result()
+            _save_manifest(out_dir, manifest)
+            print(f"[{i + 1}/{len(todo)}] scene {futures[future]} done")
+
+    # keep the order of scene_tokens regardless of the order scenes were done in, scenes baked by previous calls
+    # with other scene_tokens come first
+    baked_scenes = manifest['scenes']
+    manifest['scenes'] = {token: shards for token, shards in baked_scenes.items() if token not in scene_tokens}
+    manifest['scenes'].update({token: baked_scenes[token] for token in scene_tokens if token in baked_scenes})
+    _save_manifest(out_dir, manifest)
+    return manifest
+
+
+def iter_baked_samples(out_dir: str) -> Iterator[Dict[str, Union[str, np.ndarray]]]:
+    """
+    Read baked samples sequentially, shard after shard in the order of the manifest
+    :param out_dir: directory of shards
+    :return: iterator of samples, see prepare_sample
+    """
+    manifest = load_manifest(out_dir)
+    for shards in manifest['scenes'].values():
+        for shard in shards:
+            with np.load(osp.join(out_dir, shard['filename'])) as data:
+                shard_arrays = {name: data[name] for name in data.files}
+            points_offsets, boxes_offsets = shard_arrays['points_offsets'], shard_arrays['boxes_offsets']
+            for i, sample_token in enumerate(shard_arrays['sample_tokens'].tolist()):
+                points_slice = slice(points_offsets[i], points_offsets[i + 1])
+                yield {
+                    'sample_token': sample_token,
+                    'points': shard_arrays['points'][points_slice],
+                    'points_src_idx': shard_arrays['points_src_idx'][points_slice].astype(int),
+                    'boxes': shard_arrays['boxes'][boxes_offsets[i]: boxes_offsets[i + 1]],
+                    'points_cls': shard_arrays['points_cls'][points_slice].astype(int),
+                    'points_box_idx': shard_arrays['points_box_idx'][points_slice]
+                }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='bake a V2X-Sim split into shards of prepared samples')
+    parser.add_argument('--dataroot', type=str, default='../data/v2x-sim')
+    parser.add_argument('--version', type=str, default='v1.0-mini')
+    parser.add_argument('--index', type=str, default=None, help='default: dataroot/version/index.npz, built if '
+                                                                 'not exist')
+    parser.add_argument('--out', type=str, default=None, help='default: dataroot/version/baked')
+    parser.add_argument('--ref_sensor_name', type=str, default='LIDAR_TOP_id_1')
+    parser.add_argument('--thresh_dist_to_lidar', type=float, default=2.0)
+    parser.add_argument('--max_samples_per_shard', type=int, default=64)
+    parser.add_argument('--num_workers', type=int, default=4)
+    args = parser.parse_args()
+
+    v2x_index = V2XSimIndex.load_or_build(args.index, args.dataroot, args.version)
+    bake(v2x_index, args.out if args.out is not None else osp.join(args.dataroot, args.version, 'baked'),
+         args.ref_sensor_name, args.thresh_dist_to_lidar, max_samples_per_shard=args.max_samples_per_shard,
+         num_workers=args.num_workers)
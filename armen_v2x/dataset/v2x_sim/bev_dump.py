@@ -0,0 +1,126 @@
+import argparse
+import os
+import os.path as osp
+import numpy as np
+from concurrent.futures import as_completed
+from typing import List
+from armen_v2x.utils.rendering import make_bev_img, save_png
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.v2x_sim_dataset import prepare_sample
+from armen_v2x.dataset.v2x_sim.v2x_sim_utils import CLASS_COLORS
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+from armen_v2x.dataset.v2x_sim.process_pool import make_process_pool, run_in_worker
+
+
+MODES = ('png', 'mosaic')
+
+
+def make_mosaic(images: List[np.ndarray], stride: int = 2, n_columns: int = None) -> np.ndarray:
+    """
+    Tile images on a grid, from left to right then top to bottom
+    :param images: list of (H, W, 3) - uint8, all of the same size
+    :param stride: images are subsampled by this factor
+    :param n_columns: Default: ceil(sqrt(number of images))
+    :return: (n_rows * H', n_columns * W', 3) - uint8
+    """
+    tiles = np.stack([image[::stride, ::stride] for image in images])  # (n_images, H', W', 3)
+    n_images, tile_height, tile_width = tiles.shape[:3]
+    if n_columns is None:
+        n_columns = int(np.ceil(np.sqrt(n_images)))
+    n_rows = int(np.ceil(n_images / n_columns))
+    grid = np.zeros((n_rows * n_columns, tile_height, tile_width, 3), dtype=np.uint8)
+    grid[:n_images] = tiles
+    return grid.reshape(n_rows, n_columns, tile_height, tile_width, 3).transpose(0, 2, 1, 3, 4) \
+        .reshape(n_rows * tile_height, n_columns * tile_width, 3)
+
+
+def dump_scene(index: V2XSimIndex, scene_token: str, out_dir: str, ref_sensor_name: str,
+               thresh_dist_to_lidar: float, point_cloud_range: np.ndarray, resolution: float, mode: str = 'png',
+               mosaic_stride: int = 2) -> List[str]:
+    """
+    Render the BEV image (see make_bev_img) of every sample of a scene having ref_sensor_name
+    :param index: V2X-Sim index
+    :param scene_token:
+    :param out_dir: directory of images
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :param mode: one of MODES. png: one image per sample named {scene_token}_{i:04d}.png, mosaic: one image
+        {scene_token}.png tiling the samples of the scene
+    :param mosaic_stride: samples' images are subsampled by this factor in the mosaic
+    :return: filenames of written images
+    """
+    assert mode in MODES, f"{mode} is not in {MODES}"
+    tf_table = SceneTransformTable(index, scene_token, ref_sensor_name)
+    filenames, images = [], []
+    for i, sample_token in enumerate(tf_table.sample_tokens):
+        if not tf_table.sample_has_ref[i]:
+            continue
+        sample = prepare_sample(index, sample_token, ref_sensor_name, thresh_dist_to_lidar, tf_table=tf_table)
+        image = make_bev_img(sample['points'], point_cloud_range, resolution, sample['points_cls'],
+                             sample['boxes'], CLASS_COLORS)
+        if mode == 'png':
+            filenames.append(f"{scene_token}_{i:04d}.png")
+            save_png(osp.join(out_dir, filenames[-1]), image)
+        else:
+            images.append(image)
+    if mode == 'mosaic' and len(images) > 0:
+        filenames.append(f"{scene_token}.png")
+        save_png(osp.join(out_dir, filenames[-1]), make_mosaic(images, mosaic_stride))
+    return filenames
+
+
+def dump_bev_images(index: V2XSimIndex, out_dir: str, ref_sensor_name: str, thresh_dist_to_lidar: float,
+                    point_cloud_range: np.ndarray, resolution: float, scene_tokens: List[str] = None,
+                    mode: str = 'png', mosaic_stride: int = 2, num_workers: int = 4) -> List[str]:
+    """
+    Render the BEV images of scenes, one scene per task of a process pool
+    :param index: V2X-Sim index
+    :param out_dir: directory of images, created if not exist
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :param scene_tokens: scenes to render. Default: every scene
+    :param mode: see dump_scene
+    :param mosaic_stride: see dump_scene
+    :param num_workers: number of worker processes
+    :return: filenames of written images
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if scene_tokens is None:
+        scene_tokens = index.scene_token.tolist()
+    filenames = []
+    with make_process_pool(index, num_workers) as executor:
+        futures = {executor.submit(run_in_worker, dump_scene, token, out_dir, ref_sensor_name, thresh_dist_to_lidar,
+                                   point_cloud_range, resolution, mode, mosaic_stride): token
+                   for token in scene_tokens}
+        for i, future in enumerate(as_completed(futures)):
+            filenames += future.result()
+            print(f"[{i + 1}/{len(scene_tokens)}] scene {futures[future]} done")
+    return sorted(filenames)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='render BEV images of a V2X-Sim split for label QA')
+    parser.add_argument('--dataroot', type=str, default='../data/v2x-sim')
+    parser.add_argument('--version', type=str, default='v1.0-mini')
+    parser.add_argument('--index', type=str, default=None, help='default: dataroot/version/index.npz, built if '
+                                                                 'not exist')
+    parser.add_argument('--out', type=str, default=None, help='default: dataroot/version/bev_images')
+    parser.add_argument('--ref_sensor_name', type=str, default='LIDAR_TOP_id_1')
+    parser.add_argument('--thresh_dist_to_lidar', type=float, default=2.0)
+    parser.add_argument('--point_cloud_range', type=float, nargs=6, default=[-51.2, -51.2, -8.0, 51.2, 51.2, 0.0])
+    parser.add_argument('--resolution', type=float, default=0.2)
+    parser.add_argument('--mode', type=str, default='png', choices=MODES)
+    parser.add_argument('--mosaic_stride', type=int, default=2)
+    parser.add_argument('--num_workers', type=int, default=4)
+    args = parser.parse_args()
+
+    v2x_index = V2XSimIndex.load_or_build(args.index, args.dataroot, args.version)
+    dump_bev_images(v2x_index, args.out if args.out is not None else osp.join(args.dataroot, args.version,
+                                                                              'bev_images'),
+                    args.ref_sensor_name, args.thresh_dist_to_lidar, np.array(args.point_cloud_range),
+                    args.resolution, mode=args.mode, mosaic_stride=args.mosaic_stride,
+                    num_workers=args.num_workers)
@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+import numpy.linalg as LA
+from PIL import Image
+from nuscenes import NuScenes
+from collections import OrderedDict
+from typing import Dict, List, Union
+from armen_v2x.utils.geometry import perspective_projection_batch
+from armen_v2x.dataset.v2x_sim.v2x_sim_utils import get_available_camera_tokens, get_camera_intrinsic, \
+    get_tf_global_from_sensor
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+
+
+class ImageCache:
+    """
+    In-memory LRU cache of decoded images, keyed by file path, so that images shared by repeated samples (e.g. over
+    epochs or when several agents are painted) are decoded by PIL only once. The cache is bounded by the total size
+    of decoded images. Access is serialized by a lock, so a cache can be shared by the threads of a process.
+    """
+
+    def __init__(self, max_size_bytes: int = 1024 ** 3):
+        """
+        :param max_size_bytes: total size of decoded images above which the least recently used ones are evicted
+        """
+        assert max_size_bytes > 0, f"max_size_bytes must be positive, get {max_size_bytes}"
+        self.max_size_bytes = max_size_bytes
+        self.size_bytes = 0
+        # {path: image}, from least to most recently used
+        self.images = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_decodes = 0  # number of images decoded, i.e. not found in cache
+
+    def __call__(self, path: str) -> np.ndarray:
+        """
+        :param path: path to an image file
+        :return:
+            - image: (H, W, 3) - RGB | uint8, read-only
+        """
+        with self._lock:
+            if path in self.images:
+                self.images.move_to_end(path)
+                return self.images[path]
+
+        # decode outside the lock, so that several images are decoded concurrently
+        with Image.open(path) as img:
+            image = np.asarray(img.convert('RGB'))
+        image.setflags(write=False)
+        with self._lock:
+            self.num_decodes += 1
+            if path not in self.images:
+                self.images[path] = image
+                self.size_bytes += image.nbytes
+            while self.size_bytes > self.max_size_bytes and len(self.images) > 1:
+                _, evicted = self.images.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+        return image
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+
+def read_image(nusc: Union[NuScenes, V2XSimIndex], camera_token: str, image_cache: ImageCache = None) -> np.ndarray:
+    """
+    :param nusc: NuScenes API or V2XSimIndex
+    :param camera_token: sample data token of a camera
+    :param image_cache: cache of decoded images. If None, the image is decoded every time
+    :return:
+        - image: (H, W, 3) - RGB | uint8
+    """
+    path = nusc.get_sample_data_path(camera_token)
+    if image_cache is not None:
+        return image_cache(path)
+    with Image.open(path) as img:
+        return np.asarray(img.convert('RGB'))
+
+
+def paint_point_cloud(nusc: Union[NuScenes, V2XSimIndex], sample_token: str, points: np.ndarray,
+                      glob_from_points: np.ndarray, image_cache: ImageCache = None, camera_channels: List[str] = None,
+                      min_depth: float = 1e-3) -> Dict[str, Union[np.ndarray, List[str]]]:
+    """
+    Paint points with the RGB of the cameras of a sample (e.g. CAM_id_0_0, ..., CAM_id_1_3 for every agent).
+    Points are projected onto all cameras at once; a point seen by several cameras takes the color of the camera
+    it is closest to
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sample_token:
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param glob_from_points: (4, 4) - transformation mapping points to global frame (e.g. global <- ref LiDAR)
+    :param image_cache: cache of decoded images
+    :param camera_channels: cameras to use. Default: every camera of the sample
+    :param min_depth: points closer to the image plane than this (in meter) are not painted
+    :return: {
+        camera_channels: [str] - M cameras used, in the order of points_cam_idx
+        points_rgb: (N, 3) - uint8, 0 for points not seen by any camera
+        points_cam_idx: (N,) - index of the camera a point is painted from, -1 if not seen by any camera
+        pixels_coord: (N, 2) - pixel_x, pixel_y on image of points_cam_idx
+        depth: (N,) - z in frame of points_cam_idx, inf if not seen by any camera
+    }
+    """
+    cameras_token = get_available_camera_tokens(nusc, sample_token)
+    if camera_channels is None:
+        camera_channels = list(cameras_token.keys())
+    assert all(channel in cameras_token for channel in camera_channels), \
+        f"cameras {set(camera_channels) - set(cameras_token)} not found in sample {sample_token}"
+    tokens = [cameras_token[channel] for channel in camera_channels]
+
+    points_rgb = np.zeros((points.shape[0], 3), dtype=np.uint8)
+    points_cam_idx = np.full(points.shape[0], -1, dtype=int)
+    if len(tokens) == 0:
+        return {'camera_channels': camera_channels, 'points_rgb': points_rgb, 'points_cam_idx': points_cam_idx,
+                'pixels_coord': np.zeros((points.shape[0], 2)), 'depth': np.full(points.shape[0], np.inf)}
+
+    images = [read_image(nusc, token, image_cache) for token in tokens]
+    camera_intrinsics = np.stack([get_camera_intrinsic(nusc, token) for token in tokens])  # (M, 3, 3)
+    cams_from_points = LA.inv(np.stack([get_tf_global_from_sensor(nusc, token) for token in tokens])) \
+        @ glob_from_points  # (M, 4, 4)
+    image_sizes = np.array([[image.shape[1], image.shape[0]] for image in images])  # (M, 2) - width, height
+
+    pixels_coord, depth, mask_valid = perspective_projection_batch(points, camera_intrinsics, cams_from_points,
+                                                                   image_sizes, min_depth)
+    # pick the closest camera among the ones seeing a point
+    depth = np.where(mask_valid, depth, np.inf)  # (M, N)
+    points_cam_idx = np.argmin(depth, axis=0)  # (N,)
+    points_range = np.arange(points.shape[0])
+    depth = depth[points_cam_idx, points_range]
+    pixels_coord = pixels_coord[points_cam_idx, points_range]  # (N, 2)
+    points_cam_idx[np.isinf(depth)] = -1
+
+    # gather colors, one camera at a time since images may have different sizes
+    pixels = np.floor(pixels_coord).astype(int)
+    for cam_idx, image in enumerate(images):
+        mask_cam = points_cam_idx == cam_idx
+        points_rgb[mask_cam] = image[pixels[mask_cam, 1], pixels[mask_cam, 0]]
+
+    return {'camera_channels': camera_channels, 'points_rgb': points_rgb, 'points_cam_idx': points_cam_idx,
+            'pixels_coord': pixels_coord, 'depth': depth}
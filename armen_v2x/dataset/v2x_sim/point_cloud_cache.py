@@ -0,0 +1,145 @@
+import os
+import os.path as osp
+import json
+import threading
+import uuid
+import numpy as np
+from collections import OrderedDict
+from typing import Union
+
+
+class PointCloudCache:
+    """
+    On-disk cache of filtered point clouds, keyed by LiDAR token & distance threshold.
+    Each point cloud is stored as a .npy shard and loaded back as a read-only memory map, so a hit costs no copy.
+    An index file keeps the shards' size, the mtime of their source file (to invalidate stale shards) and
+    their order of use (to evict the least recently used shards once the cache exceeds its size budget).
+    Note: the index is protected by a lock, so a cache can be shared by the threads of a process. Shards are written
+    outside the lock under unique names, so cold loads of several threads are not serialized. The index file is
+    rewritten once every flush_interval changes, call flush() once done to persist the remaining ones (shards missing
+    from the index file are removed when the cache is opened & simply recomputed). The index is not protected
+    against concurrent writes from several processes, use one cache directory per process.
+    """
+    INDEX_FILENAME = 'index.json'
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 8 * 1024 ** 3, flush_interval: int = 64):
+        """
+        :param cache_dir: directory storing shards & the index file, created if not exist
+        :param max_size_bytes: total size of shards above which the least recently used shards are evicted
+        :param flush_interval: number of changes of the index (i.e. puts & removals of stale shards) between two
+            writes of the index file
+        """
+        assert max_size_bytes > 0, f"max_size_bytes must be positive, get {max_size_bytes}"
+        assert flush_interval > 0, f"flush_interval must be positive, get {flush_interval}"
+        self.flush_interval = flush_interval
+        self._num_changes = 0  # since the last write of the index file
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        # {key: {filename, nbytes, source_mtime_ns, source_size}}, from least to most recently used
+        self.index = OrderedDict()
+        index_file = osp.join(cache_dir, self.INDEX_FILENAME)
+        if osp.isfile(index_file):
+            with open(index_file) as f:
+                self.index.update(json.load(f))
+        self.size_bytes = sum(entry['nbytes'] for entry in self.index.values())
+        # shards written after the last write of the index file are not in the index, remove them
+        indexed_files = {entry['filename'] for entry in self.index.values()}
+        for filename in os.listdir(cache_dir):
+            if filename.endswith('.npy') and filename not in indexed_files:
+                os.remove(osp.join(cache_dir, filename))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(lidar_token: str, thresh_dist_to_lidar: float) -> str:
+        return f"{lidar_token}_{float(thresh_dist_to_lidar)!r}"
+
+    def get(self, lidar_token: str, thresh_dist_to_lidar: float, source_file: str) -> Union[np.ndarray, None]:
+        """
+        Get a cached point cloud
+        :param lidar_token:
+        :param thresh_dist_to_lidar:
+        :param source_file: path to the .pcd.bin file the point cloud is read from
+        :return:
+            - point_cloud: (N, 4) - x, y, z, intensity | read-only memory map, None if not cached or stale
+        """
+        key = self.make_key(lidar_token, thresh_dist_to_lidar)
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+
+            stat = os.stat(source_file)
+            shard_file = osp.join(self.cache_dir, entry['filename'])
+            if entry['source_mtime_ns'] != stat.st_mtime_ns or entry['source_size'] != stat.st_size \
+                    or not osp.isfile(shard_file):
+                self._remove(key)
+                self._on_change()
+                return None
+
+            self.index.move_to_end(key)
+            return np.load(shard_file, mmap_mode='r')
+
+    def put(self, lidar_token: str, thresh_dist_to_lidar: float, source_file: str, points: np.ndarray) -> None:
+        """
+        Store a point cloud, then evict the least recently used point clouds until the cache fits its size budget
+        :param lidar_token:
+        :param thresh_dist_to_lidar:
+        :param source_file: path to the .pcd.bin file the point cloud is read from
+        :param points: (N, 4) - x, y, z, intensity
+        """
+        key = self.make_key(lidar_token, thresh_dist_to_lidar)
+        # the shard is written outside the lock under a name unique to this put, so removing the shard of another
+        # entry of the same key (e.g. evicted by a concurrent put) never removes this one. The shard is only
+        # visible to readers once its entry is in the index
+        filename = f"{key}.{uuid.uuid4().hex}.npy"
+        np.save(osp.join(self.cache_dir, filename), np.ascontiguousarray(points, dtype=np.float32))
+        stat = os.stat(source_file)
+        entry = {
+            'filename': filename,
+            'nbytes': os.path.getsize(osp.join(self.cache_dir, filename)),
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_size': stat.st_size
+        }
+
+        with self._lock:
+            if key in self.index:
+                self._remove(key)
+            self.index[key] = entry
+            self.size_bytes += entry['nbytes']
+
+            while self.size_bytes > self.max_size_bytes and len(self.index) > 1:
+                self._remove(next(iter(self.index)))
+            self._on_change()
+
+    def flush(self) -> None:
+        """
+        Write the index to disk, including the current order of use of shards
+        """
+        with self._lock:
+            self._write_index()
+
+    def _on_change(self) -> None:
+        self._num_changes += 1
+        if self._num_changes >= self.flush_interval:
+            self._write_index()
+
+    def _write_index(self) -> None:
+        self._num_changes = 0
+        index_file = osp.join(self.cache_dir, self.INDEX_FILENAME)
+        with open(f"{index_file}.tmp", 'w') as f:
+            json.dump(self.index, f)
+        os.replace(f"{index_file}.tmp", index_file)
+
+    def _remove(self, key: str) -> None:
+        entry = self.index.pop(key)
+        self.size_bytes -= entry['nbytes']
+        shard_file = osp.join(self.cache_dir, entry['filename'])
+        if osp.isfile(shard_file):
+            os.remove(shard_file)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
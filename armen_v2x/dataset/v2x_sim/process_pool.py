@@ -0,0 +1,33 @@
+from concurrent.futures import ProcessPoolExecutor
+from nuscenes import NuScenes
+from typing import Any, Callable, Union
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+
+
+_worker_nusc = None
+
+
+def _init_worker(nusc: Union[NuScenes, V2XSimIndex]) -> None:
+    # the dataset is sent once to each worker process instead of once per task
+    global _worker_nusc
+    _worker_nusc = nusc
+
+
+def make_process_pool(nusc: Union[NuScenes, V2XSimIndex], num_workers: int) -> ProcessPoolExecutor:
+    """
+    Make a pool of processes holding a copy of the dataset, tasks are submitted with run_in_worker
+    :param nusc: NuScenes API or V2XSimIndex, pickled once per worker
+    :param num_workers: number of worker processes
+    :return: process pool
+    """
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(nusc,))
+
+
+def run_in_worker(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Call fn with the dataset of the worker process as first argument, e.g.
+    executor.submit(run_in_worker, prepare_sample, sample_token, ...)
+    :param fn: module-level function (i.e. picklable) taking a NuScenes API or V2XSimIndex as first argument
+    :return: fn(nusc, *args, **kwargs)
+    """
+    return fn(_worker_nusc, *args, **kwargs)
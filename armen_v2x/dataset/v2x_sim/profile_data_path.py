@@ -0,0 +1,66 @@
+import argparse
+import numpy as np
+from armen_v2x.utils.bev import BEVRasterizer
+from armen_v2x.utils.profiling import PROFILER
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.v2x_sim_dataset import prepare_sample
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+
+
+def profile_data_path(index: V2XSimIndex, ref_sensor_name: str, thresh_dist_to_lidar: float, num_samples: int,
+                      point_cloud_range: np.ndarray, resolution: float) -> None:
+    """
+    Prepare the first num_samples samples having ref_sensor_name (see prepare_sample) & rasterize them to BEV,
+    with PROFILER enabled. Measurements are accumulated in PROFILER
+    :param index: V2X-Sim index
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param num_samples:
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max of BEV images
+    :param resolution: size of a BEV pixel measured by meter
+    """
+    rasterizer = BEVRasterizer(point_cloud_range, resolution, num_sources=index.num_lidars)
+    PROFILER.enable()
+    n_done = 0
+    for scene_token in index.scene_token.tolist():
+        if n_done == num_samples:
+            break
+        with PROFILER.stage('scene_transform_table'):
+            tf_table = SceneTransformTable(index, scene_token, ref_sensor_name)
+        for sample_token in tf_table.ref_sample_tokens:
+            if n_done == num_samples:
+                break
+            with PROFILER.stage('sample'):
+                with PROFILER.stage('prepare_sample') as stage:
+                    sample = prepare_sample(index, sample_token, ref_sensor_name, thresh_dist_to_lidar,
+                                            tf_table=tf_table)
+                    stage.add_allocated(*[value for value in sample.values() if isinstance(value, np.ndarray)])
+                rasterizer(sample['points'], sample['points_src_idx'])
+            n_done += 1
+    PROFILER.disable()
+    print(f"profiled {n_done} samples")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='profile the data path over samples of a V2X-Sim split')
+    parser.add_argument('--dataroot', type=str, default='../data/v2x-sim')
+    parser.add_argument('--version', type=str, default='v1.0-mini')
+    parser.add_argument('--index', type=str, default=None, help='default: dataroot/version/index.npz, built if '
+                                                                 'not exist')
+    parser.add_argument('--ref_sensor_name', type=str, default='LIDAR_TOP_id_1')
+    parser.add_argument('--thresh_dist_to_lidar', type=float, default=2.0)
+    parser.add_argument('--num_samples', type=int, default=100)
+    parser.add_argument('--point_cloud_range', type=float, nargs=6, default=[-51.2, -51.2, -8.0, 51.2, 51.2, 0.0])
+    parser.add_argument('--resolution', type=float, default=0.2)
+    parser.add_argument('--out_json', type=str, default=None, help='file to save the summary & histograms to')
+    parser.add_argument('--out_csv', type=str, default=None, help='file to save the summary to')
+    args = parser.parse_args()
+
+    v2x_index = V2XSimIndex.load_or_build(args.index, args.dataroot, args.version)
+    profile_data_path(v2x_index, args.ref_sensor_name, args.thresh_dist_to_lidar, args.num_samples,
+                      np.array(args.point_cloud_range), args.resolution)
+    PROFILER.print_summary()
+    if args.out_json is not None:
+        PROFILER.save_json(args.out_json)
+    if args.out_csv is not None:
+        PROFILER.save_csv(args.out_csv)
@@ -0,0 +1,96 @@
+import argparse
+import numpy as np
+from nuscenes import NuScenes
+from typing import Union
+from armen_v2x.utils.geometry import apply_tf
+from armen_v2x.utils.occupancy_map import TiledBEVMap
+from armen_v2x.dataset.v2x_sim.v2x_sim_utils import get_point_cloud, get_tf_global_from_sensor, \
+    get_available_lidar_tokens
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.point_cloud_cache import PointCloudCache
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+
+
+def get_global_point_cloud(nusc: Union[NuScenes, V2XSimIndex], sample_token: str, thresh_dist_to_lidar: float,
+                           cache: PointCloudCache = None, tf_table: SceneTransformTable = None) -> np.ndarray:
+    """
+    Get point clouds of every LiDAR available @ the inputted sample, mapped to global frame in a single buffer
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sample_token:
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param cache: on-disk cache of filtered point clouds, see get_point_cloud
+    :param tf_table: transformations of the scene this sample belongs to. If None, transformations are computed
+        from nusc
+    :return: (N_tot, 3) - x, y, z in global frame
+    """
+    lidar_tokens = list(get_available_lidar_tokens(nusc, sample_token).values())
+    if tf_table is not None:
+        glob_from_sensors = np.stack([tf_table.get_global_from_sensor(token) for token in lidar_tokens])
+    else:
+        glob_from_sensors = np.stack([get_tf_global_from_sensor(nusc, token) for token in lidar_tokens])
+    points_list = [get_point_cloud(nusc, token, thresh_dist_to_lidar, cache) for token in lidar_tokens]
+    offsets = np.cumsum([0] + [points.shape[0] for points in points_list])
+    points = np.concatenate([points[:, :3] for points in points_list])
+    return apply_tf(glob_from_sensors, points, out=np.empty_like(points), offsets=offsets)
+
+
+def build_scene_map(nusc: Union[NuScenes, V2XSimIndex], scene_token: str, thresh_dist_to_lidar: float,
+                    resolution: float = 0.2, tile_size: int = 256, z_range: tuple = (-np.inf, np.inf),
+                    cache: PointCloudCache = None, bev_map: TiledBEVMap = None) -> TiledBEVMap:
+    """
+    Accumulate the point clouds of every sample of a scene into a global-frame BEV map, one update per sample
+    (i.e. the hits channel counts samples, not LiDARs)
+    :param nusc: NuScenes API or V2XSimIndex
+    :param scene_token:
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param resolution: size of a map's pixel measured by meter. Ignored if bev_map is provided
+    :param tile_size: see TiledBEVMap. Ignored if bev_map is provided
+    :param z_range: see TiledBEVMap. Ignored if bev_map is provided
+    :param cache: on-disk cache of filtered point clouds, see get_point_cloud
+    :param bev_map: map to update, e.g. to resume the accumulation. Default: a new map
+    :return: the map
+    """
+    if bev_map is None:
+        bev_map = TiledBEVMap(resolution, tile_size, z_range)
+    tf_table = SceneTransformTable(nusc, scene_token)
+    for sample_token in tf_table.sample_tokens:
+        bev_map.update(get_global_point_cloud(nusc, sample_token, thresh_dist_to_lidar, cache, tf_table))
+    return bev_map
+
+
+def get_local_map(bev_map: TiledBEVMap, nusc: Union[NuScenes, V2XSimIndex], sensor_token: str,
+                  half_extent: float, tf_table: SceneTransformTable = None) -> np.ndarray:
+    """
+    Crop a global-frame map around the position of a sensor (e.g. LIDAR_TOP of an ego vehicle), see TiledBEVMap.crop.
+    The crop is aligned with global axes, not rotated by the heading of the sensor
+    :param bev_map: map in global frame
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sensor_token: sample data token
+    :param half_extent: half of the crop's side, in meter
+    :param tf_table: transformations of the scene this sensor belongs to. If None, computed from nusc
+    :return: (n_channels, S, S)
+    """
+    if tf_table is not None:
+        glob_from_sensor = tf_table.get_global_from_sensor(sensor_token)
+    else:
+        glob_from_sensor = get_tf_global_from_sensor(nusc, sensor_token)
+    return bev_map.crop(glob_from_sensor[:2, -1], half_extent)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='accumulate the point clouds of a V2X-Sim scene into a BEV map')
+    parser.add_argument('--dataroot', type=str, default='../data/v2x-sim')
+    parser.add_argument('--version', type=str, default='v1.0-mini')
+    parser.add_argument('--index', type=str, default=None, help='default: dataroot/version/index.npz, built if '
+                                                                 'not exist')
+    parser.add_argument('--scene_idx', type=int, default=0)
+    parser.add_argument('--thresh_dist_to_lidar', type=float, default=2.0)
+    parser.add_argument('--resolution', type=float, default=0.2)
+    parser.add_argument('--tile_size', type=int, default=256)
+    parser.add_argument('--z_range', type=float, nargs=2, default=[-np.inf, np.inf])
+    args = parser.parse_args()
+
+    v2x_index = V2XSimIndex.load_or_build(args.index, args.dataroot, args.version)
+    scene_map = build_scene_map(v2x_index, str(v2x_index.scene_token[args.scene_idx]), args.thresh_dist_to_lidar,
+                                args.resolution, args.tile_size, tuple(args.z_range))
+    print(f"{scene_map.num_updates} samples, {len(scene_map.tiles)} tiles, {scene_map.nbytes / 2 ** 20:.1f} MiB")
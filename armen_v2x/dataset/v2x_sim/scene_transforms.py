@@ -0,0 +1,113 @@
+import numpy as np
+import numpy.linalg as LA
+from nuscenes import NuScenes
+from typing import Dict, List, Union
+from armen_v2x.utils.geometry import make_tf
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+
+
+class SceneTransformTable:
+    """
+    Transformations of every sensor (LiDARs & cameras) of every sample of a scene, computed at once with a batched
+    make_tf. Looking up global <- sensor or ref <- sensor of a sample data is then an array indexing instead of
+    several record walks & quaternion conversions.
+    The reference sensor of a sample data is the sensor named ref_sensor_name of the same sample. Rows of samples
+    where the reference sensor is not available are filled with NaN.
+    """
+
+    def __init__(self, nusc: Union[NuScenes, V2XSimIndex], scene_token: str, ref_sensor_name: str = None):
+        """
+        :param nusc: NuScenes API or V2XSimIndex
+        :param scene_token:
+        :param ref_sensor_name: name of the sensor chosen to be reference frame (e.g., LIDAR_TOP_id_1).
+            If None, only global <- sensor is computed
+        """
+        self.scene_token = scene_token
+        self.ref_sensor_name = ref_sensor_name
+        sample_tokens, channels, sd_tokens, sd_sample_idx = [], [], [], []
+        if isinstance(nusc, V2XSimIndex):
+            sample_idx = nusc.scene_first_sample_idx[nusc.scene_token.tolist().index(scene_token)]
+            rows = []
+            while sample_idx > -1:
+                sd_indices = nusc.get_sample_data_indices(nusc.sample_token[sample_idx])
+                sd_sample_idx.extend([len(sample_tokens)] * sd_indices.shape[0])
+                sample_tokens.append(str(nusc.sample_token[sample_idx]))
+                rows.append(sd_indices)
+                sample_idx = nusc.sample_next_idx[sample_idx]
+            rows = np.concatenate(rows)
+            channels, sd_tokens = nusc.sd_channel[rows].tolist(), nusc.sd_token[rows].tolist()
+            calib_translation, calib_rotation = nusc.sd_calib_translation[rows], nusc.sd_calib_rotation[rows]
+            ego_translation, ego_rotation = nusc.sd_ego_translation[rows], nusc.sd_ego_rotation[rows]
+        else:
+            calib_translation, calib_rotation, ego_translation, ego_rotation = [], [], [], []
+            sample_token = nusc.get('scene', scene_token)['first_sample_token']
+            while sample_token != '':
+                sample_rec = nusc.get('sample', sample_token)
+                for channel, sd_token in sample_rec['data'].items():
+                    sd_rec = nusc.get('sample_data', sd_token)
+                    calib_rec = nusc.get('calibrated_sensor', sd_rec['calibrated_sensor_token'])
+                    ego_rec = nusc.get('ego_pose', sd_rec['ego_pose_token'])
+                    calib_translation.append(calib_rec['translation'])
+                    calib_rotation.append(calib_rec['rotation'])
+                    ego_translation.append(ego_rec['translation'])
+                    ego_rotation.append(ego_rec['rotation'])
+                    channels.append(channel)
+                    sd_tokens.append(sd_token)
+                    sd_sample_idx.append(len(sample_tokens))
+                sample_tokens.append(sample_token)
+                sample_token = sample_rec['next']
+            calib_translation, calib_rotation = np.array(calib_translation), np.array(calib_rotation)
+            ego_translation, ego_rotation = np.array(ego_translation), np.array(ego_rotation)
+
+        self.sample_tokens: List[str] = sample_tokens
+        self.channels: List[str] = channels
+        self.sd_sample_idx = np.array(sd_sample_idx, dtype=np.int64)  # (K,)
+        self._sd_token_to_idx: Dict[str, int] = dict(zip(sd_tokens, range(len(sd_tokens))))
+
+        # (K, 4, 4)
+        self.global_from_sensor = make_tf(ego_translation, ego_rotation) @ make_tf(calib_translation, calib_rotation)
+
+        self.ref_from_sensor = None
+        self.sample_has_ref = None  # (N_samples,) - True for samples where the reference sensor is available
+        if ref_sensor_name is not None:
+            # (N_samples,) - row of the reference sensor of each sample, -1 if not available
+            ref_idx = -np.ones(len(sample_tokens), dtype=np.int64)
+            for idx, (channel, sample_idx) in enumerate(zip(channels, self.sd_sample_idx)):
+                if channel == ref_sensor_name:
+                    ref_idx[sample_idx] = idx
+            ref_from_global = np.full((len(sample_tokens), 4, 4), np.nan)
+            self.sample_has_ref = mask_has_ref = ref_idx > -1
+            ref_from_global[mask_has_ref] = LA.inv(self.global_from_sensor[ref_idx[mask_has_ref]])
+            self.ref_from_sensor = ref_from_global[self.sd_sample_idx] @ self.global_from_sensor  # (K, 4, 4)
+
+    def __len__(self) -> int:
+        return len(self._sd_token_to_idx)
+
+    def __contains__(self, sensor_token: str) -> bool:
+        return sensor_token in self._sd_token_to_idx
+
+    @property
+    def ref_sample_tokens(self) -> List[str]:
+        """
+        :return: tokens of samples where the reference sensor is available, i.e. samples that can be expressed in
+            its frame, in order
+        """
+        assert self.sample_has_ref is not None, "ref_sensor_name was not provided"
+        return [token for token, has_ref in zip(self.sample_tokens, self.sample_has_ref.tolist()) if has_ref]
+
+    def get_global_from_sensor(self, sensor_token: str) -> np.ndarray:
+        """
+        :param sensor_token: sample data token
+        :return:
+            - glob_from_sensor: (4, 4)
+        """
+        return self.global_from_sensor[self._sd_token_to_idx[sensor_token]]
+
+    def get_ref_from_sensor(self, sensor_token: str) -> np.ndarray:
+        """
+        :param sensor_token: sample data token
+        :return:
+            - ref_from_sensor: (4, 4) - filled with NaN if the reference sensor is not available @ this sample
+        """
+        assert self.ref_from_sensor is not None, "ref_sensor_name was not provided"
+        return self.ref_from_sensor[self._sd_token_to_idx[sensor_token]]
@@ -0,0 +1,106 @@
+import threading
+import numpy as np
+import numpy.linalg as LA
+from nuscenes import NuScenes
+from collections import OrderedDict
+from typing import List, Tuple, Union
+from armen_v2x.utils.geometry import apply_tf
+from armen_v2x.dataset.v2x_sim.v2x_sim_utils import get_point_cloud, get_tf_global_from_sensor
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.point_cloud_cache import PointCloudCache
+
+
+class SweepAccumulator:
+    """
+    Accumulate the last num_sweeps sweeps of a LiDAR, following prev links, & compensate the ego motion by mapping
+    them to the frame of the latest sweep. A time lag channel is appended to points.
+    Loaded sweeps are kept with their global <- sensor transformation in a bounded LRU buffer, so that consecutive
+    samples, which share num_sweeps - 1 sweeps, only load their new sweep. Access to the buffer is serialized by
+    a lock, so an accumulator can be used by the threads of get_available_point_clouds.
+    """
+
+    def __init__(self, nusc: Union[NuScenes, V2XSimIndex], num_sweeps: int, thresh_dist_to_lidar: float,
+                 max_buffered_sweeps: int = 64, cache: PointCloudCache = None):
+        """
+        :param nusc: NuScenes API or V2XSimIndex
+        :param num_sweeps: number of sweeps accumulated, including the latest one
+        :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+        :param max_buffered_sweeps: number of sweeps kept in memory. To share I/O between consecutive samples, it
+            should be at least num_sweeps x number of LiDARs read per sample
+        :param cache: on-disk cache of filtered point clouds, see get_point_cloud
+        """
+        assert num_sweeps > 0, f"num_sweeps must be positive, get {num_sweeps}"
+        assert max_buffered_sweeps > 0, f"max_buffered_sweeps must be positive, get {max_buffered_sweeps}"
+        self.nusc = nusc
+        self.num_sweeps = num_sweeps
+        self.thresh_dist_to_lidar = thresh_dist_to_lidar
+        self.max_buffered_sweeps = max_buffered_sweeps
+        self.cache = cache
+        # {lidar_token: (points, glob_from_sensor)}, from least to most recently used
+        self.buffer = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_loads = 0  # number of sweeps read from disk (or from cache), i.e. not found in buffer
+
+    def get_sweep_tokens(self, lidar_token: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Get tokens of the latest num_sweeps sweeps of a LiDAR, fewer if the sequence starts earlier
+        :param lidar_token: sample data token of the latest sweep
+        :return:
+            - tokens: [lidar_token, prev of lidar_token, ...]
+            - timestamps: (num_sweeps,) - in micro second
+        """
+        tokens, timestamps = [], []
+        if isinstance(self.nusc, V2XSimIndex):
+            sd_idx = self.nusc.sample_data_idx(lidar_token)
+            while sd_idx > -1 and len(tokens) < self.num_sweeps:
+                tokens.append(str(self.nusc.sd_token[sd_idx]))
+                timestamps.append(self.nusc.sd_timestamp[sd_idx])
+                sd_idx = self.nusc.sd_prev_idx[sd_idx]
+        else:
+            token = lidar_token
+            while token != '' and len(tokens) < self.num_sweeps:
+                sd_record = self.nusc.get('sample_data', token)
+                tokens.append(token)
+                timestamps.append(sd_record['timestamp'])
+                token = sd_record['prev']
+        return tokens, np.array(timestamps, dtype=np.int64)
+
+    def _get_sweep(self, lidar_token: str) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if lidar_token in self.buffer:
+                self.buffer.move_to_end(lidar_token)
+                return self.buffer[lidar_token]
+
+        # read outside the lock, so that several LiDARs are read concurrently
+        sweep = (get_point_cloud(self.nusc, lidar_token, self.thresh_dist_to_lidar, self.cache),
+                 get_tf_global_from_sensor(self.nusc, lidar_token))
+        with self._lock:
+            self.num_loads += 1
+            self.buffer[lidar_token] = sweep
+            while len(self.buffer) > self.max_buffered_sweeps:
+                self.buffer.popitem(last=False)
+        return sweep
+
+    def __call__(self, lidar_token: str) -> np.ndarray:
+        """
+        Get the accumulated sweeps of a LiDAR
+        :param lidar_token: sample data token of the latest sweep
+        :return:
+            - points: (N, 5) - x, y, z, intensity, time lag (in second, 0 for the latest sweep) | in the frame of
+                lidar_token
+        """
+        tokens, timestamps = self.get_sweep_tokens(lidar_token)
+        sweeps = [self._get_sweep(token) for token in tokens]
+        sensor_from_glob = LA.inv(sweeps[0][1])
+
+        offsets = np.cumsum([0] + [points.shape[0] for points, _ in sweeps])
+        out = np.empty((offsets[-1], 5), dtype=np.float32)
+        for i, (points, glob_from_sweep) in enumerate(sweeps):
+            segment = out[offsets[i]: offsets[i + 1]]
+            if i == 0:
+                segment[:, :3] = points[:, :3]
+            else:
+                apply_tf(sensor_from_glob @ glob_from_sweep, points, out=segment[:, :3])
+            segment[:, 3] = points[:, 3]
+            segment[:, 4] = (timestamps[0] - timestamps[i]) * 1e-6
+        return out
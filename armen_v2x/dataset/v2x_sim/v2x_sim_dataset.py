@@ -0,0 +1,156 @@
+import numpy as np
+from nuscenes import NuScenes
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Union
+from armen_v2x.utils.geometry import find_points_in_boxes, relabel_kept_boxes
+from armen_v2x.utils.profiling import PROFILER
+from armen_v2x.dataset.v2x_sim.v2x_sim_utils import get_available_point_clouds, get_available_lidar_tokens, \
+    get_annotated_boxes_in_sensor_frame
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.point_cloud_cache import PointCloudCache
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
+from armen_v2x.dataset.v2x_sim.process_pool import make_process_pool, run_in_worker
+
+
+def prepare_sample(nusc: Union[NuScenes, V2XSimIndex], sample_token: str, ref_sensor_name: str,
+                   thresh_dist_to_lidar: float, cache: PointCloudCache = None,
+                   tf_table: SceneTransformTable = None,
+                   min_points_per_box: int = None) -> Dict[str, Union[str, np.ndarray]]:
+    """
+    Get everything needed to train on a sample, expressed in the frame of ref_sensor_name
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sample_token:
+    :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+    :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param cache: on-disk cache of filtered point clouds, see get_point_cloud
+    :param tf_table: transformations of the scene this sample belongs to, see get_available_point_clouds
+    :param min_points_per_box: if provided, empty boxes are found by counting the points of the merged point cloud
+        inside them instead of looking up num_lidar_pts of annotations, & boxes having fewer points are removed
+    :return: {
+        sample_token: str,
+        points: (N, 3[+C]) - x, y, z, C-dim feat | merged point cloud
+        points_src_idx: (N,) - points_src_idx[i] = j means points[i] is collected by LIDAR_TOP_id_{j}
+        boxes: (B, 8) - center_x, center_y, center_z, dx, dy, dz, yaw, class_index
+        points_cls: (N,) - class index of the box points[i] is in, -1 for background points
+        points_box_idx: (N,) - index of the box points[i] is in, -1 for background points
+    }
+    """
+    points, points_src_idx = get_available_point_clouds(nusc, sample_token, ref_sensor_name, thresh_dist_to_lidar,
+                                                        cache=cache, tf_table=tf_table)
+    ref_sensor_token = get_available_lidar_tokens(nusc, sample_token)[ref_sensor_name]
+    boxes = get_annotated_boxes_in_sensor_frame(nusc, ref_sensor_token, tf_table=tf_table,
+                                                filter_empty=min_points_per_box is None)
+
+    points_cls = -np.ones(points.shape[0], dtype=int)
+    boxes_to_points = -np.ones(points.shape[0], dtype=np.int32)
+    if boxes.shape[0] > 0:
+        with PROFILER.stage('find_points_in_boxes') as stage:
+            if min_points_per_box is None:
+                boxes_to_points = find_points_in_boxes(points, boxes[:, :7])
+            else:
+                # points inside several boxes count in each of them, so that a box is not found empty because its
+                # points are labelled with another box
+                boxes_to_points, num_points_in_boxes, _, boxes_points_idx = find_points_in_boxes(
+                    points, boxes[:, :7], return_counts=True, overlap='all', return_indices=True)
+            stage.add_allocated(boxes_to_points)
+        if min_points_per_box is not None:
+            mask_kept = num_points_in_boxes >= min_points_per_box
+            if not np.all(mask_kept):
+                boxes_to_points = relabel_kept_boxes(points.shape[0], num_points_in_boxes, boxes_points_idx,
+                                                     mask_kept)
+                boxes = boxes[mask_kept]
+        mask_fg = boxes_to_points > -1
+        points_cls[mask_fg] = boxes[boxes_to_points[mask_fg], 7].astype(int)
+    return {
+        'sample_token': sample_token,
+        'points': points,
+        'points_src_idx': points_src_idx,
+        'boxes': boxes,
+        'points_cls': points_cls,
+        'points_box_idx': boxes_to_points
+    }
+
+
+class V2XSimIterator:
+    """
+    Iterate over the samples of V2X-Sim scenes & yield them fully prepared (see prepare_sample).
+    Up to num_prefetch samples are prepared ahead by a pool of threads or processes while the consumer works on the
+    current one. Samples are yielded in the order of scenes & of samples inside a scene regardless of the order they
+    are done in, and at most num_prefetch prepared samples are held in memory besides the one being consumed.
+    """
+
+    def __init__(self, nusc: Union[NuScenes, V2XSimIndex], ref_sensor_name: str, thresh_dist_to_lidar: float,
+                 scene_tokens: List[str] = None, num_prefetch: int = 4, num_workers: int = 2,
+                 use_processes: bool = False, cache: PointCloudCache = None):
+        """
+        :param nusc: NuScenes API or V2XSimIndex
+        :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
+        :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+        :param scene_tokens: scenes to iterate over. Default: every scene. Samples where ref_sensor_name is not
+            available are skipped
+        :param num_prefetch: max number of samples being prepared or waiting to be consumed
+        :param num_workers: number of threads (or processes) preparing samples
+        :param use_processes: to prepare samples in worker processes instead of threads. nusc is pickled once per
+            worker
+        :param cache: on-disk cache of filtered point clouds. Not supported with worker processes
+        """
+        assert num_prefetch > 0, f"num_prefetch must be positive, get {num_prefetch}"
+        assert num_workers > 0, f"num_workers must be positive, get {num_workers}"
+        assert not (use_processes and cache is not None), "a PointCloudCache can't be shared by worker processes"
+        self.nusc = nusc
+        self.ref_sensor_name = ref_sensor_name
+        self.thresh_dist_to_lidar = thresh_dist_to_lidar
+        self.num_prefetch = num_prefetch
+        self.num_workers = num_workers
+        self.use_processes = use_processes
+        self.cache = cache
+
+        if scene_tokens is None:
+            if isinstance(nusc, V2XSimIndex):
+                scene_tokens = nusc.scene_token.tolist()
+            else:
+                scene_tokens = [scene['token'] for scene in nusc.scene]
+        self.scene_tokens = scene_tokens
+
+        # [(scene_token, sample_token)] in order of iteration, skipping samples where ref_sensor_name is not available
+        self.samples = []
+        for scene_token in scene_tokens:
+            tf_table = SceneTransformTable(nusc, scene_token, ref_sensor_name)
+            self.samples.extend((scene_token, sample_token) for sample_token in tf_table.ref_sample_tokens)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def _make_executor(self) -> Executor:
+        if self.use_processes:
+            return make_process_pool(self.nusc, self.num_workers)
+        return ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def __iter__(self) -> Iterator[Dict[str, Union[str, np.ndarray]]]:
+        # samples are ordered by scene, so only the table of the scene being submitted is kept here. Tables of
+        # previous scenes live as long as the pending samples referring to them
+        tf_table = None
+
+        with self._make_executor() as executor:
+            pending = deque()  # futures, in order of submission
+            next_idx = 0
+            try:
+                while next_idx < len(self.samples) or len(pending) > 0:
+                    while next_idx < len(self.samples) and len(pending) < self.num_prefetch:
+                        scene_token, sample_token = self.samples[next_idx]
+                        if tf_table is None or tf_table.scene_token != scene_token:
+                            tf_table = SceneTransformTable(self.nusc, scene_token, self.ref_sensor_name)
+                        args = (sample_token, self.ref_sensor_name, self.thresh_dist_to_lidar)
+                        if self.use_processes:
+                            pending.append(executor.submit(run_in_worker, prepare_sample, *args, tf_table=tf_table))
+                        else:
+                            pending.append(executor.submit(prepare_sample, self.nusc, *args, cache=self.cache,
+                                                           tf_table=tf_table))
+                        next_idx += 1
+
+                    yield pending.popleft().result()
+            finally:
+                # the consumer stopped early, don't wait for samples nobody will consume
+                for future in pending:
+                    future.cancel()
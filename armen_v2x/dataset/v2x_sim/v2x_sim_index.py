@@ -0,0 +1,193 @@
+import argparse
+import json
+import os.path as osp
+import numpy as np
+from typing import Dict, List
+from armen_v2x.utils.geometry import quaternions_yaw
+
+
+class V2XSimIndex:
+    """
+    Compact, columnar index of the V2X-Sim metadata, built once from the JSON tables & saved to a single .npz file.
+    It stores as NumPy arrays what v2x_sim_utils needs: sample -> sample_data (channel, file, calibrated_sensor &
+    ego_pose rows) & sample -> annotations, so that loading it takes milliseconds instead of parsing every JSON table
+    like NuScenes does. Tokens are mapped to rows by dictionaries built on first use.
+    Links between records (prev, next, sample of a sample_data, ...) are stored as row indices, -1 meaning no record.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], dataroot: str):
+        """
+        :param arrays: columns of the index, see V2XSimIndex.build
+        :param dataroot: path to the dataset's root, used to resolve sample_data's filename
+        """
+        self.dataroot = dataroot
+        self.arrays = arrays
+        for name, arr in arrays.items():
+            setattr(self, name, arr)
+        self._sample_token_to_idx = None
+        self._sample_data_token_to_idx = None
+
+    @classmethod
+    def build(cls, dataroot: str, version: str) -> 'V2XSimIndex':
+        """
+        Build the index from the JSON tables stored in dataroot/version
+        :param dataroot: path to the dataset's root (e.g. ../data/v2x-sim)
+        :param version: name of the split (e.g. v1.0-mini)
+        """
+        def load_table(name: str) -> List[dict]:
+            with open(osp.join(dataroot, version, f"{name}.json")) as f:
+                return json.load(f)
+
+        def to_row_idx(tokens: List[str], token_to_idx: Dict[str, int]) -> np.ndarray:
+            return np.array([token_to_idx.get(token, -1) for token in tokens], dtype=np.int64)
+
+        scenes = load_table('scene')
+        samples = load_table('sample')
+        sample_datas = load_table('sample_data')
+        annos = load_table('sample_annotation')
+        sensors = {rec['token']: rec for rec in load_table('sensor')}
+        calibs = {rec['token']: rec for rec in load_table('calibrated_sensor')}
+        ego_poses = {rec['token']: rec for rec in load_table('ego_pose')}
+        categories = {rec['token']: rec['name'] for rec in load_table('category')}
+        instance_to_category = {rec['token']: categories[rec['category_token']] for rec in load_table('instance')}
+
+        sample_token_to_idx = {rec['token']: idx for idx, rec in enumerate(samples)}
+        sd_token_to_idx = {rec['token']: idx for idx, rec in enumerate(sample_datas)}
+        scene_token_to_idx = {rec['token']: idx for idx, rec in enumerate(scenes)}
+
+        arrays = dict()
+        # scene
+        arrays['scene_token'] = np.array([rec['token'] for rec in scenes])
+        arrays['scene_name'] = np.array([rec['name'] for rec in scenes])
+        arrays['scene_first_sample_idx'] = to_row_idx([rec['first_sample_token'] for rec in scenes],
+                                                      sample_token_to_idx)
+
+        # sample
+        arrays['sample_token'] = np.array([rec['token'] for rec in samples])
+        arrays['sample_timestamp'] = np.array([rec['timestamp'] for rec in samples], dtype=np.int64)
+        arrays['sample_scene_idx'] = to_row_idx([rec['scene_token'] for rec in samples], scene_token_to_idx)
+        arrays['sample_prev_idx'] = to_row_idx([rec['prev'] for rec in samples], sample_token_to_idx)
+        arrays['sample_next_idx'] = to_row_idx([rec['next'] for rec in samples], sample_token_to_idx)
+
+        # sample_data, joined with calibrated_sensor, sensor & ego_pose
+        calib_recs = [calibs[rec['calibrated_sensor_token']] for rec in sample_datas]
+        ego_recs = [ego_poses[rec['ego_pose_token']] for rec in sample_datas]
+        arrays['sd_token'] = np.array([rec['token'] for rec in sample_datas])
+        arrays['sd_sample_idx'] = to_row_idx([rec['sample_token'] for rec in sample_datas], sample_token_to_idx)
+        arrays['sd_channel'] = np.array([sensors[rec['sensor_token']]['channel'] for rec in calib_recs])
+        arrays['sd_filename'] = np.array([rec['filename'] for rec in sample_datas])
+        arrays['sd_timestamp'] = np.array([rec['timestamp'] for rec in sample_datas], dtype=np.int64)
+        arrays['sd_is_key_frame'] = np.array([rec['is_key_frame'] for rec in sample_datas], dtype=bool)
+        arrays['sd_prev_idx'] = to_row_idx([rec['prev'] for rec in sample_datas], sd_token_to_idx)
+        arrays['sd_next_idx'] = to_row_idx([rec['next'] for rec in sample_datas], sd_token_to_idx)
+        arrays['sd_calib_translation'] = np.array([rec['translation'] for rec in calib_recs], dtype=float)
+        arrays['sd_calib_rotation'] = np.array([rec['rotation'] for rec in calib_recs], dtype=float)
+        arrays['sd_camera_intrinsic'] = np.array([rec['camera_intrinsic'] if len(rec['camera_intrinsic']) > 0
+                                                  else np.zeros((3, 3)) for rec in calib_recs], dtype=float)
+        arrays['sd_ego_translation'] = np.array([rec['translation'] for rec in ego_recs], dtype=float)
+        arrays['sd_ego_rotation'] = np.array([rec['rotation'] for rec in ego_recs], dtype=float)
+
+        # sample -> key frames' sample_data, CSR-style: sample i owns sample_sd_idx[offsets[i]: offsets[i + 1]]
+        key_sd_idx = np.flatnonzero(arrays['sd_is_key_frame'])
+        key_sd_idx = key_sd_idx[np.argsort(arrays['sd_sample_idx'][key_sd_idx], kind='stable')]
+        arrays['sample_sd_idx'] = key_sd_idx
+        arrays['sample_sd_offsets'] = np.searchsorted(arrays['sd_sample_idx'][key_sd_idx], np.arange(len(samples) + 1))
+
+        # sample_annotation, sorted by sample so that annotations of a sample are contiguous
+        annos = sorted(annos, key=lambda rec: sample_token_to_idx[rec['sample_token']])
+        arrays['ann_token'] = np.array([rec['token'] for rec in annos])
+        arrays['ann_sample_idx'] = to_row_idx([rec['sample_token'] for rec in annos], sample_token_to_idx)
+        arrays['ann_category'] = np.array([instance_to_category[rec['instance_token']] for rec in annos])
+        arrays['ann_translation'] = np.array([rec['translation'] for rec in annos], dtype=float).reshape(-1, 3)
+        arrays['ann_size'] = np.array([rec['size'] for rec in annos], dtype=float).reshape(-1, 3)  # w, l, h
+        arrays['ann_rotation'] = np.array([rec['rotation'] for rec in annos], dtype=float).reshape(-1, 4)
+        arrays['ann_yaw'] = quaternions_yaw(arrays['ann_rotation'])
+        # in V2X-Sim, num_lidar_pts is a list holding the number of points collected by every agent
+        arrays['ann_num_lidar_pts'] = np.array([max(np.atleast_1d(rec['num_lidar_pts']), default=0)
+                                                for rec in annos], dtype=np.int64)
+        arrays['sample_ann_offsets'] = np.searchsorted(arrays['ann_sample_idx'], np.arange(len(samples) + 1))
+
+        return cls(arrays, dataroot)
+
+    def save(self, path: str) -> None:
+        np.savez(path, **self.arrays)
+
+    @classmethod
+    def load(cls, path: str, dataroot: str) -> 'V2XSimIndex':
+        """
+        :param path: path to a .npz file produced by V2XSimIndex.save
+        :param dataroot: path to the dataset's root
+        """
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        return cls(arrays, dataroot)
+
+    @staticmethod
+    def default_path(dataroot: str, version: str) -> str:
+        return osp.join(dataroot, version, 'index.npz')
+
+    @classmethod
+    def load_or_build(cls, path: str, dataroot: str, version: str) -> 'V2XSimIndex':
+        """
+        Load the index if it is saved, otherwise build it & save it to path for the next run
+        :param path: path to a .npz file produced by V2XSimIndex.save. If None, dataroot/version/index.npz
+        :param dataroot: path to the dataset's root
+        :param version: name of the split (e.g. v1.0-mini)
+        """
+        if path is None:
+            path = cls.default_path(dataroot, version)
+        if osp.isfile(path):
+            return cls.load(path, dataroot)
+        index = cls.build(dataroot, version)
+        index.save(path)
+        return index
+
+    @property
+    def num_lidars(self) -> int:
+        """
+        :return: 1 + the largest j of LIDAR_TOP_id_j, i.e. the number of agents' LiDARs
+        """
+        return 1 + max(int(channel.split('_')[-1]) for channel in set(self.sd_channel.tolist())
+                       if 'LIDAR_TOP' in channel and 'SEM' not in channel)
+
+    def sample_idx(self, sample_token: str) -> int:
+        if self._sample_token_to_idx is None:
+            self._sample_token_to_idx = dict(zip(self.sample_token.tolist(), range(self.sample_token.shape[0])))
+        return self._sample_token_to_idx[sample_token]
+
+    def sample_data_idx(self, sample_data_token: str) -> int:
+        if self._sample_data_token_to_idx is None:
+            self._sample_data_token_to_idx = dict(zip(self.sd_token.tolist(), range(self.sd_token.shape[0])))
+        return self._sample_data_token_to_idx[sample_data_token]
+
+    def get_sample_data_path(self, sample_data_token: str) -> str:
+        return osp.join(self.dataroot, self.sd_filename[self.sample_data_idx(sample_data_token)])
+
+    def get_sample_data_indices(self, sample_token: str) -> np.ndarray:
+        """
+        Get rows of key frames' sample_data of a sample
+        :param sample_token:
+        :return: (N_sensors,) - row indices in sd_* arrays
+        """
+        sample_idx = self.sample_idx(sample_token)
+        return self.sample_sd_idx[self.sample_sd_offsets[sample_idx]: self.sample_sd_offsets[sample_idx + 1]]
+
+    def get_annotation_indices(self, sample_token: str) -> slice:
+        """
+        Get rows of annotations of a sample
+        :param sample_token:
+        :return: slice of ann_* arrays
+        """
+        sample_idx = self.sample_idx(sample_token)
+        return slice(self.sample_ann_offsets[sample_idx], self.sample_ann_offsets[sample_idx + 1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='build the metadata index of a V2X-Sim split')
+    parser.add_argument('--dataroot', type=str, default='../data/v2x-sim')
+    parser.add_argument('--version', type=str, default='v1.0-mini')
+    parser.add_argument('--out', type=str, default=None, help='default: dataroot/version/index.npz')
+    args = parser.parse_args()
+
+    index = V2XSimIndex.build(args.dataroot, args.version)
+    index.save(args.out if args.out is not None else V2XSimIndex.default_path(args.dataroot, args.version))
@@ -2,8 +2,14 @@ import numpy as np
 import numpy.linalg as LA
 import matplotlib.pyplot as plt
 from nuscenes import NuScenes
-from einops import rearrange
-from armen_v2x.utils.geometry import make_tf, quaternion_yaw, apply_tf
+from typing import Callable, Dict, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from armen_v2x.utils.geometry import make_tf, quaternions_yaw, apply_tf, transform_boxes
+from armen_v2x.utils.downsampling import Downsampler
+from armen_v2x.utils.profiling import PROFILER
+from armen_v2x.dataset.v2x_sim.point_cloud_cache import PointCloudCache
+from armen_v2x.dataset.v2x_sim.v2x_sim_index import V2XSimIndex
+from armen_v2x.dataset.v2x_sim.scene_transforms import SceneTransformTable
 
 
 CLASS_NAMES = ['car','truck', 'construction_vehicle', 'bus', 'trailer',
@@ -38,46 +44,72 @@ map_name_from_general_to_detection = {
 }
 
 
-def get_point_cloud(nusc: NuScenes, lidar_token: str, thresh_dist_to_lidar: float) -> np.ndarray:
+def get_point_cloud(nusc: Union[NuScenes, V2XSimIndex], lidar_token: str, thresh_dist_to_lidar: float,
+                    cache: PointCloudCache = None) -> np.ndarray:
     """
     Get a NuScenes point cloud. Note point cloud is expressed in LiDAR's frame
-    :param nusc: NuScenes API
+    :param nusc: NuScenes API or V2XSimIndex
     :param lidar_token:
     :param thresh_dist_to_lidar: in meter, to remove points too close to LiDAR according to
         their distance to LIDAR on XY plane
+    :param cache: on-disk cache of filtered point clouds. If provided, a cached point cloud is returned as
+        a read-only memory map, copy it before modifying it in place
     :return:
         - point_cloud: (N, 4) - x, y, z, intensity
     """
-    point_cloud_file = nusc.get_sample_data_path(lidar_token)
-    points = np.fromfile(point_cloud_file, dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]  # (x, y, z, intensity)
+    with PROFILER.stage('get_point_cloud') as stage:
+        point_cloud_file = nusc.get_sample_data_path(lidar_token)
+        if cache is not None:
+            points = cache.get(lidar_token, thresh_dist_to_lidar, point_cloud_file)
+            if points is not None:
+                stage.add_bytes_read(points.nbytes)
+                return points
 
-    mask_valid = LA.norm(points[:, :2], axis=1) > thresh_dist_to_lidar
-    return points[mask_valid]
+        raw_points = np.fromfile(point_cloud_file, dtype=np.float32, count=-1).reshape([-1, 5])
+        points = raw_points[:, :4]  # (x, y, z, intensity)
 
+        mask_valid = LA.norm(points[:, :2], axis=1) > thresh_dist_to_lidar
+        points = points[mask_valid]
+        stage.add_bytes_read(raw_points.nbytes)
+        stage.add_allocated(raw_points, points)
+        if cache is not None:
+            cache.put(lidar_token, thresh_dist_to_lidar, point_cloud_file, points)
+        return points
 
-def get_tf_vehicle_from_sensor(nusc: NuScenes, sensor_token: str) -> np.ndarray:
+
+def get_tf_vehicle_from_sensor(nusc: Union[NuScenes, V2XSimIndex], sensor_token: str) -> np.ndarray:
     """
     Get transformation that map points in sensor frame to ego vehicle frame
-    :param nusc: NuScenes API
+    :param nusc: NuScenes API or V2XSimIndex
     :param sensor_token: sample data token
     :return:
         - vehicle_from_sensor: (4, 4)
     """
+    if isinstance(nusc, V2XSimIndex):
+        sd_idx = nusc.sample_data_idx(sensor_token)
+        return make_tf(nusc.sd_calib_translation[sd_idx], nusc.sd_calib_rotation[sd_idx])
+
     sensor_record = nusc.get('sample_data', sensor_token)
     calib_record = nusc.get('calibrated_sensor', sensor_record['calibrated_sensor_token'])
     vehicle_from_sensor = make_tf(calib_record['translation'], calib_record['rotation'])
     return vehicle_from_sensor
 
 
-def get_tf_global_from_sensor(nusc: NuScenes, sensor_token: str) -> np.ndarray:
+@PROFILER.profiled()
+def get_tf_global_from_sensor(nusc: Union[NuScenes, V2XSimIndex], sensor_token: str) -> np.ndarray:
     """
     Get transformation that map points in sensor frame to global frame
-    :param nusc: NuScenes API
+    :param nusc: NuScenes API or V2XSimIndex
     :param sensor_token: sample data token
     :return:
         - glob_from_sensor: (4, 4)
     """
     vehicle_from_sensor = get_tf_vehicle_from_sensor(nusc, sensor_token)
+    if isinstance(nusc, V2XSimIndex):
+        sd_idx = nusc.sample_data_idx(sensor_token)
+        glob_from_vehicle = make_tf(nusc.sd_ego_translation[sd_idx], nusc.sd_ego_rotation[sd_idx])
+        return glob_from_vehicle @ vehicle_from_sensor
+
     sensor_record = nusc.get('sample_data', sensor_token)
     vehicle_record = nusc.get('ego_pose', sensor_record['ego_pose_token'])
     glob_from_vehicle = make_tf(vehicle_record['translation'], vehicle_record['rotation'])
@@ -85,12 +117,17 @@ def get_tf_global_from_sensor(nusc: NuScenes, sensor_token: str) -> np.ndarray:
     return glob_from_sensor
 
 
-def get_annotated_boxes(nusc: NuScenes, sensor_token: str, ignored_names: list = None) -> np.ndarray:
+@PROFILER.profiled()
+def get_annotated_boxes(nusc: Union[NuScenes, V2XSimIndex], sensor_token: str, ignored_names: list = None,
+                        filter_empty: bool = True) -> np.ndarray:
     """
     Get annotated boxes @ timestamp of sensor. Note: annotated boxes are expressed in GLOBAL frame
-    :param nusc: NuScenes API
+    :param nusc: NuScenes API or V2XSimIndex. With V2XSimIndex, boxes are the annotations of the sample that
+        sensor_token belongs to (i.e. they are not interpolated for non key frames)
     :param sensor_token: sample data token
     :param ignored_names: classes that are ignored
+    :param filter_empty: to remove boxes whose num_lidar_pts is 0 or not. If False, num_lidar_pts is not looked up,
+        empty boxes can be filtered with the counts of find_points_in_boxes instead
     :return:
         - boxes: (N, 8) - center_x, center_y, center_z, dx, dy, dz, yaw, class_name
     """
@@ -98,80 +135,224 @@ def get_annotated_boxes(nusc: NuScenes, sensor_token: str, ignored_names: list =
         ignored_names = ['ignore']
     if 'ignore' not in ignored_names:
         ignored_names.append('ignore')
-    boxes = []
-    annos = nusc.get_boxes(sensor_token)
-    for anno in annos:
-        det_name = map_name_from_general_to_detection[anno.name]
-        if det_name in ignored_names:
-            continue
+    if isinstance(nusc, V2XSimIndex):
+        sample_token = nusc.sample_token[nusc.sd_sample_idx[nusc.sample_data_idx(sensor_token)]]
+        ann_indices = nusc.get_annotation_indices(sample_token)
+        return make_boxes_from_annotations(nusc.ann_translation[ann_indices], nusc.ann_size[ann_indices],
+                                           nusc.ann_yaw[ann_indices], nusc.ann_category[ann_indices],
+                                           nusc.ann_num_lidar_pts[ann_indices] if filter_empty else None,
+                                           ignored_names)
 
-        # remove spurious anno (i.e. zero volume)
-        if anno.wlh[0] * anno.wlh[1] * anno.wlh[2] < 1e-1:
-            continue
+    sensor_record = nusc.get('sample_data', sensor_token)
+    if sensor_record['is_key_frame']:
+        # annotations are exactly @ timestamp of sensor, read them straight from their records
+        sample_record = nusc.get('sample', sensor_record['sample_token'])
+        anno_recs = [nusc.get('sample_annotation', token) for token in sample_record['anns']]
+        translation = np.array([rec['translation'] for rec in anno_recs], dtype=float).reshape(-1, 3)
+        size = np.array([rec['size'] for rec in anno_recs], dtype=float).reshape(-1, 3)
+        rotation = np.array([rec['rotation'] for rec in anno_recs], dtype=float).reshape(-1, 4)
+        category = np.array([rec['category_name'] for rec in anno_recs], dtype=str)
+    else:
+        # annotations are interpolated to timestamp of sensor
+        annos = nusc.get_boxes(sensor_token)
+        anno_recs = [nusc.get('sample_annotation', anno.token) for anno in annos] if filter_empty else None
+        translation = np.array([anno.center for anno in annos], dtype=float).reshape(-1, 3)
+        size = np.array([anno.wlh for anno in annos], dtype=float).reshape(-1, 3)
+        rotation = np.array([anno.orientation.elements for anno in annos], dtype=float).reshape(-1, 4)
+        category = np.array([anno.name for anno in annos], dtype=str)
+    num_lidar_pts = None
+    if filter_empty:
+        num_lidar_pts = np.array([max(np.atleast_1d(rec['num_lidar_pts']), default=0) for rec in anno_recs],
+                                 dtype=np.int64)
+    return make_boxes_from_annotations(translation, size, quaternions_yaw(rotation), category, num_lidar_pts,
+                                       ignored_names)
 
-        # remove empty box
-        anno_rec = nusc.get('sample_annotation', anno.token)
-        if max(anno_rec['num_lidar_pts']) < 1:
-            continue
 
-        cur_box = [*anno.center.tolist(), anno.wlh[1], anno.wlh[0], anno.wlh[2], quaternion_yaw(anno.orientation),
-                   CLASS_NAME_TO_INDEX[det_name]]
-        boxes.append(cur_box)
+def make_boxes_from_annotations(translation: np.ndarray, size: np.ndarray, yaw: np.ndarray, category: np.ndarray,
+                                num_lidar_pts: np.ndarray, ignored_names: list) -> np.ndarray:
+    """
+    Make boxes from columns of annotations, removing ignored classes, spurious boxes (i.e. zero volume) & empty boxes
+    if num_lidar_pts is provided
+    :param translation: (A, 3) - center_x, center_y, center_z
+    :param size: (A, 3) - w, l, h
+    :param yaw: (A,)
+    :param category: (A,) - general class names (e.g. vehicle.car)
+    :param num_lidar_pts: (A,) - number of LiDAR points inside each annotation. If None, empty boxes are kept
+    :param ignored_names: detection classes that are ignored
+    :return:
+        - boxes: (N, 8) - center_x, center_y, center_z, dx, dy, dz, yaw, class_name
+    """
+    # map classes once per distinct category instead of once per annotation
+    categories, category_idx = np.unique(category, return_inverse=True)
+    det_names = [map_name_from_general_to_detection[name] for name in categories.tolist()]
+    categories_cls = np.array([CLASS_NAME_TO_INDEX[name] if name not in ignored_names else -1
+                               for name in det_names], dtype=float)
+    boxes_cls = categories_cls[category_idx.reshape(-1)] if categories.shape[0] > 0 else np.zeros(0)
 
-    return np.array(boxes).astype(float)
+    mask_valid = (boxes_cls > -1) & (np.prod(size, axis=1) >= 1e-1)
+    if num_lidar_pts is not None:
+        mask_valid &= num_lidar_pts >= 1
+    return np.concatenate([translation[mask_valid], size[mask_valid][:, [1, 0, 2]], yaw[mask_valid, np.newaxis],
+                           boxes_cls[mask_valid, np.newaxis]], axis=1)
 
 
-def get_annotated_boxes_in_sensor_frame(nusc: NuScenes, sensor_token: str, ignored_names: list = None) -> np.ndarray:
+def get_annotated_boxes_in_sensor_frame(nusc: Union[NuScenes, V2XSimIndex], sensor_token: str, ignored_names: list = None,
+                                        tf_table: SceneTransformTable = None, filter_empty: bool = True) -> np.ndarray:
     """
-    Get annotated boxes @ timestamp of sensor, in SENSOR frame  TODO
-    :param nusc: NuScenes API
+    Get annotated boxes @ timestamp of sensor, in SENSOR frame
+    :param nusc: NuScenes API or V2XSimIndex
     :param sensor_token: sample data token
     :param ignored_names: classes that are ignored
+    :param tf_table: transformations of the scene this sensor belongs to. If None, they are computed from nusc
+    :param filter_empty: see get_annotated_boxes
     :return:
         - boxes: (N, 8) - center_x, center_y, center_z, dx, dy, dz, yaw, class_name
     """
-    boxes = get_annotated_boxes(nusc, sensor_token, ignored_names)  # (N, 8) - in global frame
+    return get_annotated_boxes_in_sensors_frame(nusc, [sensor_token], ignored_names, tf_table, filter_empty)[0]
 
-    # TODO: map `boxes` from global frame to sensor frame (sensor is represented by `sensor_token`)
-    return boxes
 
+def get_annotated_boxes_in_sensors_frame(nusc: Union[NuScenes, V2XSimIndex], sensor_tokens: list,
+                                         ignored_names: list = None, tf_table: SceneTransformTable = None,
+                                         filter_empty: bool = True) -> np.ndarray:
+    """
+    Get annotated boxes @ timestamp of the first sensor, in the frame of every sensor (e.g. every agent's LiDAR of
+    a sample)
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sensor_tokens: K sample data tokens
+    :param ignored_names: classes that are ignored
+    :param tf_table: transformations of the scene these sensors belong to. If None, they are computed from nusc
+    :param filter_empty: see get_annotated_boxes
+    :return:
+        - boxes: (K, N, 8) - center_x, center_y, center_z, dx, dy, dz, yaw, class_name
+    """
+    boxes = get_annotated_boxes(nusc, sensor_tokens[0], ignored_names, filter_empty)  # (N, 8) - in global frame
+    if tf_table is not None:
+        glob_from_sensors = np.stack([tf_table.get_global_from_sensor(token) for token in sensor_tokens])
+    else:
+        glob_from_sensors = np.stack([get_tf_global_from_sensor(nusc, token) for token in sensor_tokens])
+    return transform_boxes(LA.inv(glob_from_sensors), boxes)
 
-def get_available_lidar_tokens(nusc: NuScenes, sample_token: str) -> dict:
+
+def get_available_lidar_tokens(nusc: Union[NuScenes, V2XSimIndex], sample_token: str) -> dict:
     """
     Get tokens of LiDAR available @ the inputted sample
-    :param nusc: NuScenes API
+    :param nusc: NuScenes API or V2XSimIndex
     :param sample_token:
     :return:
         - {channel: token}
     """
-    sample_rec = nusc.get('sample', sample_token)
+    if isinstance(nusc, V2XSimIndex):
+        sd_indices = nusc.get_sample_data_indices(sample_token)
+        channels_tokens = zip(nusc.sd_channel[sd_indices].tolist(), nusc.sd_token[sd_indices].tolist())
+    else:
+        channels_tokens = nusc.get('sample', sample_token)['data'].items()
     out = dict()
-    for channel, token in sample_rec['data'].items():
+    for channel, token in channels_tokens:
         if 'LIDAR_TOP' in channel and 'SEM' not in channel:
             out[channel] = token
     return out
 
 
-def get_available_point_clouds(nusc: NuScenes, sample_token: str, ref_sensor_name: str, thresh_dist_to_lidar: float) \
-        -> tuple[np.ndarray, np.ndarray]:
+def get_available_camera_tokens(nusc: Union[NuScenes, V2XSimIndex], sample_token: str) -> dict:
+    """
+    Get tokens of cameras available @ the inputted sample
+    :param nusc: NuScenes API or V2XSimIndex
+    :param sample_token:
+    :return:
+        - {channel: token} - sorted by channel (e.g. CAM_id_0_0, CAM_id_0_1, ...)
+    """
+    if isinstance(nusc, V2XSimIndex):
+        sd_indices = nusc.get_sample_data_indices(sample_token)
+        channels_tokens = zip(nusc.sd_channel[sd_indices].tolist(), nusc.sd_token[sd_indices].tolist())
+    else:
+        channels_tokens = nusc.get('sample', sample_token)['data'].items()
+    return {channel: token for channel, token in sorted(channels_tokens) if channel.startswith('CAM')}
+
+
+def get_camera_intrinsic(nusc: Union[NuScenes, V2XSimIndex], camera_token: str) -> np.ndarray:
+    """
+    :param nusc: NuScenes API or V2XSimIndex
+    :param camera_token: sample data token of a camera
+    :return:
+        - camera_intrinsic: (3, 3)
+    """
+    if isinstance(nusc, V2XSimIndex):
+        return nusc.sd_camera_intrinsic[nusc.sample_data_idx(camera_token)]
+    sensor_record = nusc.get('sample_data', camera_token)
+    calib_record = nusc.get('calibrated_sensor', sensor_record['calibrated_sensor_token'])
+    return np.array(calib_record['camera_intrinsic'], dtype=float)
+
+
+def get_available_point_clouds(nusc: Union[NuScenes, V2XSimIndex], sample_token: str, ref_sensor_name: str,
+                               thresh_dist_to_lidar: float, cache: PointCloudCache = None,
+                               tf_table: SceneTransformTable = None, num_workers: int = None,
+                               loader: Callable[[str], np.ndarray] = None, downsampler: Downsampler = None,
+                               return_stats: bool = False) \
+        -> Union[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]]:
     """
-    Get point clouds available @ the inputted sample & map them to the frame of ref_sensor_name
-    :param nusc: NuScenes API
+    Get point clouds available @ the inputted sample & map them to the frame of ref_sensor_name.
+    Point clouds are read concurrently by a thread pool (file reads release the GIL), then copied into their segment
+    of the output buffer & mapped to ref_sensor frame by a single apply_tf with one transformation per segment
+    :param nusc: NuScenes API or V2XSimIndex
     :param sample_token:
     :param ref_sensor_name: name of the LiDAR that is chosen to be reference frame (e.g., LIDAR_TOP_id_1)
     :param thresh_dist_to_lidar: distance threshold to remove points too close to LiDAR
+    :param cache: on-disk cache of filtered point clouds, see get_point_cloud
+    :param tf_table: transformations of the scene this sample belongs to, built with the same ref_sensor_name.
+        If None, transformations are computed from nusc
+    :param num_workers: number of threads reading point clouds. Default: one per LiDAR
+    :param loader: maps a LiDAR token to its point cloud (N, 3[+C]) in LiDAR frame, e.g. a SweepAccumulator.
+        Default: get_point_cloud with thresh_dist_to_lidar & cache
+    :param downsampler: to downsample each point cloud, after it is mapped to ref_sensor frame & before it is merged
+    :param return_stats: to return statistics of downsampling or not. Requires downsampler
     :return:
         - merge_points (N_tot, 3[+C]) - x, y, z, C-dim feat
         - merge_points_src_idx (N_tot,) - points_src_idx[i] = j means merge_points[i] is collected by LIDAR_TOP_id_{j}
+        - stats: see Downsampler.__call__, with an extra 'lidar_names' entry giving the LiDAR of each row.
+            Only returned if return_stats is True
     """
+    assert not return_stats or downsampler is not None, "return_stats requires a downsampler"
     lidar_names2tokens = get_available_lidar_tokens(nusc, sample_token)
     ref_sensor_token = lidar_names2tokens[ref_sensor_name]
-    # TODO: get point clouds from every lidar stored in lidar_names2tokens & map them to ref_sensor
-    # TODO: point clouds, after being mapped to ref_sensor frame, are stored in `points_list`
-    # TODO: `points_src_idx` stores index of the LiDAR that collects each point in each point clouds. This means
-    # TODO: if the first point cloud has 3 points and is collected by LiDAR "1", points_src_idx[0] = np.array([1, 1, 1])
-    points_list, points_src_idx = [], []
-
-    merge_points = np.concatenate(points_list)
-    merge_points_src_idx = np.concatenate(points_src_idx)
+    lidar_names = list(lidar_names2tokens.keys())
+    lidar_tokens = [lidar_names2tokens[name] for name in lidar_names]
+    lidars_src_idx = [int(name.split('_')[-1]) for name in lidar_names]
+
+    if tf_table is not None:
+        assert tf_table.ref_sensor_name == ref_sensor_name, f"{tf_table.ref_sensor_name} != {ref_sensor_name}"
+        ref_from_sensors = np.stack([tf_table.get_ref_from_sensor(token) for token in lidar_tokens])
+    else:
+        ref_from_glob = LA.inv(get_tf_global_from_sensor(nusc, ref_sensor_token))
+        ref_from_sensors = ref_from_glob @ np.stack([get_tf_global_from_sensor(nusc, token) for token in lidar_tokens])
+
+    if loader is None:
+        def loader(token: str) -> np.ndarray:
+            return get_point_cloud(nusc, token, thresh_dist_to_lidar, cache)
+
+    with ThreadPoolExecutor(max_workers=num_workers if num_workers is not None else len(lidar_tokens)) as executor:
+        def load(i: int) -> np.ndarray:
+            with PROFILER.agent(lidars_src_idx[i]):
+                return loader(lidar_tokens[i])
+
+        points_list = list(executor.map(load, range(len(lidar_names))))
+
+    with PROFILER.stage('merge_point_clouds') as stage:
+        # segment i of the output buffer holds the points of lidar_names[i]
+        offsets = np.cumsum([0] + [points.shape[0] for points in points_list])
+        merge_points = np.concatenate(points_list)
+        stage.add_allocated(merge_points)
+    with PROFILER.stage('apply_tf'):
+        apply_tf(ref_from_sensors, merge_points, in_place=True, offsets=offsets)
+
+    if downsampler is not None:
+        # downsampling & dedup need point clouds in a common frame, i.e. after apply_tf
+        points_list, stats = downsampler([merge_points[offsets[i]: offsets[i + 1]] for i in range(len(lidar_names))],
+                                         lidar_names.index(ref_sensor_name), list(ref_from_sensors[:, :3, -1]))
+        stats['lidar_names'] = lidar_names
+        offsets = np.cumsum([0] + [points.shape[0] for points in points_list])
+        merge_points = np.concatenate(points_list)
+    merge_points_src_idx = np.repeat(lidars_src_idx, np.diff(offsets))
+
+    if return_stats:
+        return merge_points, merge_points_src_idx, stats
     return merge_points, merge_points_src_idx
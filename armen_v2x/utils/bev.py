@@ -0,0 +1,89 @@
+import numpy as np
+from typing import List, Tuple
+from armen_v2x.utils.geometry import get_pixels_id
+from armen_v2x.utils.profiling import PROFILER
+
+
+class BEVRasterizer:
+    """
+    Rasterize point clouds into multi-channel BEV images in one pass: points' pixel id are computed once, then every
+    channel is a reduction over pixel ids with np.bincount, except max height that is a sorted-segment reduction.
+    Channels are (see BEVRasterizer.channels)
+        - occupancy: 1 if the pixel has at least one point, 0 otherwise
+        - count: number of points
+        - max_height, mean_height: of points' z, 0 for empty pixels
+        - mean_intensity: of points' 4th coordinate, 0 for empty pixels
+        - count_src_j: number of points collected by LIDAR_TOP_id_j, i.e. density of each source agent
+    Images are indexed by [channel, pixel_y, pixel_x], pixel (0, 0) being @ (x_min, y_min)
+    """
+
+    def __init__(self, point_cloud_range: np.ndarray, resolution: float, num_sources: int = 0):
+        """
+        :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max. Points outside are dropped
+        :param resolution: size of a pixel measured by meter
+        :param num_sources: number of source agents, i.e. 1 + the largest index of LIDAR_TOP_id_*. If 0, no
+            per-source channel is produced
+        """
+        assert resolution > 0, f"resolution must be positive, get {resolution}"
+        self.point_cloud_range = np.asarray(point_cloud_range, dtype=float)
+        self.resolution = resolution
+        self.num_sources = num_sources
+        self.bev_size = np.ceil((self.point_cloud_range[3: 5] - self.point_cloud_range[:2]) / resolution) \
+            .astype(np.int64)  # (W, H)
+        self.channels: List[str] = ['occupancy', 'count', 'max_height', 'mean_height', 'mean_intensity'] + \
+            [f'count_src_{j}' for j in range(num_sources)]
+
+    @property
+    def output_shape(self) -> Tuple[int, int, int]:
+        return len(self.channels), int(self.bev_size[1]), int(self.bev_size[0])
+
+    def channel_idx(self, name: str) -> int:
+        return self.channels.index(name)
+
+    @PROFILER.profiled('bev_rasterization')
+    def __call__(self, points: np.ndarray, points_src_idx: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+        """
+        :param points: (N, 3[+C]) - x, y, z, [intensity, ...]
+        :param points_src_idx: (N,) - index of the LiDAR that collects each point. Required if num_sources > 0
+        :param out: (n_channels, H, W) - C-contiguous float32 buffer to write the BEV image to, e.g. the output of a
+            previous call
+        :return: (n_channels, H, W) - out if it is provided
+        """
+        n_pixels = int(self.bev_size[0] * self.bev_size[1])
+        if out is None:
+            out = np.zeros(self.output_shape, dtype=np.float32)
+        else:
+            assert out.shape == self.output_shape, f"expect out of shape {self.output_shape}, get {out.shape}"
+            # otherwise the reshape below would be a copy & the BEV image would not be written to out
+            assert out.flags.c_contiguous, "out must be C-contiguous"
+            out.fill(0)
+        flat_out = out.reshape(len(self.channels), n_pixels)
+
+        pixels_id, mask_inside, _ = get_pixels_id(points, self.point_cloud_range, self.resolution)
+        if pixels_id.shape[0] == 0:
+            return out
+        z = points[mask_inside, 2]
+
+        count = np.bincount(pixels_id, minlength=n_pixels)  # (H * W,)
+        mask_occupied = count > 0
+        flat_out[0] = mask_occupied
+        flat_out[1] = count
+        flat_out[3, mask_occupied] = np.bincount(pixels_id, weights=z, minlength=n_pixels)[mask_occupied] \
+            / count[mask_occupied]
+        if points.shape[1] > 3:
+            flat_out[4, mask_occupied] = np.bincount(pixels_id, weights=points[mask_inside, 3],
+                                                     minlength=n_pixels)[mask_occupied] / count[mask_occupied]
+
+        # max height: points sorted by pixel form one segment per occupied pixel
+        order = np.argsort(pixels_id, kind='stable')
+        occupied_pixels_id = np.flatnonzero(mask_occupied)  # ascending, i.e. in the order of segments
+        segments_start = np.cumsum(count[occupied_pixels_id]) - count[occupied_pixels_id]
+        flat_out[2, occupied_pixels_id] = np.maximum.reduceat(z[order], segments_start)
+
+        if self.num_sources > 0:
+            assert points_src_idx is not None, "points_src_idx is required to compute per-source channels"
+            src_idx = points_src_idx[mask_inside].astype(np.int64)
+            assert src_idx.max() < self.num_sources, f"source {src_idx.max()} >= num_sources {self.num_sources}"
+            flat_out[5:] = np.bincount(src_idx * n_pixels + pixels_id, minlength=self.num_sources * n_pixels) \
+                .reshape(self.num_sources, n_pixels)
+        return out
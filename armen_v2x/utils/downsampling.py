@@ -0,0 +1,152 @@
+import numpy as np
+from typing import Dict, Sequence, Tuple, Union
+
+
+def get_voxels_key(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    Compute a key identifying the cubic voxel each point lands in, without bounding the space
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param voxel_size: in meter
+    :return: (N,) - int64 keys, equal for points of the same voxel
+    """
+    # 21 bits per axis, i.e. +/- 2^20 voxels around the origin
+    coords = np.floor(points[:, :3] / voxel_size).astype(np.int64) + (1 << 20)  # (N, 3)
+    # otherwise an axis overflows into the next one & unrelated voxels share a key
+    assert coords.shape[0] == 0 or (coords.min() >= 0 and coords.max() < (1 << 21)), \
+        f"points span more than 2^20 voxels of {voxel_size} m around the origin"
+    return (coords[:, 0] << 42) | (coords[:, 1] << 21) | coords[:, 2]
+
+
+def voxel_centroid_downsample(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    Replace points of each voxel by their centroid, features included
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param voxel_size: in meter
+    :return: (M, 3[+C]) - one point per occupied voxel
+    """
+    _, points_to_voxel, counts = np.unique(get_voxels_key(points, voxel_size), return_inverse=True,
+                                           return_counts=True)
+    points_to_voxel = points_to_voxel.reshape(-1)
+    out = np.empty((counts.shape[0], points.shape[1]), dtype=points.dtype)
+    for c in range(points.shape[1]):
+        out[:, c] = np.bincount(points_to_voxel, weights=points[:, c], minlength=counts.shape[0]) / counts
+    return out
+
+
+def voxel_random_downsample(points: np.ndarray, voxel_size: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Keep one random point per voxel
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param voxel_size: in meter
+    :param rng: random generator
+    :return: (M, 3[+C]) - one point per occupied voxel
+    """
+    perm = rng.permutation(points.shape[0])
+    # np.unique returns the first occurrence of each key, i.e. a random point of each voxel
+    _, first_idx = np.unique(get_voxels_key(points[perm], voxel_size), return_index=True)
+    return points[np.sort(perm[first_idx])]
+
+
+class Downsampler:
+    """
+    Downsample the point cloud of an agent before it is merged with others, which also models the bandwidth budget
+    of V2X links. Strategies
+        - voxel_centroid: replace points of each voxel by their centroid
+        - voxel_random: keep one random point per voxel
+        - range_adaptive: voxel_centroid with voxels growing with the distance to the agent's LiDAR, i.e. sparse far
+            points are kept while dense near points are reduced
+        - None: no downsampling
+    On top of that, if dedup_voxel_size is set, points of other agents falling into voxels already occupied by the
+    ego agent's points are removed.
+    """
+    STRATEGIES = ('voxel_centroid', 'voxel_random', 'range_adaptive', None)
+
+    def __init__(self, strategy: Union[str, None] = 'voxel_centroid', voxel_size: float = 0.1,
+                 range_bins: Sequence[float] = (20.0, 40.0), range_voxel_sizes: Sequence[float] = (0.1, 0.2, 0.4),
+                 dedup_voxel_size: float = None, downsample_ego: bool = True, seed: int = None,
+                 max_range: float = 1e4):
+        """
+        :param strategy: one of Downsampler.STRATEGIES
+        :param voxel_size: in meter, voxel size of voxel_centroid & voxel_random
+        :param range_bins: (R,) - ascending distances (in meter, on XY plane) separating range_adaptive's bins
+        :param range_voxel_sizes: (R + 1,) - voxel size of each range_adaptive's bin
+        :param dedup_voxel_size: in meter, voxel size used to find regions already covered by the ego agent.
+            If None, no dedup
+        :param downsample_ego: to downsample the ego agent's point cloud too. Default: True
+        :param seed: seed of the random generator used by voxel_random
+        :param max_range: in meter, largest absolute coordinate of points, used to check that every voxel size
+            indexes them with the 21 bits per axis of get_voxels_key
+        """
+        assert strategy in self.STRATEGIES, f"{strategy} is not in {self.STRATEGIES}"
+        assert len(range_voxel_sizes) == len(range_bins) + 1, "expect one more voxel size than range bins"
+        voxel_sizes = [voxel_size, *range_voxel_sizes] + ([dedup_voxel_size] if dedup_voxel_size is not None else [])
+        for size in voxel_sizes:
+            assert size > 0, f"voxel sizes must be positive, get {size}"
+            assert max_range / size < (1 << 20), \
+                f"a voxel size of {size} m indexes at most {size * (1 << 20)} m around the origin, get {max_range}"
+        self.strategy = strategy
+        self.voxel_size = voxel_size
+        self.range_bins = np.asarray(range_bins, dtype=float)
+        self.range_voxel_sizes = list(range_voxel_sizes)
+        self.dedup_voxel_size = dedup_voxel_size
+        self.downsample_ego = downsample_ego
+        self.rng = np.random.default_rng(seed)
+
+    def downsample(self, points: np.ndarray, origin: np.ndarray = None) -> np.ndarray:
+        """
+        :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+        :param origin: (3,) - position of the agent's LiDAR in the frame of points, used by range_adaptive.
+            Default: frame's origin
+        :return: (M, 3[+C])
+        """
+        if self.strategy == 'voxel_centroid':
+            return voxel_centroid_downsample(points, self.voxel_size)
+        elif self.strategy == 'voxel_random':
+            return voxel_random_downsample(points, self.voxel_size, self.rng)
+        elif self.strategy == 'range_adaptive':
+            origin = np.zeros(3) if origin is None else origin
+            dist = np.linalg.norm(points[:, :2] - origin[:2], axis=1)
+            points_bin = np.searchsorted(self.range_bins, dist, side='right')  # (N,)
+            return np.concatenate([voxel_centroid_downsample(points[points_bin == b], voxel_size)
+                                   for b, voxel_size in enumerate(self.range_voxel_sizes)])
+        return points
+
+    def __call__(self, points_list: Sequence[np.ndarray], ego_idx: int, origins: Sequence[np.ndarray] = None) \
+            -> Tuple[list, Dict[str, np.ndarray]]:
+        """
+        Downsample point clouds of several agents expressed in a common frame
+        :param points_list: K point clouds (N_k, 3[+C])
+        :param ego_idx: index of the ego agent's point cloud in points_list
+        :param origins: K positions (3,) of the agents' LiDAR, used by range_adaptive
+        :return:
+            - downsampled points_list
+            - stats: {
+                num_points_in: (K,) - number of points before downsampling
+                num_points_out: (K,) - number of points after downsampling
+                num_points_removed: (K,)
+                bytes_saved: (K,) - size of removed points
+            }
+        """
+        if origins is None:
+            origins = [None] * len(points_list)
+        out = list(points_list)
+        for k, points in enumerate(points_list):
+            if k != ego_idx or self.downsample_ego:
+                out[k] = self.downsample(points, origins[k])
+
+        if self.dedup_voxel_size is not None:
+            ego_keys = np.unique(get_voxels_key(out[ego_idx], self.dedup_voxel_size))
+            for k in range(len(out)):
+                if k != ego_idx:
+                    out[k] = out[k][~np.isin(get_voxels_key(out[k], self.dedup_voxel_size), ego_keys)]
+
+        num_points_in = np.array([points.shape[0] for points in points_list], dtype=np.int64)
+        num_points_out = np.array([points.shape[0] for points in out], dtype=np.int64)
+        point_nbytes = np.array([points.shape[1] * points.itemsize for points in points_list], dtype=np.int64)
+        stats = {
+            'num_points_in': num_points_in,
+            'num_points_out': num_points_out,
+            'num_points_removed': num_points_in - num_points_out,
+            'bytes_saved': (num_points_in - num_points_out) * point_nbytes
+        }
+        return out, stats
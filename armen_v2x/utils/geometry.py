@@ -5,43 +5,159 @@ from einops import rearrange
 from typing import Tuple
 
 
+def quaternion_to_rotation_matrix(q: np.ndarray) -> np.ndarray:
+    """
+    Convert quaternions to rotation matrices. Quaternions are normalized beforehand
+    :param q: (..., 4) - w, x, y, z
+    :return: (..., 3, 3)
+    """
+    assert q.shape[-1] == 4, f"expect (..., 4), get {q.shape}"
+    q = q / LA.norm(q, axis=-1, keepdims=True)
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    rot = np.empty(q.shape[:-1] + (3, 3))
+    rot[..., 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    rot[..., 0, 1] = 2.0 * (x * y - w * z)
+    rot[..., 0, 2] = 2.0 * (x * z + w * y)
+    rot[..., 1, 0] = 2.0 * (x * y + w * z)
+    rot[..., 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    rot[..., 1, 2] = 2.0 * (y * z - w * x)
+    rot[..., 2, 0] = 2.0 * (x * z - w * y)
+    rot[..., 2, 1] = 2.0 * (y * z + w * x)
+    rot[..., 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return rot
+
+
 def make_tf(translation: Vector, rotation: Union[Vector, Quaternion, np.ndarray]) -> np.ndarray:
     """
-    Create a homogeneous transformation matrix
-    :param translation: (3) - t_x, t_y, t_z
-    :param rotation: either 4 number representing a quaternion, a Quaternion, or a rotation matrix
-    :return: (4, 4)
-    """
-    tf = np.eye(4)
-    tf[:3, -1] = to_numpy(translation)
-    if isinstance(rotation, np.ndarray):
-        if rotation.shape == (3, 3) or rotation.shape == (4, 4):
-            tf[:3, :3] = rotation[:3, :3]
-        else:
-            raise ValueError(f"rotation has an invalid shape {rotation.shape}")
-    else:
-        tf[:3, :3] = to_quaternion(rotation).rotation_matrix
+    Create a homogeneous transformation matrix, or a batch of K matrices
+    :param translation: (3) or (K, 3) - t_x, t_y, t_z
+    :param rotation: either 4 number representing a quaternion, a Quaternion, or a rotation matrix.
+        For a batch, (K, 4) - quaternions (w, x, y, z) or (K, 3, 3) - rotation matrices
+    :return: (4, 4) or (K, 4, 4)
+    """
+    translation = to_numpy(translation)
+    batch_shape = translation.shape[:-1]
+    if isinstance(rotation, Quaternion):
+        rotation = rotation.rotation_matrix
+    rotation = to_numpy(rotation).astype(float)
+    if rotation.shape[len(batch_shape):] == (4,):
+        rotation = quaternion_to_rotation_matrix(rotation)
+    elif rotation.shape[len(batch_shape):] not in [(3, 3), (4, 4)]:
+        raise ValueError(f"rotation has an invalid shape {rotation.shape}")
+
+    tf = np.zeros(batch_shape + (4, 4))
+    tf[..., :3, :3] = rotation[..., :3, :3]
+    tf[..., :3, -1] = translation
+    tf[..., -1, -1] = 1.0
     return tf
 
 
-def apply_tf(tf: np.ndarray, points: np.ndarray, in_place=False) -> Union[np.ndarray, None]:
+def apply_tf(tf: np.ndarray, points: np.ndarray, in_place=False, out: np.ndarray = None,
+             offsets: np.ndarray = None) -> Union[np.ndarray, None]:
     """
-    Apply a homogeneous transformation to a set pof points
-    :param tf: (4, 4) - transformation matrix
+    Apply a homogeneous transformation to a set pof points, as R @ p + t without padding points to homogeneous
+    coordinate. Float32 points are transformed in float32, other points in float64
+    :param tf: (4, 4) - transformation matrix, or (K, 4, 4) - one transformation per segment of points
     :param points: (N, 3[+C]) - x, y, z, [C-dim features]
     :param in_place: to overwrite points' coordinate with the output or not.
         If True, this function doesn't return anything. Default: False
-    :return:  (N, 3) - transformed coordinate
+    :param out: (N, 3) - buffer (e.g. a view of a larger array) the output is written to. Ignored if in_place
+    :param offsets: (K + 1,) - segment k is points[offsets[k]: offsets[k + 1]]. Required if tf is (K, 4, 4)
+    :return:  (N, 3) - transformed coordinate, out if it is provided
     """
-    assert tf.shape == (4, 4), f"{tf.shape} is not a homogeneous transfomration matrix"
     assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
-    xyz1 = np.pad(points[:, :3], pad_width=[(0, 0), (0, 1)], constant_values=1)  # (N, 4)
-    xyz1 = rearrange(tf @ rearrange(xyz1, 'N C -> C N', C=4), 'C N -> N C')
+    if tf.ndim == 3:
+        assert tf.shape[1:] == (4, 4), f"{tf.shape} is not a stack of homogeneous transfomration matrices"
+        assert offsets is not None and len(offsets) == tf.shape[0] + 1, "expect K + 1 offsets for K transformations"
+        assert offsets[0] == 0 and offsets[-1] == points.shape[0], "offsets must cover every point"
+    else:
+        assert tf.shape == (4, 4), f"{tf.shape} is not a homogeneous transfomration matrix"
+        tf, offsets = tf[np.newaxis], [0, points.shape[0]]
+
+    dtype = np.float32 if points.dtype == np.float32 else np.float64
+    if in_place:
+        out = points[:, :3]
+    elif out is None:
+        out = np.empty((points.shape[0], 3), dtype=dtype)
+    else:
+        assert out.shape == (points.shape[0], 3), f"expect out of shape {(points.shape[0], 3)}, get {out.shape}"
+
+    tf = tf.astype(dtype, copy=False)
+    for k in range(tf.shape[0]):
+        segment_out = out[offsets[k]: offsets[k + 1]]
+        # matmul makes a temporary copy of its input if out overlaps it (i.e. in_place)
+        np.matmul(points[offsets[k]: offsets[k + 1], :3], tf[k, :3, :3].T, out=segment_out)
+        segment_out += tf[k, :3, -1]
+
     if in_place:
-        points[:, :3] = xyz1[:, :3]
         return
     else:
-        return xyz1[:, :3]
+        return out
+
+
+def transform_boxes(tf: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    Map boxes to another frame. Boxes are assumed to be upright (i.e. only rotate around z) in both frames, so only
+    their center & yaw change
+    :param tf: (4, 4) - transformation matrix, or (K, 4, 4) - K target frames
+    :param boxes: (N, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [D-dim features left unchanged]
+    :return: (N, 7[+D]) or (K, N, 7[+D]) - boxes in each target frame
+    """
+    assert tf.shape[-2:] == (4, 4) and tf.ndim in (2, 3), f"expect (4, 4) or (K, 4, 4), get {tf.shape}"
+    assert boxes.ndim == 2 and boxes.shape[1] >= 7, f"expect (N, 7[+D]), get {boxes.shape}"
+    out = np.repeat(boxes[np.newaxis], 1 if tf.ndim == 2 else tf.shape[0], axis=0)  # (K, N, 7[+D])
+    tfs = tf.reshape(-1, 4, 4)
+    out[..., :3] = boxes[np.newaxis, :, :3] @ np.swapaxes(tfs[:, :3, :3], 1, 2) + tfs[:, np.newaxis, :3, -1]
+    heading = np.arctan2(tfs[:, 1, 0], tfs[:, 0, 0])  # (K,)
+    out[..., 6] = np.mod(boxes[np.newaxis, :, 6] + heading[:, np.newaxis] + np.pi, 2 * np.pi) - np.pi
+    return out if tf.ndim == 3 else out[0]
+
+
+def _cast_range(points: np.ndarray, point_cloud_range: np.ndarray) -> np.ndarray:
+    # compare & offset float32 points against a float32 range, so that no float64 copy of points is made
+    return point_cloud_range.astype(points.dtype if points.dtype == np.float32 else np.float64, copy=False)
+
+
+def mask_points_in_range(points: np.ndarray, point_cloud_range: np.ndarray) -> np.ndarray:
+    """
+    Find points inside a limit, i.e. min <= coordinate < max. Upper bounds are excluded so that a BEV grid of
+    ceil((max - min) / resolution) pixels contains exactly the points inside (see get_pixels_id)
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :return: (N,) - True for points inside the limit
+    """
+    point_cloud_range = _cast_range(points, point_cloud_range)
+    # one comparison per bound & per coordinate accumulated in place, instead of (N, 3) temporaries
+    mask = points[:, 0] >= point_cloud_range[0]
+    for i in range(3):
+        if i > 0:
+            mask &= points[:, i] >= point_cloud_range[i]
+        mask &= points[:, i] < point_cloud_range[3 + i]
+    return mask
+
+
+def get_pixels_id(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the linear id of the BEV pixel each point lands in. Pixel (pixel_x, pixel_y) has id pixel_y * W + pixel_x.
+    Points inside are the ones of mask_points_in_range, i.e. upper bounds are excluded
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :return:
+        - pixels_id: (N',) - id of pixels of points inside the range
+        - mask_inside: (N,) - True for points inside the range, i.e. points that have a pixel id
+        - bev_size: (2,) - W, H | width & height of the BEV image
+    """
+    assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
+    assert point_cloud_range.shape[0] == 6, f"{point_cloud_range.shape[0]} != 6"
+    bev_size = np.ceil((point_cloud_range[3: 5] - point_cloud_range[:2]) / resolution).astype(np.int64)
+    mask_inside = mask_points_in_range(points, point_cloud_range)
+    xy = points[:, :2] if mask_inside.all() else points[mask_inside, :2]  # no gather if every point is inside
+    pixels = np.floor((xy - _cast_range(points, point_cloud_range)[:2]) / resolution).astype(np.int64)  # (N', 2)
+    # points just below the upper bound may be rounded to the next pixel
+    np.minimum(pixels, bev_size - 1, out=pixels)
+    return pixels[:, 1] * bev_size[0] + pixels[:, 0], mask_inside, bev_size
 
 
 def get_points_in_range(points: np.ndarray, point_cloud_range: np.ndarray) -> np.ndarray:
@@ -49,28 +165,41 @@ def get_points_in_range(points: np.ndarray, point_cloud_range: np.ndarray) -> np
     Get points inside a limit.
     :param points: (N, 3[+C]) - x, y, z, [C-dim features]
     :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
-    :return: (N', 3[+C]) - x, y, z, [C-dim features]
+    :return: (N', 3[+C]) - x, y, z, [C-dim features] | points itself (no copy) if every point is inside
     """
     assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
-    assert point_cloud_range.shape[0] == 6, f"{point_cloud_range.shape[1]} != 6"
-    # TODO
-    points_inside = np.zeros([3, points.shape[1]])  # This is just a dummy value
+    assert point_cloud_range.shape[0] == 6, f"{point_cloud_range.shape[0]} != 6"
+    mask_inside = mask_points_in_range(points, point_cloud_range)
+    points_inside = points if mask_inside.all() else points[mask_inside]
     return points_inside
 
 
 def check_points_in_range(points: np.ndarray, point_cloud_range: np.ndarray) -> bool:
     """
-    Check if every points is in a limit.
+    Check if every points is in a limit, upper bounds excluded (see mask_points_in_range).
     :param points: (N, 3[+C]) - x, y, z, [C-dim features]
     :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
     :return: True if every point is within the limit, False otherwise
     """
     assert isinstance(point_cloud_range, type(points)), f"{type(point_cloud_range)} != {type(points)}"
-    # TODO
-    is_all_inside = False  # This is just a dummy value
+    if points.shape[0] == 0:
+        return True
+    point_cloud_range = _cast_range(points, point_cloud_range)
+    # reductions don't allocate per-point temporaries
+    is_all_inside = bool(np.all(points[:, :3].min(axis=0) >= point_cloud_range[:3]) and
+                         np.all(points[:, :3].max(axis=0) < point_cloud_range[3:]))
     return is_all_inside
 
 
+def _get_occupied_pixels(pixels_id: np.ndarray, bev_size: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # occupied pixels & the index of the occupied pixel of each point, by a bincount over the grid instead of a sort
+    mask_occupied = np.bincount(pixels_id, minlength=int(bev_size[0] * bev_size[1])) > 0
+    occupied_pixels_id = np.flatnonzero(mask_occupied)  # ascending
+    rank = np.cumsum(mask_occupied) - 1  # (H * W,) - rank of each pixel among occupied pixels
+    pixels_coord = np.stack([occupied_pixels_id % bev_size[0], occupied_pixels_id // bev_size[0]], axis=1)
+    return pixels_coord, rank[pixels_id]
+
+
 def orthogonal_projection(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float) \
         -> Tuple[np.ndarray, np.ndarray]:
     """
@@ -80,16 +209,33 @@ def orthogonal_projection(points: np.ndarray, point_cloud_range: np.ndarray, res
     :param resolution: size of a pixel measured by meter. Not distinguish between height & width because we assume
         pixels are square
     :return:
-        - pixels_coord: (N_pixels, 2) - pixel_x (horizontal), pixel_y (vertical) | coordinate of occupied pixels
+        - pixels_coord: (N_pixels, 2) - pixel_x (horizontal), pixel_y (vertical) | coordinate of occupied pixels,
+            sorted by pixel id (i.e. pixel_y * W + pixel_x)
         - idx_pixels_to_points: (N,) - idx_pixels_to_points[i] = j means points[i] lands inside pixels_coord[j]
     """
-    assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
-    assert check_points_in_range(points, point_cloud_range), "some points are outside of range"
+    pixels_id, mask_inside, bev_size = get_pixels_id(points, point_cloud_range, resolution)
+    assert pixels_id.shape[0] == points.shape[0], "some points are outside of range"
+    return _get_occupied_pixels(pixels_id, bev_size)
 
-    # TODO
-    pixels_coord = np.zeros((3, 2))  # This is just a dummy value
-    idx_pixels_to_points = np.ones(points.shape[0])  # This is just a dummy value
-    return pixels_coord, idx_pixels_to_points
+
+def crop_and_project(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Crop points to a limit & compute their coordinate in bird-eye view, i.e. get_points_in_range followed by
+    orthogonal_projection. The range mask & pixels are computed in a single pass over points (see get_pixels_id),
+    the only copy of points is the returned points_inside
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :return:
+        - points_inside: (N', 3[+C]) - points itself (no copy) if every point is inside
+        - pixels_coord: (N_pixels, 2) - pixel_x (horizontal), pixel_y (vertical) | coordinate of occupied pixels
+        - idx_pixels_to_points: (N',) - idx_pixels_to_points[i] = j means points_inside[i] lands inside pixels_coord[j]
+    """
+    pixels_id, mask_inside, bev_size = get_pixels_id(points, point_cloud_range, resolution)
+    points_inside = points if pixels_id.shape[0] == points.shape[0] else points[mask_inside]
+    pixels_coord, idx_pixels_to_points = _get_occupied_pixels(pixels_id, bev_size)
+    return points_inside, pixels_coord, idx_pixels_to_points
 
 
 def perspective_projection(points: np.ndarray, camera_intrinsic: np.ndarray) -> np.ndarray:
@@ -109,6 +255,43 @@ def perspective_projection(points: np.ndarray, camera_intrinsic: np.ndarray) ->
     return points_in_pixel[:, :2]
 
 
+def perspective_projection_batch(points: np.ndarray, camera_intrinsics: np.ndarray, cams_from_points: np.ndarray,
+                                 image_sizes: np.ndarray, min_depth: float = 1e-3) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Apply pin-hole camera model of M cameras at once to compute points' coordinate on every image.
+    Intrinsic & extrinsic of each camera are fused into one (3, 4) projection matrix, so points are projected by one
+    matmul per camera
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param camera_intrinsics: (M, 3, 3)
+    :param cams_from_points: (M, 4, 4) - transformation mapping points to each camera's frame
+    :param image_sizes: (M, 2) - width, height of each image
+    :param min_depth: points closer to the image plane than this (in meter), or behind it, are invalid
+    :return:
+        - pixels_coord: (M, N, 2) - pixel_x (horizontal), pixel_y (vertical) on each image
+        - depth: (M, N) - z in each camera's frame
+        - mask_valid: (M, N) - True if points are in front of a camera & project inside its image
+    """
+    assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
+    assert camera_intrinsics.ndim == 3 and camera_intrinsics.shape[1:] == (3, 3), \
+        f"expect (M, 3, 3), got {camera_intrinsics.shape}"
+    assert cams_from_points.shape == (camera_intrinsics.shape[0], 4, 4), \
+        f"expect ({camera_intrinsics.shape[0]}, 4, 4), got {cams_from_points.shape}"
+    # float32 points are projected in float32
+    dtype = points.dtype if points.dtype in (np.float32, np.float64) else np.float64
+    projections = (camera_intrinsics @ cams_from_points[:, :3, :]).astype(dtype)  # (M, 3, 4)
+    uvw = points[np.newaxis, :, :3] @ np.swapaxes(projections[:, :, :3], 1, 2)  # (M, N, 3)
+    uvw += projections[:, np.newaxis, :, 3]
+    depth = uvw[..., 2]  # (M, N) - last row of intrinsics is (0, 0, 1)
+    mask_valid = depth > min_depth
+    pixels_coord = uvw[..., :2]  # (M, N, 2)
+    pixels_coord /= np.where(mask_valid, depth, 1.0)[..., np.newaxis]
+    image_sizes = np.asarray(image_sizes)
+    for i in range(2):
+        mask_valid &= (pixels_coord[..., i] >= 0) & (pixels_coord[..., i] < image_sizes[:, [i]])
+    return pixels_coord, depth, mask_valid
+
+
 def rot_z(yaw: float) -> np.ndarray:
     """
     Create rotation matrix around z
@@ -123,24 +306,213 @@ def rot_z(yaw: float) -> np.ndarray:
     ]).reshape(3, 3).astype(float)
 
 
-def find_points_in_boxes(points: np.ndarray, boxes: np.ndarray, tol=1e-2) -> np.ndarray:
+# sign of (dx, dy, dz) of the 8 corners. Convention
+# forward face: 0 - 1 - 2 - 3, backward face: 4 - 5 - 6 - 7, top face: 0 - 4 - 5 - 1
+_CORNERS_SIGN = np.array([
+    [1, 1, 1], [1, -1, 1], [1, -1, -1], [1, 1, -1],
+    [-1, 1, 1], [-1, -1, 1], [-1, -1, -1], [-1, 1, -1]
+], dtype=float) / 2.0
+
+
+def boxes_to_corners(boxes: np.ndarray) -> np.ndarray:
+    """
+    Compute coordinate of boxes' corners in the frame relative to which boxes are expressed. Convention
+    forward face: 0 - 1 - 2 - 3, backward face: 4 - 5 - 6 - 7, top face: 0 - 4 - 5 - 1
+    :param boxes: (B, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [...]
+    :return: (B, 8, 3)
+    """
+    assert boxes.ndim == 2 and boxes.shape[1] >= 7, f"expect (B, 7[+D]), get {boxes.shape}"
+    corners = _CORNERS_SIGN[np.newaxis] * boxes[:, np.newaxis, 3: 6]  # (B, 8, 3) - in boxes' frame
+    cos, sin = np.cos(boxes[:, [6]]), np.sin(boxes[:, [6]])  # (B, 1)
+    x, y = corners[..., 0].copy(), corners[..., 1]
+    corners[..., 0] = cos * x - sin * y + boxes[:, [0]]
+    corners[..., 1] = sin * x + cos * y + boxes[:, [1]]
+    corners[..., 2] += boxes[:, [2]]
+    return corners
+
+
+OVERLAP_POLICIES = ('first', 'nearest_center', 'all')
+
+
+def _resolve_overlap(pairs_points_idx: np.ndarray, pairs_box_idx: np.ndarray, overlap: str,
+                     pairs_dist: np.ndarray = None) -> np.ndarray:
+    # resolve points inside several boxes according to overlap: the pair kept for a point is its first one in this
+    # order. pairs_dist (squared distance to the box's center) is required for nearest_center
+    if overlap == 'nearest_center':
+        order = np.lexsort((pairs_box_idx, pairs_dist, pairs_points_idx))
+    else:
+        order = np.lexsort((pairs_box_idx, pairs_points_idx))
+    mask_first = np.ones(order.shape[0], dtype=bool)
+    mask_first[1:] = pairs_points_idx[order[1:]] != pairs_points_idx[order[:-1]]
+    return order[mask_first]  # (N_labelled,) - index of the kept pair of each point inside a box
+
+
+def find_points_in_boxes(points: np.ndarray, boxes: np.ndarray, tol=1e-2, return_counts=False,
+                         cell_size: float = 2.0, chunk_size: int = 1 << 20, overlap: str = 'first',
+                         return_indices: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
     """
     Find points inside boxes. Note: points and boxes must be in the same frame.
+    Points are bucketed into a BEV grid of `cell_size` and sorted by cell, so each box only tests the points of the
+    cells overlapped by its BEV footprint. Candidate (point, box) pairs are tested in chunks of `chunk_size`.
+    Per-point labels, per-box counts & per-box point indices are all made from the (point, box) pairs found inside,
+    i.e. without another pass over points
     :param points: (N, 3[+C]) - x, y, z, [C-dim features]
     :param boxes: (B, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [velocity_x, velocity_y,...]
+    :param tol: margin (in meter) added to each side of boxes
+    :param return_counts: to return the number of points inside each box or not
+    :param cell_size: size (in meter) of cells of the BEV grid used to prefilter candidate points
+    :param chunk_size: max number of (point, box) pairs tested at once, this caps the peak memory
+    :param overlap: one of OVERLAP_POLICIES, how points inside several boxes are resolved. first: the box of smallest
+        index, nearest_center: the box whose center is the closest (ties go to the smallest index), all: labels are
+        the box of smallest index but such points are counted & indexed in every box they are inside
+    :param return_indices: to return points inside each box as CSR arrays or not
     :return:
-        - boxes_to_points: (N,) - boxes_to_points[i] = j >=0 means points[i] is in boxes[j],
-            boxes_to_points[i] == -1 means points[i] does not belong to any boxes
+        - boxes_to_points: (N,) - int32, boxes_to_points[i] = j >=0 means points[i] is in boxes[j],
+            boxes_to_points[i] == -1 means points[i] does not belong to any boxes. If points[i] is inside several
+            boxes, j is chosen according to overlap
+        - num_points_in_boxes: (B,) - int32, number of points inside each box, only returned if return_counts is True
+        - boxes_offsets: (B + 1,) - int32, points inside boxes[j] are boxes_points_idx[boxes_offsets[j]:
+            boxes_offsets[j + 1]]. Only returned if return_indices is True
+        - boxes_points_idx: (boxes_offsets[-1],) - int32, indices of points inside each box, in ascending order
+            inside a box. Only returned if return_indices is True
     """
     n_points, n_boxes = points.shape[0], boxes.shape[0]
     assert n_points > 0
+    assert chunk_size > 0, f"chunk_size must be positive, get {chunk_size}"
+    assert overlap in OVERLAP_POLICIES, f"{overlap} is not in {OVERLAP_POLICIES}"
+    assert n_points < 2 ** 31, f"point indices are int32, get {n_points} points"
 
-    boxes_to_points = -np.ones(n_points)  # (N,)
+    def make_output(boxes_to_points: np.ndarray, num_points_in_boxes: np.ndarray,
+                    boxes_points_idx: np.ndarray) -> Union[np.ndarray, Tuple[np.ndarray, ...]]:
+        out = [boxes_to_points]
+        if return_counts:
+            out.append(num_points_in_boxes)
+        if return_indices:
+            boxes_offsets = np.zeros(n_boxes + 1, dtype=np.int32)
+            np.cumsum(num_points_in_boxes, out=boxes_offsets[1:])
+            out += [boxes_offsets, boxes_points_idx]
+        return out[0] if len(out) == 1 else tuple(out)
+
+    boxes_to_points = -np.ones(n_points, dtype=np.int32)  # (N,)
     if n_boxes == 0:
-        return boxes_to_points.astype(int)
+        return make_output(boxes_to_points, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+
+    # bucket points into a BEV grid & sort them by cell
+    xy_min = points[:, :2].min(axis=0)
+    cells = np.floor((points[:, :2] - xy_min) / cell_size).astype(np.int64)  # (N, 2)
+    grid_size = cells.max(axis=0) + 1  # (2,) - n_cells_x, n_cells_y
+    cells_id = cells[:, 0] * grid_size[1] + cells[:, 1]  # (N,)
+    sorted_points_idx = np.argsort(cells_id, kind='stable')
+    sorted_cells_id = cells_id[sorted_points_idx]
+
+    # BEV footprint of boxes, as range of cells
+    # tol is added to each side in box frame, i.e. before the rotation, so that the footprint covers the corners
+    # of the tested region
+    cos, sin = np.abs(np.cos(boxes[:, 6])), np.abs(np.sin(boxes[:, 6]))
+    half_dx, half_dy = boxes[:, 3] / 2.0 + tol, boxes[:, 4] / 2.0 + tol
+    half_extent = np.stack([cos * half_dx + sin * half_dy, sin * half_dx + cos * half_dy], axis=1)  # (B, 2)
+    cells_lo = np.floor((boxes[:, :2] - half_extent - xy_min) / cell_size).astype(np.int64)  # (B, 2)
+    cells_hi = np.floor((boxes[:, :2] + half_extent - xy_min) / cell_size).astype(np.int64)  # (B, 2)
+    cells_lo = np.maximum(cells_lo, 0)
+    cells_hi = np.minimum(cells_hi, grid_size - 1)
+    n_columns = np.maximum(cells_hi[:, 0] - cells_lo[:, 0] + 1, 0)  # (B,)
+    n_columns[cells_lo[:, 1] > cells_hi[:, 1]] = 0
+
+    # a segment is a column of cells overlapped by a box, its points are contiguous in the sorted order
+    seg_box_idx = np.repeat(np.arange(n_boxes), n_columns)  # (S,)
+    seg_column = cells_lo[seg_box_idx, 0] + np.arange(seg_box_idx.shape[0]) - \
+        np.repeat(np.cumsum(n_columns) - n_columns, n_columns)
+    seg_start = np.searchsorted(sorted_cells_id, seg_column * grid_size[1] + cells_lo[seg_box_idx, 1], side='left')
+    seg_end = np.searchsorted(sorted_cells_id, seg_column * grid_size[1] + cells_hi[seg_box_idx, 1], side='right')
+    seg_cumsum = np.cumsum(seg_end - seg_start)  # (S,)
+    n_pairs = int(seg_cumsum[-1]) if seg_cumsum.shape[0] > 0 else 0
+    seg_offset = seg_start - (seg_cumsum - (seg_end - seg_start))  # sorted position of a pair = pair_idx + offset
+
+    cos, sin = np.cos(boxes[:, 6]), np.sin(boxes[:, 6])
+    half_size = boxes[:, 3: 6] / 2.0 + tol  # (B, 3)
+    hit_points_idx, hit_boxes_idx, hit_dist = [], [], []
+    for chunk_start in range(0, n_pairs, chunk_size):
+        pairs_idx = np.arange(chunk_start, min(chunk_start + chunk_size, n_pairs))
+        pairs_seg = np.searchsorted(seg_cumsum, pairs_idx, side='right')
+        pairs_box_idx = seg_box_idx[pairs_seg]
+        pairs_points_idx = sorted_points_idx[pairs_idx + seg_offset[pairs_seg]]
+
+        # map points to boxes' local frame
+        offset = points[pairs_points_idx, :3] - boxes[pairs_box_idx, :3]  # (P, 3)
+        local_x = cos[pairs_box_idx] * offset[:, 0] + sin[pairs_box_idx] * offset[:, 1]
+        local_y = -sin[pairs_box_idx] * offset[:, 0] + cos[pairs_box_idx] * offset[:, 1]
+        mask_inside = (np.abs(local_x) <= half_size[pairs_box_idx, 0]) & \
+                      (np.abs(local_y) <= half_size[pairs_box_idx, 1]) & \
+                      (np.abs(offset[:, 2]) <= half_size[pairs_box_idx, 2])
+        hit_points_idx.append(pairs_points_idx[mask_inside])
+        hit_boxes_idx.append(pairs_box_idx[mask_inside])
+        if overlap == 'nearest_center':
+            hit_dist.append(np.sum(offset[mask_inside] ** 2, axis=1))
+
+    if len(hit_points_idx) == 0:
+        return make_output(boxes_to_points, np.zeros(n_boxes, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    hit_points_idx, hit_boxes_idx = np.concatenate(hit_points_idx), np.concatenate(hit_boxes_idx)
 
-    # TODO
-    return boxes_to_points.astype(int)
+    kept_pairs = _resolve_overlap(hit_points_idx, hit_boxes_idx, overlap,
+                                  np.concatenate(hit_dist) if overlap == 'nearest_center' else None)
+    boxes_to_points[hit_points_idx[kept_pairs]] = hit_boxes_idx[kept_pairs]
+    if overlap != 'all':
+        hit_points_idx, hit_boxes_idx = hit_points_idx[kept_pairs], hit_boxes_idx[kept_pairs]
+
+    num_points_in_boxes = np.bincount(hit_boxes_idx, minlength=n_boxes).astype(np.int32)
+    boxes_points_idx = None
+    if return_indices:
+        boxes_points_idx = hit_points_idx[np.lexsort((hit_points_idx, hit_boxes_idx))].astype(np.int32)
+    return make_output(boxes_to_points, num_points_in_boxes, boxes_points_idx)
+
+
+def relabel_kept_boxes(num_points: int, num_points_in_boxes: np.ndarray, boxes_points_idx: np.ndarray,
+                       mask_kept: np.ndarray, overlap: str = 'first', points: np.ndarray = None,
+                       boxes: np.ndarray = None) -> np.ndarray:
+    """
+    Label points with the boxes that are kept after removing some boxes (e.g. boxes having too few points), from the
+    (point, box) pairs of find_points_in_boxes(..., overlap='all', return_indices=True), i.e. without another pass
+    over points. Pairs must come from overlap='all' so that a point labelled with a removed box can be labelled with
+    another box it is inside
+    :param num_points: N, number of points
+    :param num_points_in_boxes: (B,) - number of points inside each box, as returned by find_points_in_boxes
+    :param boxes_points_idx: (sum(num_points_in_boxes),) - indices of points inside each box, as returned by
+        find_points_in_boxes
+    :param mask_kept: (B,) - True for boxes that are kept
+    :param overlap: one of OVERLAP_POLICIES, how points inside several kept boxes are resolved (see
+        find_points_in_boxes)
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]. Required for nearest_center
+    :param boxes: (B, 7[+D]) - boxes before removal. Required for nearest_center
+    :return: (N,) - int32, boxes_to_points[i] = j >=0 means points[i] is in the j-th kept box, -1 for points that
+        are not inside any kept box
+    """
+    assert overlap in OVERLAP_POLICIES, f"{overlap} is not in {OVERLAP_POLICIES}"
+    assert overlap != 'nearest_center' or (points is not None and boxes is not None), \
+        "points & boxes are required for nearest_center"
+    boxes_to_points = -np.ones(num_points, dtype=np.int32)
+    new_box_idx = np.cumsum(mask_kept, dtype=np.int32) - 1  # (B,) - index of each kept box among kept boxes
+    mask_kept_pairs = np.repeat(mask_kept, num_points_in_boxes)
+    pairs_old_box_idx = np.repeat(np.arange(mask_kept.shape[0]), num_points_in_boxes)[mask_kept_pairs]
+    pairs_points_idx = boxes_points_idx[mask_kept_pairs]
+    pairs_dist = None
+    if overlap == 'nearest_center':
+        pairs_dist = np.sum((points[pairs_points_idx, :3] - boxes[pairs_old_box_idx, :3]) ** 2, axis=1)
+    kept_pairs = _resolve_overlap(pairs_points_idx, pairs_old_box_idx, overlap, pairs_dist)
+    boxes_to_points[pairs_points_idx[kept_pairs]] = new_box_idx[pairs_old_box_idx[kept_pairs]]
+    return boxes_to_points
+
+
+def quaternions_yaw(q: np.ndarray) -> np.ndarray:
+    """
+    Vectorized quaternion_yaw: yaw of the x-axis rotated by each quaternion, projected onto the xy plane.
+    Quaternions don't need to be normalized
+    :param q: (..., 4) - w, x, y, z
+    :return: (...) - yaw angles in radians
+    """
+    assert q.shape[-1] == 4, f"expect (..., 4), get {q.shape}"
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    # arctan of the 1st column of the rotation matrix, up to the squared norm of q that cancels out
+    return np.arctan2(2.0 * (w * z + x * y), w * w + x * x - y * y - z * z)
 
 
 def quaternion_yaw(q: Quaternion) -> float:
@@ -0,0 +1,133 @@
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+
+class TiledBEVMap:
+    """
+    Unbounded BEV occupancy & height map built incrementally from point clouds expressed in a fixed frame (e.g. the
+    global frame of a scene). The map is stored as square tiles of tile_size x tile_size pixels that are allocated
+    the first time a point lands in them, so memory grows with the area observed & an update only costs a pass over
+    its points plus the tiles they touch, regardless of the size of the map.
+    Channels are (see TiledBEVMap.channels)
+        - count: number of points
+        - hits: number of updates having at least one point in the pixel, e.g. hits / num_updates is high for static
+            structures & low for places crossed by moving objects
+        - max_height: of points' z, -inf for empty pixels
+    Pixel (gx, gy) covers [gx * resolution, (gx + 1) * resolution) x [gy * resolution, (gy + 1) * resolution) & lives
+    in tile (gx // tile_size, gy // tile_size). Tiles & crops are indexed by [channel, pixel_y, pixel_x]
+    """
+    channels: List[str] = ['count', 'hits', 'max_height']
+    EMPTY_VALUES = np.array([0.0, 0.0, -np.inf], dtype=np.float32)
+
+    def __init__(self, resolution: float = 0.2, tile_size: int = 256,
+                 z_range: Sequence[float] = (-np.inf, np.inf)):
+        """
+        :param resolution: size of a pixel measured by meter
+        :param tile_size: number of pixels of a tile's side
+        :param z_range: (2,) - z_min, z_max. Points outside are dropped
+        """
+        assert resolution > 0, f"resolution must be positive, get {resolution}"
+        assert tile_size > 0, f"tile_size must be positive, get {tile_size}"
+        self.resolution = resolution
+        self.tile_size = tile_size
+        self.z_range = tuple(z_range)
+        self.tiles: Dict[Tuple[int, int], np.ndarray] = dict()  # {(tile_x, tile_y): (n_channels, T, T)}
+        self.num_updates = 0
+        self._empty_tile = self._make_empty((len(self.channels), tile_size, tile_size))
+        self._empty_tile.setflags(write=False)
+
+    def _make_empty(self, shape: Tuple[int, int, int]) -> np.ndarray:
+        out = np.empty(shape, dtype=np.float32)
+        out[...] = self.EMPTY_VALUES[:, np.newaxis, np.newaxis]
+        return out
+
+    def channel_idx(self, name: str) -> int:
+        return self.channels.index(name)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def get_tile(self, tile_xy: Tuple[int, int]) -> np.ndarray:
+        """
+        :param tile_xy: (tile_x, tile_y)
+        :return: (n_channels, T, T) - a read-only empty tile if nothing has landed in this tile yet
+        """
+        return self.tiles.get(tuple(tile_xy), self._empty_tile)
+
+    def update(self, points: np.ndarray) -> int:
+        """
+        Add a point cloud to the map, it counts as one update for the hits channel
+        :param points: (N, 3[+C]) - x, y, z, [C-dim features] | in the frame of the map
+        :return: number of tiles touched
+        """
+        self.num_updates += 1
+        mask_z = (points[:, 2] >= self.z_range[0]) & (points[:, 2] < self.z_range[1])
+        points = points[mask_z] if not np.all(mask_z) else points
+        if points.shape[0] == 0:
+            return 0
+        tile_area = self.tile_size * self.tile_size
+
+        pixels = np.floor(points[:, :2] / self.resolution).astype(np.int64)  # (N, 2)
+        tiles_xy = pixels // self.tile_size  # floor division, also for negative pixels
+        local = pixels - tiles_xy * self.tile_size  # (N, 2) - in [0, T)
+        # 21 bits per axis, i.e. +/- 2^20 tiles around the origin
+        tiles_key = ((tiles_xy[:, 0] + (1 << 20)) << 21) | (tiles_xy[:, 1] + (1 << 20))
+        touched_keys, points_tile_idx = np.unique(tiles_key, return_inverse=True)
+        n_touched = touched_keys.shape[0]
+        # one id space for the pixels of touched tiles
+        pixels_id = points_tile_idx.reshape(-1) * tile_area + local[:, 1] * self.tile_size + local[:, 0]
+
+        count = np.bincount(pixels_id, minlength=n_touched * tile_area)
+        # max height: points sorted by pixel form one segment per occupied pixel
+        order = np.argsort(pixels_id, kind='stable')
+        occupied_pixels_id = np.flatnonzero(count)  # ascending, i.e. in the order of segments
+        segments_start = np.cumsum(count[occupied_pixels_id]) - count[occupied_pixels_id]
+        max_height = np.full(n_touched * tile_area, -np.inf, dtype=np.float32)
+        max_height[occupied_pixels_id] = np.maximum.reduceat(points[order, 2], segments_start)
+
+        count = count.reshape(n_touched, self.tile_size, self.tile_size)
+        max_height = max_height.reshape(n_touched, self.tile_size, self.tile_size)
+        for i, key in enumerate(touched_keys.tolist()):
+            tile_xy = ((key >> 21) - (1 << 20), (key & ((1 << 21) - 1)) - (1 << 20))
+            tile = self.tiles.get(tile_xy)
+            if tile is None:
+                tile = self.tiles[tile_xy] = self._make_empty(self._empty_tile.shape)
+            tile[0] += count[i]
+            tile[1] += count[i] > 0
+            np.maximum(tile[2], max_height[i], out=tile[2])
+        return n_touched
+
+    def crop(self, center: Sequence[float], half_extent: float) -> np.ndarray:
+        """
+        Get the axis-aligned square of the map around a position. If the square lies in a single tile, the crop is a
+        view of that tile (read-only if the tile is not allocated), otherwise it is assembled from the tiles it
+        overlaps, i.e. its cost depends on the size of the crop, not of the map
+        :param center: (2,) - x, y in the frame of the map (e.g. position of the ego vehicle)
+        :param half_extent: half of the crop's side, in meter
+        :return: (n_channels, S, S) - S = round(2 * half_extent / resolution), pixel (0, 0) being @ the minimum x, y
+        """
+        size = int(round(2.0 * half_extent / self.resolution))
+        lo = np.floor((np.asarray(center[:2], dtype=float) - half_extent) / self.resolution).astype(np.int64)  # (2,)
+        hi = lo + size  # exclusive
+        tiles_lo, tiles_hi = lo // self.tile_size, (hi - 1) // self.tile_size  # inclusive
+
+        if np.all(tiles_lo == tiles_hi):
+            tile = self.get_tile((int(tiles_lo[0]), int(tiles_lo[1])))
+            local_lo = lo - tiles_lo * self.tile_size
+            return tile[:, local_lo[1]: local_lo[1] + size, local_lo[0]: local_lo[0] + size]
+
+        out = self._make_empty((len(self.channels), size, size))
+        for tile_x in range(tiles_lo[0], tiles_hi[0] + 1):
+            for tile_y in range(tiles_lo[1], tiles_hi[1] + 1):
+                tile = self.tiles.get((tile_x, tile_y))
+                if tile is None:
+                    continue
+                # overlap of the crop & the tile, in map's pixels
+                tile_lo = np.array([tile_x, tile_y]) * self.tile_size
+                overlap_lo = np.maximum(lo, tile_lo)
+                overlap_hi = np.minimum(hi, tile_lo + self.tile_size)
+                out[:, overlap_lo[1] - lo[1]: overlap_hi[1] - lo[1], overlap_lo[0] - lo[0]: overlap_hi[0] - lo[0]] = \
+                    tile[:, overlap_lo[1] - tile_lo[1]: overlap_hi[1] - tile_lo[1],
+                         overlap_lo[0] - tile_lo[0]: overlap_hi[0] - tile_lo[0]]
+        return out
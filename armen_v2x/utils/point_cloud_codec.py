@@ -0,0 +1,155 @@
+import lzma
+import struct
+import zlib
+import numpy as np
+from typing import BinaryIO, Iterator, Sequence
+
+
+class PointCloudCodec:
+    """
+    Compact on-wire format for exchanging point clouds between agents. x, y, z are quantized to int16 within
+    point_cloud_range & intensity to uint8 within intensity_range, i.e. 7 bytes per point instead of 16 (or 20 in
+    .pcd.bin files). Points outside the ranges are clamped to them.
+    Columns are stored one after another. With sort_by_voxel, points are reordered by their quantized coordinate & each
+    column is delta-encoded, which makes it much more compressible by zlib or lzma. The order of points is then
+    not preserved.
+    A message is: header (magic, version, flags, number of points, ranges), then the payload, optionally compressed.
+    """
+    MAGIC = b'V2XP'
+    VERSION = 1
+    # magic, version, flags (bit 0: sorted & delta-encoded, bits 1-2: compression), n_points, range (6), intensity (2)
+    HEADER = struct.Struct('<4sBBI8f')
+    COMPRESSIONS = (None, 'zlib', 'lzma')
+
+    def __init__(self, point_cloud_range: Sequence[float], intensity_range: Sequence[float] = (0.0, 255.0),
+                 compression: str = 'zlib', sort_by_voxel: bool = True, compression_level: int = 6):
+        """
+        :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+        :param intensity_range: (2) - intensity_min, intensity_max
+        :param compression: one of PointCloudCodec.COMPRESSIONS
+        :param sort_by_voxel: to sort points by quantized coordinate & delta-encode them before compression
+        :param compression_level: 0-9, for zlib & lzma
+        """
+        assert compression in self.COMPRESSIONS, f"{compression} is not in {self.COMPRESSIONS}"
+        self.point_cloud_range = np.asarray(point_cloud_range, dtype=np.float32)
+        self.intensity_range = np.asarray(intensity_range, dtype=np.float32)
+        assert self.point_cloud_range.shape == (6,), f"{self.point_cloud_range.shape} != (6,)"
+        assert np.all(self.point_cloud_range[3:] > self.point_cloud_range[:3]), "invalid point_cloud_range"
+        assert self.intensity_range[1] > self.intensity_range[0], "invalid intensity_range"
+        self.compression = compression
+        self.sort_by_voxel = sort_by_voxel
+        self.compression_level = compression_level
+
+    @staticmethod
+    def _get_scales(point_cloud_range: np.ndarray, intensity_range: np.ndarray) -> np.ndarray:
+        # (4,) - size of a quantization step of x, y, z, intensity. Quantization & dequantization are done in float64,
+        # so their only error is the rounding to a step
+        return np.concatenate([(point_cloud_range[3:].astype(np.float64) - point_cloud_range[:3]) / 65535.0,
+                               [(intensity_range[1].astype(np.float64) - intensity_range[0]) / 255.0]])
+
+    @property
+    def steps(self) -> np.ndarray:
+        """
+        :return: (4,) - size of a quantization step of x, y, z, intensity
+        """
+        return self._get_scales(self.point_cloud_range, self.intensity_range)
+
+    @property
+    def max_error(self) -> np.ndarray:
+        """
+        :return: (4,) - max round-trip error of x, y, z, intensity for points inside the ranges, i.e. half a
+            quantization step plus the rounding of decoded values to float32
+        """
+        max_abs = np.maximum(np.abs(np.append(self.point_cloud_range[:3], self.intensity_range[0])),
+                             np.abs(np.append(self.point_cloud_range[3:], self.intensity_range[1])))  # (4,) - float32
+        return self.steps / 2.0 + np.spacing(max_abs) / 2.0
+
+    def encode(self, points: np.ndarray) -> bytes:
+        """
+        :param points: (N, 4) - x, y, z, intensity
+        :return: message
+        """
+        assert points.ndim == 2 and points.shape[1] == 4, f"expect (N, 4), get {points.shape}"
+        scales = self._get_scales(self.point_cloud_range, self.intensity_range)
+        xyz = np.rint((points[:, :3] - self.point_cloud_range[:3].astype(np.float64)) / scales[:3])
+        xyz = (np.clip(xyz, 0, 65535).astype(np.int32) - 32768).astype(np.int16)  # (N, 3)
+        intensity = np.rint((points[:, 3] - self.intensity_range[0].astype(np.float64)) / scales[3])
+        intensity = np.clip(intensity, 0, 255).astype(np.uint8)  # (N,)
+
+        if self.sort_by_voxel:
+            order = np.lexsort((xyz[:, 2], xyz[:, 1], xyz[:, 0]))
+            xyz, intensity = xyz[order], intensity[order]
+            # deltas wrap around on 16 bits, which cumsum on 16 bits reverts exactly
+            xyz = np.diff(xyz.view(np.uint16), axis=0, prepend=np.zeros((1, 3), dtype=np.uint16))
+        payload = np.ascontiguousarray(xyz.T).tobytes() + intensity.tobytes()
+
+        flags = int(self.sort_by_voxel) | (self.COMPRESSIONS.index(self.compression) << 1)
+        if self.compression == 'zlib':
+            payload = zlib.compress(payload, self.compression_level)
+        elif self.compression == 'lzma':
+            payload = lzma.compress(payload, preset=self.compression_level)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, flags, points.shape[0], *self.point_cloud_range,
+                                  *self.intensity_range)
+        return header + payload
+
+    @classmethod
+    def decode(cls, message: bytes) -> np.ndarray:
+        """
+        Decode a message. Ranges & compression are read from the message, so any codec can decode it
+        :param message:
+        :return: (N, 4) - x, y, z, intensity | float32
+        """
+        magic, version, flags, n_points, *ranges = cls.HEADER.unpack_from(message)
+        assert magic == cls.MAGIC, f"not a point cloud message, magic: {magic}"
+        assert version == cls.VERSION, f"unsupported version {version}"
+        point_cloud_range = np.array(ranges[:6], dtype=np.float32)
+        intensity_range = np.array(ranges[6:], dtype=np.float32)
+        payload = message[cls.HEADER.size:]
+        compression = cls.COMPRESSIONS[flags >> 1]
+        if compression == 'zlib':
+            payload = zlib.decompress(payload)
+        elif compression == 'lzma':
+            payload = lzma.decompress(payload)
+
+        xyz = np.frombuffer(payload, dtype=np.uint16, count=3 * n_points).reshape(3, n_points).T  # (N, 3)
+        intensity = np.frombuffer(payload, dtype=np.uint8, count=n_points, offset=6 * n_points)
+        if flags & 1:
+            xyz = np.cumsum(xyz, axis=0, dtype=np.uint16)
+
+        scales = cls._get_scales(point_cloud_range, intensity_range)
+        points = np.empty((n_points, 4), dtype=np.float32)
+        # in both layouts, xyz now holds the bits of the int16 quantized coordinate
+        points[:, :3] = (xyz.view(np.int16) + 32768.0) * scales[:3] + point_cloud_range[:3].astype(np.float64)
+        points[:, 3] = intensity * scales[3] + intensity_range[0].astype(np.float64)
+        return points
+
+    def encode_to_stream(self, f: BinaryIO, points: np.ndarray, chunk_size: int = 1 << 16) -> int:
+        """
+        Write points to a stream as a sequence of length-prefixed messages of at most chunk_size points, so the
+        receiver can decode chunks as they arrive
+        :param f: binary file-like object
+        :param points: (N, 4) - x, y, z, intensity
+        :param chunk_size: max number of points per message
+        :return: number of bytes written
+        """
+        assert chunk_size > 0, f"chunk_size must be positive, get {chunk_size}"
+        n_bytes = 0
+        for start in range(0, points.shape[0], chunk_size):
+            message = self.encode(points[start: start + chunk_size])
+            f.write(struct.pack('<I', len(message)))
+            f.write(message)
+            n_bytes += 4 + len(message)
+        return n_bytes
+
+    @classmethod
+    def decode_from_stream(cls, f: BinaryIO) -> Iterator[np.ndarray]:
+        """
+        Read messages written by encode_to_stream until the end of the stream
+        :param f: binary file-like object
+        :return: iterator of chunks (N_chunk, 4) - x, y, z, intensity
+        """
+        while True:
+            length = f.read(4)
+            if len(length) < 4:
+                return
+            yield cls.decode(f.read(struct.unpack('<I', length)[0]))
@@ -0,0 +1,212 @@
+import csv
+import json
+import threading
+import time
+import functools
+import numpy as np
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, List, Union
+
+
+class _Stage:
+    """
+    Measure one execution of a stage. Use it through Profiler.stage
+    """
+    __slots__ = ('profiler', 'name', 'agent', 'nbytes_read', 'nbytes_allocated', 'tic')
+
+    def __init__(self, profiler: 'Profiler', name: str, agent: Hashable):
+        self.profiler = profiler
+        self.name = name
+        self.agent = agent
+        self.nbytes_read = 0
+        self.nbytes_allocated = 0
+
+    def add_bytes_read(self, nbytes: int) -> None:
+        self.nbytes_read += int(nbytes)
+
+    def add_allocated(self, *arrays: np.ndarray) -> None:
+        self.nbytes_allocated += sum(int(array.nbytes) for array in arrays)
+
+    def __enter__(self) -> '_Stage':
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.record(self.name, self.agent, time.perf_counter() - self.tic, self.nbytes_read,
+                             self.nbytes_allocated)
+
+
+class _NullStage:
+    """
+    Stand-in for _Stage when the profiler is disabled, every method is a no-op
+    """
+    __slots__ = ()
+
+    def add_bytes_read(self, nbytes: int) -> None:
+        pass
+
+    def add_allocated(self, *arrays: np.ndarray) -> None:
+        pass
+
+    def __enter__(self) -> '_NullStage':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _AgentScope:
+    __slots__ = ('local', 'agent', 'prev_agent')
+
+    def __init__(self, local: threading.local, agent: Hashable):
+        self.local = local
+        self.agent = agent
+
+    def __enter__(self) -> None:
+        self.prev_agent = getattr(self.local, 'agent', None)
+        self.local.agent = self.agent
+
+    def __exit__(self, *exc) -> None:
+        self.local.agent = self.prev_agent
+
+
+class Profiler:
+    """
+    Opt-in registry of per-stage measurements: wall time, bytes read from disk & bytes of allocated arrays, recorded
+    per stage & per agent. Stages are delimited by a context manager or a decorator
+        with PROFILER.stage('get_point_cloud') as stage:
+            ...
+            stage.add_bytes_read(points.nbytes)
+
+        @PROFILER.profiled('get_annotated_boxes')
+        def get_annotated_boxes(...): ...
+    Stages opened inside `with PROFILER.agent(j):` are attributed to agent j, in the current thread only.
+    When disabled (the default), stage & agent return a shared no-op object, i.e. the cost is an attribute check.
+    Recording is serialized by a lock, so a profiler can be shared by the threads of a process.
+    """
+    # bin edges of wall time histograms, in second: 4 bins per decade from 1 micro second to 100 second
+    HISTOGRAM_EDGES = np.logspace(-6, 2, 33)
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # {(stage, agent): {'time': [float], 'nbytes_read': [int], 'nbytes_allocated': [int]}}
+        self.records = defaultdict(lambda: {'time': [], 'nbytes_read': [], 'nbytes_allocated': []})
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+    def stage(self, name: str, agent: Hashable = None) -> Union[_Stage, _NullStage]:
+        """
+        :param name: name of the stage
+        :param agent: agent the stage works for. Default: the one of the enclosing PROFILER.agent scope, if any
+        :return: context manager measuring the stage
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, agent if agent is not None else getattr(self._local, 'agent', None))
+
+    def agent(self, agent: Hashable) -> Union[_AgentScope, _NullStage]:
+        """
+        :param agent: e.g. the index j of LIDAR_TOP_id_j
+        :return: context manager attributing stages opened in the current thread to agent
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _AgentScope(self._local, agent)
+
+    def profiled(self, name: str = None) -> Callable:
+        """
+        Decorator measuring every call of a function as a stage
+        :param name: name of the stage. Default: the function's name
+        """
+        def decorator(fn: Callable) -> Callable:
+            stage_name = name if name is not None else fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.stage(stage_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, agent: Hashable, wall_time: float, nbytes_read: int = 0,
+               nbytes_allocated: int = 0) -> None:
+        with self._lock:
+            entry = self.records[(name, agent)]
+            entry['time'].append(wall_time)
+            entry['nbytes_read'].append(nbytes_read)
+            entry['nbytes_allocated'].append(nbytes_allocated)
+
+    def summary(self) -> List[Dict[str, Union[str, int, float, list]]]:
+        """
+        Aggregate measurements
+        :return: [{
+            stage, agent, count,
+            total_s, mean_s, p50_s, p90_s, p99_s, max_s: wall time statistics, in second
+            nbytes_read, nbytes_allocated: totals over calls
+            histogram: counts of calls in the bins of Profiler.HISTOGRAM_EDGES
+        }] - one entry per (stage, agent), sorted by stage then agent
+        """
+        with self._lock:
+            items = [(key, {k: np.array(v) for k, v in entry.items()}) for key, entry in self.records.items()]
+        out = []
+        for (name, agent), entry in sorted(items, key=lambda item: (item[0][0], str(item[0][1]))):
+            times = entry['time']
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            out.append({
+                'stage': name,
+                'agent': agent if agent is None else str(agent),
+                'count': int(times.shape[0]),
+                'total_s': float(times.sum()),
+                'mean_s': float(times.mean()),
+                'p50_s': float(p50),
+                'p90_s': float(p90),
+                'p99_s': float(p99),
+                'max_s': float(times.max()),
+                'nbytes_read': int(entry['nbytes_read'].sum()),
+                'nbytes_allocated': int(entry['nbytes_allocated'].sum()),
+                'histogram': np.histogram(np.clip(times, self.HISTOGRAM_EDGES[0], self.HISTOGRAM_EDGES[-1]),
+                                          self.HISTOGRAM_EDGES)[0].tolist()
+            })
+        return out
+
+    def save_json(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump({'histogram_edges_s': self.HISTOGRAM_EDGES.tolist(), 'stages': self.summary()}, f, indent=2)
+
+    def save_csv(self, path: str) -> None:
+        """
+        Save the summary without histograms, one row per (stage, agent)
+        """
+        rows = self.summary()
+        fieldnames = [key for key in rows[0].keys() if key != 'histogram'] if len(rows) > 0 else ['stage']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def print_summary(self) -> None:
+        print(f"{'stage':<32} {'agent':>6} {'count':>7} {'total (s)':>10} {'mean (ms)':>10} {'p90 (ms)':>9} "
+              f"{'read (MB)':>10} {'alloc (MB)':>11}")
+        for row in self.summary():
+            print(f"{row['stage']:<32} {str(row['agent']):>6} {row['count']:>7} {row['total_s']:>10.3f} "
+                  f"{row['mean_s'] * 1e3:>10.3f} {row['p90_s'] * 1e3:>9.3f} {row['nbytes_read'] / 2 ** 20:>10.2f} "
+                  f"{row['nbytes_allocated'] / 2 ** 20:>11.2f}")
+
+
+# profiler shared by the data path, enable it with PROFILER.enable()
+PROFILER = Profiler()
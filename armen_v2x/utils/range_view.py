@@ -0,0 +1,144 @@
+import numpy as np
+from typing import List, Sequence, Tuple
+from armen_v2x.utils.geometry import perspective_projection_batch
+
+
+def get_nearest_per_pixel(pixels_id: np.ndarray, depth: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Z-buffer: find the nearest point of each occupied pixel. Pixel id & depth are packed into one int64 key (the bits
+    of a non-negative float32 sort like the float itself), so after a single argsort the nearest point of a pixel is
+    the first one of its segment
+    :param pixels_id: (N,) - linear id of the pixel each point lands in, in [0, 2^31)
+    :param depth: (N,) - non-negative distance used to compare points of the same pixel, at float32 precision
+    :return:
+        - occupied_pixels_id: (P,) - ascending
+        - nearest_idx: (P,) - index (in pixels_id) of the nearest point of each occupied pixel
+    """
+    keys = (pixels_id.astype(np.int64) << 32) | depth.astype(np.float32).view(np.uint32).astype(np.int64)
+    order = np.argsort(keys)
+    sorted_pixels_id = keys[order] >> 32
+    mask_first = np.ones(sorted_pixels_id.shape[0], dtype=bool)
+    mask_first[1:] = sorted_pixels_id[1:] != sorted_pixels_id[:-1]
+    return sorted_pixels_id[mask_first], order[mask_first]
+
+
+def get_depth_maps(points: np.ndarray, camera_intrinsics: np.ndarray, cams_from_points: np.ndarray,
+                   image_size: Sequence[int], min_depth: float = 1e-3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rasterize points into a sparse depth map per camera, the nearest point wins when several points land in the
+    same pixel. Every camera shares the same image size
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param camera_intrinsics: (M, 3, 3)
+    :param cams_from_points: (M, 4, 4) - transformation mapping points to each camera's frame
+    :param image_size: (2,) - width, height
+    :param min_depth: points closer to the image plane than this (in meter) are dropped
+    :return:
+        - depth_maps: (M, H, W) - z in camera's frame | float32, 0 for empty pixels
+        - points_idx: (M, H, W) - index of the point producing each pixel, -1 for empty pixels
+    """
+    width, height = int(image_size[0]), int(image_size[1])
+    n_cams = camera_intrinsics.shape[0]
+    assert n_cams * height * width < 2 ** 31, "too many pixels for get_nearest_per_pixel"
+    pixels_coord, depth, mask_valid = perspective_projection_batch(
+        points, camera_intrinsics, cams_from_points, np.tile([width, height], (n_cams, 1)), min_depth)
+
+    cam_idx, points_idx = np.nonzero(mask_valid)  # valid (camera, point) pairs
+    pixels = np.floor(pixels_coord[cam_idx, points_idx]).astype(np.int64)  # (V, 2)
+    # one id space for the pixels of all cameras
+    pixels_id = (cam_idx * height + pixels[:, 1]) * width + pixels[:, 0]
+    occupied_pixels_id, nearest_idx = get_nearest_per_pixel(pixels_id, depth[cam_idx, points_idx])
+
+    depth_maps = np.zeros(n_cams * height * width, dtype=np.float32)
+    depth_maps[occupied_pixels_id] = depth[cam_idx[nearest_idx], points_idx[nearest_idx]]
+    points_idx_maps = np.full(n_cams * height * width, -1, dtype=np.int64)
+    points_idx_maps[occupied_pixels_id] = points_idx[nearest_idx]
+    return depth_maps.reshape(n_cams, height, width), points_idx_maps.reshape(n_cams, height, width)
+
+
+class RangeImageProjector:
+    """
+    Project a LiDAR's point cloud onto its spherical range image: one row per beam, one column per azimuth bin.
+    Beams are assumed evenly spaced in elevation between fov_down & fov_up, which is the case of the simulated
+    LiDARs of V2X-Sim. The nearest point wins when several points land in the same pixel.
+    Channels are (see RangeImageProjector.channels) range, then the coordinates of points, i.e. x, y, z, [intensity,
+    ...]. Images are indexed by [channel, row, column], row 0 being the top beam & column 0 being azimuth pi, columns
+    going clockwise
+    """
+
+    def __init__(self, num_beams: int = 32, width: int = 1024, fov_up: float = 10.0, fov_down: float = -30.0,
+                 num_point_features: int = 4):
+        """
+        :param num_beams: number of rows
+        :param width: number of azimuth bins
+        :param fov_up: elevation of the top beam, in degree. Default: CARLA's default LiDAR
+        :param fov_down: elevation of the bottom beam, in degree. Default: CARLA's default LiDAR
+        :param num_point_features: number of points' coordinates copied to the range image (e.g. 4 for x, y, z,
+            intensity)
+        """
+        assert num_beams > 1, f"num_beams must be larger than 1, get {num_beams}"
+        assert fov_up > fov_down, f"fov_up ({fov_up}) must be larger than fov_down ({fov_down})"
+        self.num_beams = num_beams
+        self.width = width
+        self.fov_up = np.deg2rad(fov_up)
+        self.fov_down = np.deg2rad(fov_down)
+        self.num_point_features = num_point_features
+        self.channels: List[str] = ['range'] + ['x', 'y', 'z', 'intensity'][:num_point_features] + \
+            [f'feature_{c}' for c in range(4, num_point_features)]
+
+    @property
+    def output_shape(self) -> Tuple[int, int, int]:
+        return len(self.channels), self.num_beams, self.width
+
+    def channel_idx(self, name: str) -> int:
+        return self.channels.index(name)
+
+    def get_pixels(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param points: (N, 3[+C]) - x, y, z, [C-dim features] | in LiDAR's frame
+        :return:
+            - rows: (N,)
+            - columns: (N,)
+            - ranges: (N,) - distance to the LiDAR
+        """
+        ranges = np.linalg.norm(points[:, :3], axis=1)
+        elevation = np.arcsin(points[:, 2] / np.maximum(ranges, 1e-6))
+        azimuth = np.arctan2(points[:, 1], points[:, 0])
+        rows = np.rint((self.fov_up - elevation) / (self.fov_up - self.fov_down) * (self.num_beams - 1)) \
+            .astype(np.int64)
+        columns = np.floor(0.5 * (1.0 - azimuth / np.pi) * self.width).astype(np.int64)
+        np.clip(columns, 0, self.width - 1, out=columns)  # azimuth = -pi lands on width
+        return rows, columns, ranges
+
+    def __call__(self, points: np.ndarray, out: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param points: (N, 3[+C]) - x, y, z, [C-dim features] | in LiDAR's frame
+        :param out: (n_channels, H, W) - C-contiguous float32 buffer to write the range image to
+        :return:
+            - range_image: (n_channels, H, W) - 0 for empty pixels, out if it is provided
+            - points_idx: (H, W) - index of the point producing each pixel, -1 for empty pixels
+        """
+        assert points.shape[1] >= self.num_point_features, \
+            f"expect points has at least {self.num_point_features} coord, get: {points.shape[1]}"
+        if out is None:
+            out = np.zeros(self.output_shape, dtype=np.float32)
+        else:
+            assert out.shape == self.output_shape, f"expect out of shape {self.output_shape}, get {out.shape}"
+            assert out.dtype == np.float32, f"expect out of dtype float32, get {out.dtype}"
+            # otherwise the reshape below would be a copy & the range image would not be written to out
+            assert out.flags.c_contiguous, "out must be C-contiguous"
+            out.fill(0)
+        n_pixels = self.num_beams * self.width
+        flat_out = out.reshape(len(self.channels), n_pixels)
+
+        rows, columns, ranges = self.get_pixels(points)
+        mask_inside = (rows >= 0) & (rows < self.num_beams) & (ranges > 0)
+        points_idx = np.flatnonzero(mask_inside)
+        occupied_pixels_id, nearest_idx = get_nearest_per_pixel(
+            rows[mask_inside] * self.width + columns[mask_inside], ranges[mask_inside])
+        points_idx = points_idx[nearest_idx]
+
+        flat_out[0, occupied_pixels_id] = ranges[points_idx]
+        flat_out[1:, occupied_pixels_id] = points[points_idx, :self.num_point_features].T
+        points_idx_map = np.full(n_pixels, -1, dtype=np.int64)
+        points_idx_map[occupied_pixels_id] = points_idx
+        return out, points_idx_map.reshape(self.num_beams, self.width)
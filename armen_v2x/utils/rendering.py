@@ -0,0 +1,306 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from typing import Sequence, Union
+from armen_v2x.utils.geometry import boxes_to_corners, apply_tf
+from armen_v2x.utils.range_view import get_nearest_per_pixel, get_depth_maps
+from armen_v2x.utils.bev import get_pixels_id
+
+
+# pairs of corners (see geometry.boxes_to_corners) forming the edges of a box
+BOX_EDGES = np.array([
+    [0, 1], [1, 2], [2, 3], [3, 0],  # front
+    [4, 5], [5, 6], [6, 7], [7, 4],  # back
+    [0, 4], [1, 5], [2, 6], [3, 7],  # connecting front & back
+    [0, 2], [1, 3]  # denote forward face
+])
+# pairs of corners forming the BEV footprint of a box, i.e. its top face
+BOX_BEV_EDGES = np.array([[0, 1], [1, 5], [5, 4], [4, 0]])
+
+
+def get_lod_indices(n_points: int, max_points: int = None, seed: int = 0) -> np.ndarray:
+    """
+    Level of detail: pick a random subset of points to display, the same one for the same (n_points, seed)
+    :param n_points:
+    :param max_points: max number of points to display. If None or not smaller than n_points, every point is kept
+    :param seed:
+    :return: (M,) - ascending indices of points to display
+    """
+    if max_points is None or n_points <= max_points:
+        return np.arange(n_points)
+    return np.sort(np.random.default_rng(seed).choice(n_points, size=max_points, replace=False))
+
+
+def to_uint8_colors(colors: np.ndarray) -> np.ndarray:
+    """
+    :param colors: (..., 3) - r, g, b in [0, 1] if float, in [0, 255] if integer
+    :return: (..., 3) - uint8
+    """
+    colors = np.asarray(colors)
+    if np.issubdtype(colors.dtype, np.floating):
+        return np.clip(colors * 255.0 + 0.5, 0, 255).astype(np.uint8)
+    return colors.astype(np.uint8)
+
+
+def colorize(values: np.ndarray, vmin: float, vmax: float, cmap: str = 'rainbow') -> np.ndarray:
+    """
+    Map values to colors with a matplotlib colormap, looked up as a (256, 3) table
+    :param values: (N,)
+    :param vmin: value mapped to the first color
+    :param vmax: value mapped to the last color
+    :param cmap: name of a matplotlib colormap
+    :return: (N, 3) - uint8
+    """
+    # plt.get_cmap was removed in matplotlib 3.9, colormaps are attributes of plt.cm in every version
+    lut = to_uint8_colors(getattr(plt.cm, cmap)(np.linspace(0.0, 1.0, 256))[:, :3])  # (256, 3)
+    idx = np.clip((values - vmin) / max(vmax - vmin, 1e-6) * 255.0, 0, 255).astype(np.int64)
+    return lut[idx]
+
+
+def draw_segments(image: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                  colors: Union[np.ndarray, Sequence[int]]) -> np.ndarray:
+    """
+    Draw 1-pixel-wide segments on an image, in place. Segments are clipped to the image (Liang-Barsky), then sampled
+    once per pixel along their longer axis, all segments at once
+    :param image: (H, W, 3) - uint8
+    :param starts: (S, 2) - pixel_x, pixel_y of segments' start
+    :param ends: (S, 2) - pixel_x, pixel_y of segments' end
+    :param colors: (S, 3) or (3,) - uint8
+    :return: image
+    """
+    colors = np.broadcast_to(to_uint8_colors(colors), (starts.shape[0], 3))
+    size = np.array([image.shape[1], image.shape[0]], dtype=float)  # (2,) - W, H
+    directions = ends - starts  # (S, 2)
+    t_min, t_max = np.zeros(starts.shape[0]), np.ones(starts.shape[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(2):
+            t_lo = (0.0 - starts[:, i]) / directions[:, i]
+            t_hi = (size[i] - 1.0 - starts[:, i]) / directions[:, i]
+            parallel = directions[:, i] == 0
+            t_lo[parallel] = np.where((starts[parallel, i] >= 0) & (starts[parallel, i] <= size[i] - 1), -np.inf,
+                                      np.inf)
+            t_hi[parallel] = np.inf  # segments parallel to an axis & outside the image get t_min = inf
+            t_min = np.maximum(t_min, np.minimum(t_lo, t_hi))
+            t_max = np.minimum(t_max, np.maximum(t_lo, t_hi))
+    mask_visible = t_min <= t_max
+    starts, directions, colors = starts[mask_visible], directions[mask_visible], colors[mask_visible]
+    t_min, t_max = t_min[mask_visible, np.newaxis], t_max[mask_visible, np.newaxis]
+    starts, ends = starts + t_min * directions, starts + t_max * directions
+
+    n_samples = np.ceil(np.abs(ends - starts).max(axis=1)).astype(np.int64) + 1  # (S',)
+    seg_idx = np.repeat(np.arange(n_samples.shape[0]), n_samples)
+    step = np.arange(seg_idx.shape[0]) - np.repeat(np.cumsum(n_samples) - n_samples, n_samples)
+    t = step / np.maximum(n_samples[seg_idx] - 1, 1)
+    pixels = np.rint(starts[seg_idx] + t[:, np.newaxis] * (ends[seg_idx] - starts[seg_idx])).astype(np.int64)
+    np.clip(pixels, 0, size.astype(np.int64) - 1, out=pixels)
+    image[pixels[:, 1], pixels[:, 0]] = colors[seg_idx]
+    return image
+
+
+def render_bev(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float, boxes: np.ndarray = None,
+               point_colors: np.ndarray = None, box_colors: np.ndarray = None, max_points: int = None,
+               background: Sequence[int] = (0, 0, 0)) -> np.ndarray:
+    """
+    Render a point cloud & boxes seen from above without any figure, the highest point of a pixel gives its color.
+    Image's x axis is the point cloud's x axis & image's up is the point cloud's y axis
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max. Points outside are not drawn
+    :param resolution: size of a pixel measured by meter
+    :param boxes: (B, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [...]
+    :param point_colors: (N, 3) - r, g, b. Default: color by height
+    :param box_colors: (B, 3) - r, g, b. Default: red
+    :param max_points: max number of points drawn, see get_lod_indices
+    :param background: color of empty pixels
+    :return: (H, W, 3) - uint8
+    """
+    point_cloud_range = np.asarray(point_cloud_range, dtype=float)
+    width, height = np.ceil((point_cloud_range[3: 5] - point_cloud_range[:2]) / resolution).astype(np.int64)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[...] = to_uint8_colors(np.asarray(background))
+
+    points_idx = get_lod_indices(points.shape[0], max_points)
+    pixels = np.floor((points[points_idx, :2] - point_cloud_range[:2]) / resolution).astype(np.int64)  # (M, 2)
+    z = points[points_idx, 2]
+    mask_inside = np.all((pixels >= 0) & (pixels < [width, height]), axis=1) & (z >= point_cloud_range[2]) \
+        & (z < point_cloud_range[5])
+    pixels, z, points_idx = pixels[mask_inside], z[mask_inside], points_idx[mask_inside]
+    # image's row 0 is y_max
+    pixels_id = (height - 1 - pixels[:, 1]) * width + pixels[:, 0]
+    occupied_pixels_id, top_idx = get_nearest_per_pixel(pixels_id, point_cloud_range[5] - z)
+    if point_colors is None:
+        colors = colorize(z[top_idx], point_cloud_range[2], point_cloud_range[5])
+    else:
+        colors = to_uint8_colors(point_colors[points_idx[top_idx]])
+    image.reshape(-1, 3)[occupied_pixels_id] = colors
+
+    if boxes is not None and boxes.shape[0] > 0:
+        draw_boxes_bev(image, boxes, point_cloud_range, resolution, box_colors)
+    return image
+
+
+def draw_boxes_bev(image: np.ndarray, boxes: np.ndarray, point_cloud_range: np.ndarray, resolution: float,
+                   colors: np.ndarray = None, fill_alpha: float = 0.0) -> np.ndarray:
+    """
+    Draw the footprint of boxes on a BEV image made by render_bev or make_bev_img, in place: the outline, a heading
+    segment from the center to the forward edge &, if fill_alpha > 0, the inside blended with boxes' color.
+    Pixels inside footprints are enumerated for all boxes at once, from the bounding rectangle of each footprint
+    :param image: (H, W, 3) - uint8, row 0 being @ y_max
+    :param boxes: (B, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [...]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :param colors: (B, 3) - r, g, b. Default: red
+    :param fill_alpha: opacity of the inside of footprints, in [0, 1]
+    :return: image
+    """
+    height = image.shape[0]
+    point_cloud_range = np.asarray(point_cloud_range, dtype=float)
+    colors = np.array([[255, 0, 0]]) if colors is None else to_uint8_colors(colors)
+    colors = np.broadcast_to(colors, (boxes.shape[0], 3))
+
+    def to_pixels(xy: np.ndarray) -> np.ndarray:
+        # continuous pixel coordinate, pixel centers being at integers
+        pixels_coord = (xy - point_cloud_range[:2]) / resolution - 0.5
+        pixels_coord[..., 1] = height - 1 - pixels_coord[..., 1]
+        return pixels_coord
+
+    corners = boxes_to_corners(boxes)[:, :, :2]  # (B, 8, 2)
+    if fill_alpha > 0:
+        footprints = to_pixels(corners[:, BOX_BEV_EDGES[:, 0]])  # (B, 4, 2)
+        lo = np.clip(np.floor(footprints.min(axis=1)), 0, [image.shape[1] - 1, height - 1]).astype(np.int64)
+        hi = np.clip(np.ceil(footprints.max(axis=1)), 0, [image.shape[1] - 1, height - 1]).astype(np.int64)
+        rect_size = hi - lo + 1  # (B, 2)
+        n_pixels = rect_size[:, 0] * rect_size[:, 1]  # (B,)
+        box_idx = np.repeat(np.arange(boxes.shape[0]), n_pixels)
+        local_idx = np.arange(box_idx.shape[0]) - np.repeat(np.cumsum(n_pixels) - n_pixels, n_pixels)
+        columns = lo[box_idx, 0] + local_idx % rect_size[box_idx, 0]
+        rows = lo[box_idx, 1] + local_idx // rect_size[box_idx, 0]
+        # pixels' center in boxes' frame
+        x = point_cloud_range[0] + (columns + 0.5) * resolution - boxes[box_idx, 0]
+        y = point_cloud_range[1] + (height - rows - 0.5) * resolution - boxes[box_idx, 1]
+        cos, sin = np.cos(boxes[box_idx, 6]), np.sin(boxes[box_idx, 6])
+        mask_inside = (np.abs(cos * x + sin * y) <= boxes[box_idx, 3] / 2.0) \
+            & (np.abs(-sin * x + cos * y) <= boxes[box_idx, 4] / 2.0)
+        rows, columns, box_idx = rows[mask_inside], columns[mask_inside], box_idx[mask_inside]
+        image[rows, columns] = ((1.0 - fill_alpha) * image[rows, columns] + fill_alpha * colors[box_idx]) \
+            .astype(np.uint8)
+
+    # footprint's edges, then a heading segment from the center to the middle of the forward edge
+    starts = np.concatenate([corners[:, BOX_BEV_EDGES[:, 0]], boxes[:, np.newaxis, :2]], axis=1)  # (B, 5, 2)
+    ends = np.concatenate([corners[:, BOX_BEV_EDGES[:, 1]], corners[:, [0, 1]].mean(axis=1, keepdims=True)], axis=1)
+    draw_segments(image, to_pixels(starts.reshape(-1, 2)), to_pixels(ends.reshape(-1, 2)),
+                  np.repeat(colors, starts.shape[1], axis=0))
+    return image
+
+
+def make_bev_img(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float,
+                 points_cls: np.ndarray = None, boxes: np.ndarray = None, class_colors: np.ndarray = None,
+                 fill_alpha: float = 0.3, intensity_range: Sequence[float] = (0.0, 1.0)) -> np.ndarray:
+    """
+    Compose the BEV image used for label QA from layers, without any figure
+        - occupancy & intensity: occupied pixels are gray, brighter for higher mean intensity
+        - class: pixels having foreground points (points_cls > -1) take the color of the largest class among them
+        - boxes: footprints filled & outlined with the color of their class
+    Image's x axis is the point cloud's x axis & image's up is the point cloud's y axis
+    :param points: (N, 3[+C]) - x, y, z, [intensity, ...]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max. Points outside are not drawn
+    :param resolution: size of a pixel measured by meter
+    :param points_cls: (N,) - class index of points, -1 for background
+    :param boxes: (B, 7[+1]) - center_x, center_y, center_z, dx, dy, dz, yaw, [class_index]
+    :param class_colors: (n_classes, 3) - r, g, b of each class. Required if points_cls or boxes' class is given
+    :param fill_alpha: opacity of boxes' footprint
+    :param intensity_range: intensity mapped to the darkest & the brightest gray
+    :return: (H, W, 3) - uint8
+    """
+    point_cloud_range = np.asarray(point_cloud_range, dtype=float)
+    pixels_id, mask_inside, bev_size = get_pixels_id(points, point_cloud_range, resolution)
+    width, height = int(bev_size[0]), int(bev_size[1])
+    # image's row 0 is y_max
+    pixels_id = (height - 1 - pixels_id // width) * width + pixels_id % width
+    n_pixels = width * height
+    image = np.zeros((n_pixels, 3), dtype=np.uint8)
+
+    count = np.bincount(pixels_id, minlength=n_pixels)
+    mask_occupied = count > 0
+    if points.shape[1] > 3:
+        mean_intensity = np.bincount(pixels_id, weights=points[mask_inside, 3], minlength=n_pixels)[mask_occupied] \
+            / count[mask_occupied]
+        gray = np.clip((mean_intensity - intensity_range[0]) / (intensity_range[1] - intensity_range[0]), 0, 1)
+        image[mask_occupied] = (64.0 + 191.0 * gray[:, np.newaxis]).astype(np.uint8)
+    else:
+        image[mask_occupied] = 255
+
+    if points_cls is not None:
+        cls = points_cls[mask_inside]
+        mask_fg = cls > -1
+        if np.any(mask_fg):
+            # largest class of each pixel: sorted-segment max over foreground points
+            fg_pixels_id, fg_cls = pixels_id[mask_fg], cls[mask_fg]
+            order = np.argsort(fg_pixels_id, kind='stable')
+            fg_pixels_id = fg_pixels_id[order]
+            segments_start = np.flatnonzero(np.r_[True, fg_pixels_id[1:] != fg_pixels_id[:-1]])
+            image[fg_pixels_id[segments_start]] = to_uint8_colors(class_colors)[
+                np.maximum.reduceat(fg_cls[order], segments_start)]
+
+    image = image.reshape(height, width, 3)
+    if boxes is not None and boxes.shape[0] > 0:
+        colors = to_uint8_colors(class_colors)[boxes[:, 7].astype(int)] if boxes.shape[1] > 7 else None
+        draw_boxes_bev(image, boxes, point_cloud_range, resolution, colors, fill_alpha)
+    return image
+
+
+def render_perspective(points: np.ndarray, camera_intrinsic: np.ndarray, cam_from_points: np.ndarray,
+                       image_size: Sequence[int], image: np.ndarray = None, boxes: np.ndarray = None,
+                       point_colors: np.ndarray = None, box_colors: np.ndarray = None, max_points: int = None,
+                       max_depth: float = 50.0, min_depth: float = 1e-1) -> np.ndarray:
+    """
+    Render a point cloud & boxes seen by a camera without any figure, the nearest point of a pixel gives its color
+    :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+    :param camera_intrinsic: (3, 3)
+    :param cam_from_points: (4, 4) - transformation mapping points to camera's frame
+    :param image_size: (2,) - width, height
+    :param image: (H, W, 3) - uint8, camera's image to draw on. Default: black image
+    :param boxes: (B, 7[+D]) - center_x, center_y, center_z, dx, dy, dz, yaw, [...] | in the frame of points
+    :param point_colors: (N, 3) - r, g, b. Default: color by depth
+    :param box_colors: (B, 3) - r, g, b. Default: red
+    :param max_points: max number of points drawn, see get_lod_indices
+    :param max_depth: depth (in meter) mapped to the last color when coloring by depth
+    :param min_depth: near plane (in meter), points & parts of boxes in front of it are not drawn
+    :return: (H, W, 3) - uint8
+    """
+    width, height = int(image_size[0]), int(image_size[1])
+    image = np.zeros((height, width, 3), dtype=np.uint8) if image is None else np.array(image, dtype=np.uint8)
+
+    points_idx = get_lod_indices(points.shape[0], max_points)
+    depth_map, points_idx_map = get_depth_maps(points[points_idx], camera_intrinsic[np.newaxis],
+                                               cam_from_points[np.newaxis], (width, height), min_depth)
+    mask_occupied = points_idx_map[0] > -1
+    if point_colors is None:
+        image[mask_occupied] = colorize(depth_map[0, mask_occupied], 0.0, max_depth)
+    else:
+        image[mask_occupied] = to_uint8_colors(point_colors[points_idx[points_idx_map[0, mask_occupied]]])
+
+    if boxes is not None and boxes.shape[0] > 0:
+        corners = apply_tf(cam_from_points, boxes_to_corners(boxes).reshape(-1, 3)).reshape(-1, 8, 3)
+        starts, ends = corners[:, BOX_EDGES[:, 0]].reshape(-1, 3), corners[:, BOX_EDGES[:, 1]].reshape(-1, 3)
+        colors = np.array([[255, 0, 0]]) if box_colors is None else to_uint8_colors(box_colors)
+        colors = np.broadcast_to(colors[:, np.newaxis], (corners.shape[0], BOX_EDGES.shape[0], 3)).reshape(-1, 3)
+        # clip edges against the near plane
+        mask_visible = (starts[:, 2] >= min_depth) | (ends[:, 2] >= min_depth)
+        starts, ends, colors = starts[mask_visible], ends[mask_visible], colors[mask_visible]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (min_depth - starts[:, [2]]) / (ends[:, [2]] - starts[:, [2]])  # (S, 1)
+            on_near_plane = starts + t * (ends - starts)  # (S, 3) - only used for edges crossing the near plane
+        starts = np.where(starts[:, [2]] < min_depth, on_near_plane, starts)
+        ends = np.where(ends[:, [2]] < min_depth, on_near_plane, ends)
+        starts_px, ends_px = starts @ camera_intrinsic.T, ends @ camera_intrinsic.T
+        # pixel centers are at integers
+        draw_segments(image, starts_px[:, :2] / starts_px[:, [2]] - 0.5, ends_px[:, :2] / ends_px[:, [2]] - 0.5,
+                      colors)
+    return image
+
+
+def save_png(path: str, image: np.ndarray) -> None:
+    """
+    :param path:
+    :param image: (H, W, 3) - uint8
+    """
+    plt.imsave(path, image)
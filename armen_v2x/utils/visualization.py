@@ -1,38 +1,64 @@
 import numpy as np
 import open3d as o3d
 import matplotlib.pyplot as plt
-from armen_v2x.utils.geometry import make_tf, apply_tf, rot_z
+from armen_v2x.utils.geometry import boxes_to_corners
+from armen_v2x.utils.rendering import BOX_EDGES, get_lod_indices, make_bev_img
 from typing import Tuple
 
 
-def show_bev_img():
-    pass  # TODO
+def show_bev_img(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float, points_cls: np.ndarray = None,
+                 boxes: np.ndarray = None, class_colors: np.ndarray = None, ax: plt.Axes = None):
+    """
+    Show the BEV image of a point cloud, see make_bev_img for its layers
+    :param points: (N, 3[+C]) - x, y, z, [intensity, ...]
+    :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max
+    :param resolution: size of a pixel measured by meter
+    :param points_cls: (N,) - class index of points, -1 for background
+    :param boxes: (B, 7[+1]) - center_x, center_y, center_z, dx, dy, dz, yaw, [class_index]
+    :param class_colors: (n_classes, 3) - r, g, b of each class
+    :param ax: axes to draw on. If None, a new figure is created & shown
+    """
+    img = make_bev_img(points, point_cloud_range, resolution, points_cls, boxes, class_colors)
+    show = ax is None
+    if ax is None:
+        _, ax = plt.subplots()
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.imshow(img)  # row 0 is y_max, i.e. no need for origin='lower'
+    if show:
+        plt.show()
 
 
 def create_cube_o3d(corners: np.ndarray, color: Tuple[float] = None):
     """
-    Create a box to be visualized using open3d. Convention
-    forward face: 0 - 1 - 2 - 3, backward face: 4 - 5 - 6 - 7, top face: 0 - 4 - 5 - 1
+    Create a box to be visualized using open3d, see create_cubes_o3d for the convention
     :param corners: (8, 3) - coordinate of 8 corners
     :param color: color of the cube
     :return:
     """
-    lines = [
-        [0, 1], [1, 2], [2, 3], [3, 0],  # front
-        [4, 5], [5, 6], [6, 7], [7, 4],  # back
-        [0, 4], [1, 5], [2, 6], [3, 7],  # connecting front & back
-        [0, 2], [1, 3]  # denote forward face
-    ]
-    if color is None:
-        colors = [[1, 0, 0] for _ in range(len(lines))]  # red
-    else:
-        colors = [color for _ in range(len(lines))]
-    cube = o3d.geometry.LineSet(
-        points=o3d.utility.Vector3dVector(corners),
-        lines=o3d.utility.Vector2iVector(lines),
+    return create_cubes_o3d(corners[np.newaxis], None if color is None else np.asarray(color)[np.newaxis])
+
+
+def create_cubes_o3d(corners: np.ndarray, colors: np.ndarray = None):
+    """
+    Create boxes to be visualized using open3d as a single LineSet (see rendering.BOX_EDGES). Convention
+    forward face: 0 - 1 - 2 - 3, backward face: 4 - 5 - 6 - 7, top face: 0 - 4 - 5 - 1
+    :param corners: (B, 8, 3) - coordinate of 8 corners of each box
+    :param colors: (B, 3) - color of each box. Default: red
+    :return:
+    """
+    n_boxes = corners.shape[0]
+    lines = (BOX_EDGES[np.newaxis] + 8 * np.arange(n_boxes)[:, np.newaxis, np.newaxis]).reshape(-1, 2)
+    if colors is None:
+        colors = np.array([[1.0, 0.0, 0.0]])  # red
+    lines_colors = np.broadcast_to(np.asarray(colors, dtype=float)[:, np.newaxis],
+                                   (n_boxes, BOX_EDGES.shape[0], 3)).reshape(-1, 3)
+    cubes = o3d.geometry.LineSet(
+        points=o3d.utility.Vector3dVector(corners.reshape(-1, 3).astype(float)),
+        lines=o3d.utility.Vector2iVector(lines.astype(np.int32)),
     )
-    cube.colors = o3d.utility.Vector3dVector(colors)
-    return cube
+    cubes.colors = o3d.utility.Vector3dVector(lines_colors)
+    return cubes
 
 
 def box_to_corner(box: np.ndarray) -> np.ndarray:
@@ -44,35 +70,33 @@ def box_to_corner(box: np.ndarray) -> np.ndarray:
     :return: (8, 3)
     """
     assert box.shape == (7,), f"expect (7,), get {box.shape}"
-    # TODO: compute coordinate of 8 corners in the frame relative to which the `box` is expressed
-    # TODO: Notie the order of 8 corners must be according to the convention stated the function doc string
-    corners = np.zeros((8, 3))  # this is just a dummy value
-    return corners
+    return boxes_to_corners(box[np.newaxis])[0]
 
 
 def show_point_cloud(points: np.ndarray, boxes: np.ndarray = None, point_colors: np.ndarray = None,
-                     box_colors: np.ndarray = None):
+                     box_colors: np.ndarray = None, max_points: int = None):
     """
     Visualize point cloud
     :param points: (N, 3) - x, y, z
     :param boxes: (B, 7) - center_x, center_y, center_z, dx, dy, dz, yaw
     :param point_colors: (N, 3) - r, g, b
     :param box_colors: (B, 3) - r, g, b
+    :param max_points: max number of points displayed, a random subset is displayed if there are more (e.g. for
+        merged multi-agent point clouds). Default: display every point
     """
     assert points.shape[1] == 3, f"expect (N, 3), get {points.shape}"
-    assert boxes.shape[1] == 7, f"expect (B, 7), get {boxes.shape}"
+    assert boxes is None or boxes.shape[1] == 7, f"expect (B, 7), get {boxes.shape}"
+    points_idx = get_lod_indices(points.shape[0], max_points)
     pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(points)
+    pcd.points = o3d.utility.Vector3dVector(points[points_idx].astype(float))
     if point_colors is not None:
-        pcd.colors = o3d.utility.Vector3dVector(point_colors)
+        pcd.colors = o3d.utility.Vector3dVector(point_colors[points_idx].astype(float))
 
     frame = o3d.geometry.TriangleMesh.create_coordinate_frame()
     obj_to_display = [pcd, frame]
 
-    if boxes is not None:
-        cubes = [create_cube_o3d(box_to_corner(boxes[i]), box_colors[i] if box_colors is not None else None)
-                 for i in range(boxes.shape[0])]
-        obj_to_display += cubes
+    if boxes is not None and boxes.shape[0] > 0:
+        obj_to_display.append(create_cubes_o3d(boxes_to_corners(boxes), box_colors))
 
     o3d.visualization.draw_geometries(obj_to_display)
 
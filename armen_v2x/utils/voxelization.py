@@ -0,0 +1,87 @@
+import numpy as np
+from typing import Dict
+
+
+class Voxelizer:
+    """
+    Group points into voxels (or pillars, with a voxel as high as the range) with NumPy only. Points are sorted by
+    the linear id of their voxel, so points of a voxel form a contiguous segment & no hash table is needed.
+    Voxels are kept in the order of their first point, so the first max_voxels voxels are the ones hit first. With
+    shuffle, points are visited in a random order, i.e. points kept in a full voxel & voxels kept beyond
+    max_voxels are random.
+    """
+
+    def __init__(self, point_cloud_range: np.ndarray, voxel_size: np.ndarray, max_points_per_voxel: int = 32,
+                 max_voxels: int = None, shuffle: bool = False, seed: int = None):
+        """
+        :param point_cloud_range: (6) - x_min, y_min, z_min, x_max, y_max, z_max. Points outside are dropped
+        :param voxel_size: (3) - size_x, size_y, size_z, in meter. For pillars, size_z = z_max - z_min
+        :param max_points_per_voxel: number of points stored per voxel, extra points are dropped
+        :param max_voxels: number of voxels kept, extra voxels are dropped. If None, every voxel is kept
+        :param shuffle: to sample points in full voxels & voxels beyond max_voxels randomly instead of in order
+        :param seed: seed of the random generator used when shuffle is True
+        """
+        self.point_cloud_range = np.asarray(point_cloud_range, dtype=float)
+        self.voxel_size = np.asarray(voxel_size, dtype=float)
+        assert self.point_cloud_range.shape == (6,), f"{self.point_cloud_range.shape} != (6,)"
+        assert self.voxel_size.shape == (3,) and np.all(self.voxel_size > 0), f"invalid voxel_size {voxel_size}"
+        assert max_points_per_voxel > 0, f"max_points_per_voxel must be positive, get {max_points_per_voxel}"
+        assert max_voxels is None or max_voxels > 0, f"max_voxels must be positive, get {max_voxels}"
+        self.max_points_per_voxel = max_points_per_voxel
+        self.max_voxels = max_voxels
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.grid_size = np.round((self.point_cloud_range[3:] - self.point_cloud_range[:3]) / self.voxel_size) \
+            .astype(np.int64)  # (3,) - n_voxels_x, n_voxels_y, n_voxels_z
+
+    def __call__(self, points: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        :param points: (N, 3[+C]) - x, y, z, [C-dim features]
+        :return: {
+            voxels: (V, max_points_per_voxel, 3[+C]) - points of each voxel, padded with 0
+            voxel_coords: (V, 3) - voxel_x, voxel_y, voxel_z | integer coordinate of voxels
+            num_points_per_voxel: (V,) - number of points stored in each voxel
+            points_to_voxel: (N,) - points_to_voxel[i] = j means points[i] is in voxels[j], -1 for points outside of
+                the range or in dropped voxels. Points dropped from a full voxel are still mapped to their voxel
+        }
+        """
+        assert points.shape[1] >= 3, f'expect points has at least 3 coord, get: {points.shape[1]}'
+        coords = np.floor((points[:, :3] - self.point_cloud_range[:3]) / self.voxel_size).astype(np.int64)  # (N, 3)
+        points_idx = np.flatnonzero(np.all((coords >= 0) & (coords < self.grid_size), axis=1))  # (N',)
+        if self.shuffle:
+            points_idx = self.rng.permutation(points_idx)
+        coords = coords[points_idx]
+        voxels_id = (coords[:, 2] * self.grid_size[1] + coords[:, 1]) * self.grid_size[0] + coords[:, 0]  # (N',)
+
+        # stable sort: inside a segment, points are in the order they are visited
+        order = np.argsort(voxels_id, kind='stable')
+        sorted_voxels_id = voxels_id[order]
+        mask_segment_start = np.ones(order.shape[0], dtype=bool)
+        mask_segment_start[1:] = sorted_voxels_id[1:] != sorted_voxels_id[:-1]
+        segments_start = np.flatnonzero(mask_segment_start)  # (V',)
+        segment_of_sorted = np.cumsum(mask_segment_start) - 1  # (N',)
+        rank_in_voxel = np.arange(order.shape[0]) - segments_start[segment_of_sorted]  # (N',)
+
+        # keep voxels in the order of their first visited point, which is the first point of their segment
+        voxels_order = np.argsort(order[segments_start], kind='stable')
+        if self.max_voxels is not None:
+            voxels_order = voxels_order[:self.max_voxels]
+        segment_to_voxel = -np.ones(segments_start.shape[0], dtype=np.int64)
+        segment_to_voxel[voxels_order] = np.arange(voxels_order.shape[0])
+
+        n_voxels = voxels_order.shape[0]
+        sorted_voxel = segment_to_voxel[segment_of_sorted]  # (N',) - output voxel of sorted points, -1 if dropped
+        points_to_voxel = -np.ones(points.shape[0], dtype=np.int64)
+        points_to_voxel[points_idx[order]] = sorted_voxel
+
+        mask_stored = (sorted_voxel > -1) & (rank_in_voxel < self.max_points_per_voxel)
+        voxels = np.zeros((n_voxels, self.max_points_per_voxel, points.shape[1]), dtype=points.dtype)
+        voxels[sorted_voxel[mask_stored], rank_in_voxel[mask_stored]] = points[points_idx[order[mask_stored]]]
+        num_points_per_voxel = np.bincount(sorted_voxel[mask_stored], minlength=n_voxels)
+        voxel_coords = coords[order[segments_start[voxels_order]]]
+        return {
+            'voxels': voxels,
+            'voxel_coords': voxel_coords,
+            'num_points_per_voxel': num_points_per_voxel,
+            'points_to_voxel': points_to_voxel
+        }
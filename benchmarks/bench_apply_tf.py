@@ -0,0 +1,34 @@
+import numpy as np
+from einops import rearrange
+from benchmarks.utils import time_it, make_random_points
+from armen_v2x.utils.geometry import apply_tf, make_tf, rot_z
+
+
+POINTS_COUNTS = [100_000, 1_000_000, 5_000_000]
+
+
+def apply_tf_homogeneous(tf: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Reference implementation that pads points to homogeneous coordinate & transposes them twice
+    """
+    xyz1 = np.pad(points[:, :3], pad_width=[(0, 0), (0, 1)], constant_values=1)  # (N, 4)
+    xyz1 = rearrange(tf @ rearrange(xyz1, 'N C -> C N', C=4), 'C N -> N C')
+    return xyz1[:, :3]
+
+
+def main():
+    tf = make_tf([10.0, -5.0, 1.5], rot_z(0.3))
+    print(f"{'n_points':>10} {'homogeneous (s)':>16} {'R @ p + t (s)':>14} {'out= (s)':>9} {'speed up':>9}")
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points)
+        out = np.empty((n_points, 3), dtype=points.dtype)
+        assert np.allclose(apply_tf(tf, points), apply_tf_homogeneous(tf, points), atol=1e-4)
+
+        t_old = time_it(lambda: apply_tf_homogeneous(tf, points), n_repeat=3)
+        t_new = time_it(lambda: apply_tf(tf, points), n_repeat=3)
+        t_out = time_it(lambda: apply_tf(tf, points, out=out), n_repeat=3)
+        print(f"{n_points:>10} {t_old:>16.4f} {t_new:>14.4f} {t_out:>9.4f} {t_old / t_out:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
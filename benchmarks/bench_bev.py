@@ -0,0 +1,50 @@
+import numpy as np
+from benchmarks.utils import time_it, make_random_points
+from armen_v2x.utils.bev import BEVRasterizer
+
+
+POINTS_COUNTS = [100_000, 1_000_000]
+RESOLUTIONS = [0.1, 0.2]
+POINT_CLOUD_RANGE = np.array([-51.2, -51.2, -25.0, 51.2, 51.2, 3.0])
+
+
+def rasterize_add_at(points: np.ndarray, point_cloud_range: np.ndarray, resolution: float) -> np.ndarray:
+    """
+    Reference implementation with np.unique & np.add.at, producing occupancy & mean intensity only
+    """
+    bev_size = np.ceil((point_cloud_range[3: 5] - point_cloud_range[:2]) / resolution).astype(int)
+    pixels = np.floor((points[:, :2] - point_cloud_range[:2]) / resolution).astype(int)
+    unq_pixels, indices_pix2points, counts = np.unique(pixels, axis=0, return_inverse=True, return_counts=True)
+    pixels_intensity = np.zeros(unq_pixels.shape[0])
+    np.add.at(pixels_intensity, indices_pix2points.reshape(-1), points[:, 3])
+    pixels_intensity /= counts
+
+    bev = np.zeros((2, bev_size[1], bev_size[0]))
+    bev[0, unq_pixels[:, 1], unq_pixels[:, 0]] = 1
+    bev[1, unq_pixels[:, 1], unq_pixels[:, 0]] = pixels_intensity
+    return bev
+
+
+def main():
+    print(f"{'n_points':>10} {'resolution':>10} {'add.at (s)':>11} {'bincount (s)':>13} {'out= (s)':>9} "
+          f"{'speed up':>9}")
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points, extent=51.1)
+        points_src_idx = np.random.default_rng(0).integers(0, 6, size=n_points)
+        for resolution in RESOLUTIONS:
+            rasterizer = BEVRasterizer(POINT_CLOUD_RANGE, resolution, num_sources=6)
+            out = np.zeros(rasterizer.output_shape, dtype=np.float32)
+            bev_ref = rasterize_add_at(points, POINT_CLOUD_RANGE, resolution)
+            bev = rasterizer(points, points_src_idx)
+            assert np.array_equal(bev[0], bev_ref[0])
+            assert np.allclose(bev[rasterizer.channel_idx('mean_intensity')], bev_ref[1], atol=1e-5)
+
+            t_add_at = time_it(lambda: rasterize_add_at(points, POINT_CLOUD_RANGE, resolution), n_repeat=3)
+            t_bincount = time_it(lambda: rasterizer(points, points_src_idx), n_repeat=3)
+            t_out = time_it(lambda: rasterizer(points, points_src_idx, out=out), n_repeat=3)
+            print(f"{n_points:>10} {resolution:>10} {t_add_at:>11.4f} {t_bincount:>13.4f} {t_out:>9.4f} "
+                  f"{t_add_at / t_out:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
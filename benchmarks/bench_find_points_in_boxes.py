@@ -0,0 +1,41 @@
+import numpy as np
+from benchmarks.utils import time_it, make_random_points, make_random_boxes
+from armen_v2x.utils.geometry import find_points_in_boxes, rot_z
+
+
+POINTS_COUNTS = [100_000, 300_000, 1_000_000]
+BOXES_COUNTS = [50, 100, 200]
+
+
+def find_points_in_boxes_brute_force(points: np.ndarray, boxes: np.ndarray, tol=1e-2) -> np.ndarray:
+    """
+    Reference implementation that tests every point against every box, i.e. O(N x B)
+    """
+    boxes_to_points = -np.ones(points.shape[0], dtype=int)
+    for box_idx in reversed(range(boxes.shape[0])):
+        points_in_box = (points[:, :3] - boxes[box_idx, :3]) @ rot_z(boxes[box_idx, 6])  # (N, 3)
+        mask_inside = np.all(np.abs(points_in_box) <= boxes[box_idx, 3: 6] / 2.0 + tol, axis=1)
+        boxes_to_points[mask_inside] = box_idx
+    return boxes_to_points
+
+
+def main():
+    print(f"{'n_points':>10} {'n_boxes':>8} {'brute force (s)':>16} {'grid (s)':>10} {'speed up':>9} "
+          f"{'throughput (Mpts/s)':>20}")
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points)
+        for n_boxes in BOXES_COUNTS:
+            boxes = make_random_boxes(n_boxes)
+            assert np.array_equal(find_points_in_boxes(points, boxes), find_points_in_boxes_brute_force(points, boxes))
+            # a large tol widens the corners of rotated boxes beyond their rotated footprint
+            assert np.array_equal(find_points_in_boxes(points, boxes, tol=0.5, cell_size=1.925),
+                                  find_points_in_boxes_brute_force(points, boxes, tol=0.5))
+
+            t_brute = time_it(lambda: find_points_in_boxes_brute_force(points, boxes), n_repeat=3)
+            t_grid = time_it(lambda: find_points_in_boxes(points, boxes), n_repeat=3)
+            print(f"{n_points:>10} {n_boxes:>8} {t_brute:>16.4f} {t_grid:>10.4f} {t_brute / t_grid:>9.1f} "
+                  f"{n_points / t_grid / 1e6:>20.2f}")
+
+
+if __name__ == '__main__':
+    main()
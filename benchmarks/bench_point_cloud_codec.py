@@ -0,0 +1,81 @@
+import argparse
+import io
+import time
+import numpy as np
+from benchmarks.utils import time_it, make_random_points
+from armen_v2x.utils.point_cloud_codec import PointCloudCodec
+
+
+POINTS_COUNTS = [100_000, 1_000_000]
+POINT_CLOUD_RANGE = [-51.2, -51.2, -5.0, 51.2, 51.2, 3.0]
+CONFIGS = {
+    'raw': dict(compression=None, sort_by_voxel=False),
+    'zlib': dict(compression='zlib', sort_by_voxel=False),
+    'sorted + zlib': dict(compression='zlib', sort_by_voxel=True),
+    'sorted + lzma': dict(compression='lzma', sort_by_voxel=True, compression_level=1),
+}
+
+
+def load_pcd_bin(path: str) -> np.ndarray:
+    """
+    Read a .pcd.bin file like get_point_cloud does, without removing points close to the LiDAR
+    :return: (N, 4) - x, y, z, intensity | float32
+    """
+    return np.fromfile(path, dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+
+
+def check_round_trip(codec: PointCloudCodec, points: np.ndarray) -> float:
+    """
+    Check that decoded points are within the codec's error bound of points inside the range
+    :return: max error on x, y, z
+    """
+    mask_inside = np.all((points[:, :3] >= codec.point_cloud_range[:3]) &
+                         (points[:, :3] <= codec.point_cloud_range[3:]), axis=1)
+    mask_inside &= (points[:, 3] >= codec.intensity_range[0]) & (points[:, 3] <= codec.intensity_range[1])
+    points = np.ascontiguousarray(points[mask_inside])
+    decoded = PointCloudCodec.decode(codec.encode(points))
+    if codec.sort_by_voxel:
+        # order is not preserved, compare points sorted the same way
+        quantized = np.rint((points[:, :3] - codec.point_cloud_range[:3].astype(np.float64)) / codec.steps[:3])
+        points = points[np.lexsort((quantized[:, 2], quantized[:, 1], quantized[:, 0]))]
+    error = np.abs(decoded - points).max(axis=0)
+    assert np.all(error <= codec.max_error), f"error {error} > bound {codec.max_error}"
+    return float(error[:3].max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the point cloud codec')
+    parser.add_argument('--pcd', type=str, default=None, help='a .pcd.bin file to benchmark on, default: synthetic')
+    args = parser.parse_args()
+
+    clouds = {f'{args.pcd}': load_pcd_bin(args.pcd)} if args.pcd is not None else \
+        {f'random {n_points}': make_random_points(n_points) * np.array([1, 1, 1, 255], dtype=np.float32)
+         for n_points in POINTS_COUNTS}
+
+    print(f"{'cloud':>16} {'config':>14} {'ratio':>7} {'encode (MB/s)':>14} {'decode (MB/s)':>14} "
+          f"{'max xyz error (m)':>18}")
+    for cloud_name, points in clouds.items():
+        raw_mb = points.shape[0] * 5 * 4 / 1e6  # size of the .pcd.bin file
+        for config_name, config in CONFIGS.items():
+            codec = PointCloudCodec(POINT_CLOUD_RANGE, **config)
+            message = codec.encode(points)
+            error = check_round_trip(codec, points)
+            t_encode = time_it(lambda: codec.encode(points), n_repeat=3)
+            t_decode = time_it(lambda: PointCloudCodec.decode(message), n_repeat=3)
+            print(f"{cloud_name:>16} {config_name:>14} {raw_mb * 1e6 / len(message):>7.2f} "
+                  f"{raw_mb / t_encode:>14.1f} {raw_mb / t_decode:>14.1f} {error:>18.5f}")
+
+        # streaming: chunks are decoded as they are read
+        codec = PointCloudCodec(POINT_CLOUD_RANGE, compression='zlib', sort_by_voxel=True)
+        stream = io.BytesIO()
+        n_bytes = codec.encode_to_stream(stream, points, chunk_size=1 << 16)
+        stream.seek(0)
+        tic = time.perf_counter()
+        n_decoded = sum(chunk.shape[0] for chunk in PointCloudCodec.decode_from_stream(stream))
+        assert n_decoded == points.shape[0]
+        print(f"{cloud_name:>16} {'stream 64k':>14} {raw_mb * 1e6 / n_bytes:>7.2f} {'':>14} "
+              f"{raw_mb / (time.perf_counter() - tic):>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import numpy as np
+from benchmarks.utils import time_it, make_random_points
+from armen_v2x.utils.geometry import make_tf
+from armen_v2x.utils.range_view import get_depth_maps, RangeImageProjector
+
+
+POINTS_COUNTS = [100_000, 1_000_000]
+IMAGE_SIZE = (1600, 900)  # V2X-Sim's camera resolution
+NUM_CAMERAS = 4
+CAMERA_INTRINSIC = np.array([[800.0, 0.0, 800.0], [0.0, 800.0, 450.0], [0.0, 0.0, 1.0]])
+
+
+def make_cameras() -> np.ndarray:
+    """
+    :return: (NUM_CAMERAS, 4, 4) - cam <- LiDAR of cameras looking at front, left, back, right
+    """
+    # camera's z axis is LiDAR's x axis, camera's x axis is LiDAR's -y axis
+    lidar_from_cam0 = np.array([[0.0, 0.0, 1.0], [-1.0, 0.0, 0.0], [0.0, -1.0, 0.0]])
+    lidar_from_cams = []
+    for k in range(NUM_CAMERAS):
+        yaw = 2.0 * np.pi * k / NUM_CAMERAS
+        rot = np.array([[np.cos(yaw), -np.sin(yaw), 0.0], [np.sin(yaw), np.cos(yaw), 0.0], [0.0, 0.0, 1.0]])
+        lidar_from_cams.append(make_tf([0.0, 0.0, 0.5], rot @ lidar_from_cam0))
+    return np.linalg.inv(np.stack(lidar_from_cams))
+
+
+def depth_maps_minimum_at(points: np.ndarray, cams_from_points: np.ndarray) -> np.ndarray:
+    """
+    Reference implementation projecting one camera at a time & z-buffering with np.minimum.at
+    """
+    width, height = IMAGE_SIZE
+    depth_maps = np.full((cams_from_points.shape[0], height, width), np.inf)
+    for k, cam_from_points in enumerate(cams_from_points):
+        points_cam = points[:, :3] @ cam_from_points[:3, :3].T + cam_from_points[:3, 3]
+        points_cam = points_cam[points_cam[:, 2] > 1e-3]
+        uv = points_cam @ CAMERA_INTRINSIC.T
+        pixels = np.floor(uv[:, :2] / uv[:, [2]]).astype(int)
+        mask = np.all((pixels >= 0) & (pixels < IMAGE_SIZE), axis=1)
+        np.minimum.at(depth_maps[k], (pixels[mask, 1], pixels[mask, 0]), points_cam[mask, 2])
+    depth_maps[np.isinf(depth_maps)] = 0
+    return depth_maps
+
+
+def range_image_minimum_at(points: np.ndarray, projector: RangeImageProjector) -> np.ndarray:
+    """
+    Reference implementation z-buffering ranges with np.minimum.at
+    """
+    rows, columns, ranges = projector.get_pixels(points)
+    mask = (rows >= 0) & (rows < projector.num_beams)
+    range_image = np.full((projector.num_beams, projector.width), np.inf)
+    np.minimum.at(range_image, (rows[mask], columns[mask]), ranges[mask])
+    range_image[np.isinf(range_image)] = 0
+    return range_image
+
+
+def main():
+    cams_from_points = make_cameras()
+    intrinsics = np.tile(CAMERA_INTRINSIC, (NUM_CAMERAS, 1, 1))
+    print(f"depth maps: {NUM_CAMERAS} cameras of {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}")
+    print(f"{'n_points':>10} {'minimum.at (s)':>15} {'sort (s)':>9} {'speed up':>9}")
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points, extent=51.2)
+        # float32 points are projected in float32, check in float64 to land in the same pixels as the reference
+        depth_maps, _ = get_depth_maps(points.astype(float), intrinsics, cams_from_points, IMAGE_SIZE)
+        assert np.allclose(depth_maps, depth_maps_minimum_at(points, cams_from_points), atol=1e-5)
+        t_ref = time_it(lambda: depth_maps_minimum_at(points, cams_from_points), n_repeat=3)
+        t_sort = time_it(lambda: get_depth_maps(points, intrinsics, cams_from_points, IMAGE_SIZE), n_repeat=3)
+        print(f"{n_points:>10} {t_ref:>15.4f} {t_sort:>9.4f} {t_ref / t_sort:>9.1f}")
+
+    projector = RangeImageProjector(num_beams=32, width=1024)
+    print(f"range image: {projector.num_beams}x{projector.width}")
+    print(f"{'n_points':>10} {'minimum.at (s)':>15} {'sort (s)':>9} {'out= (s)':>9} {'speed up':>9}")
+    out = np.zeros(projector.output_shape, dtype=np.float32)
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points, extent=51.2)
+        range_image, _ = projector(points)
+        assert np.allclose(range_image[0], range_image_minimum_at(points, projector), atol=1e-4)
+        t_ref = time_it(lambda: range_image_minimum_at(points, projector), n_repeat=3)
+        t_sort = time_it(lambda: projector(points), n_repeat=3)
+        t_out = time_it(lambda: projector(points, out=out), n_repeat=3)
+        print(f"{n_points:>10} {t_ref:>15.4f} {t_sort:>9.4f} {t_out:>9.4f} {t_ref / t_out:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import numpy as np
+from benchmarks.utils import time_it, make_random_points
+from armen_v2x.utils.voxelization import Voxelizer
+
+
+POINTS_COUNTS = [1_000_000, 2_000_000, 5_000_000]
+POINT_CLOUD_RANGE = np.array([-51.2, -51.2, -3.0, 51.2, 51.2, 1.0])
+CONFIGS = {
+    'voxel 0.1 x 0.1 x 0.2': dict(voxel_size=[0.1, 0.1, 0.2], max_points_per_voxel=5, max_voxels=150_000),
+    'pillar 0.2 x 0.2': dict(voxel_size=[0.2, 0.2, 4.0], max_points_per_voxel=32, max_voxels=40_000),
+}
+
+
+def main():
+    print(f"{'n_points':>10} {'config':>22} {'ordered (s)':>12} {'shuffled (s)':>13} {'throughput (Mpts/s)':>20}")
+    for n_points in POINTS_COUNTS:
+        points = make_random_points(n_points)
+        for name, config in CONFIGS.items():
+            voxelizer = Voxelizer(POINT_CLOUD_RANGE, **config)
+            shuffled_voxelizer = Voxelizer(POINT_CLOUD_RANGE, shuffle=True, seed=0, **config)
+            t_ordered = time_it(lambda: voxelizer(points), n_repeat=3)
+            t_shuffled = time_it(lambda: shuffled_voxelizer(points), n_repeat=3)
+            print(f"{n_points:>10} {name:>22} {t_ordered:>12.4f} {t_shuffled:>13.4f} "
+                  f"{n_points / t_ordered / 1e6:>20.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+from typing import Callable
+
+
+def time_it(fn: Callable, n_repeat: int = 5, n_warmup: int = 1) -> float:
+    """
+    Measure the running time of a function
+    :param fn: function without argument to be timed
+    :param n_repeat: number of timed runs
+    :param n_warmup: number of untimed runs executed beforehand
+    :return: median running time in second
+    """
+    for _ in range(n_warmup):
+        fn()
+    timings = []
+    for _ in range(n_repeat):
+        tic = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - tic)
+    return float(np.median(timings))
+
+
+def make_random_points(n_points: int, extent: float = 51.2, seed: int = 0) -> np.ndarray:
+    """
+    Make a synthetic point cloud that resembles a merged V2X-Sim point cloud
+    :param n_points:
+    :param extent: points' x, y are drawn uniformly in [-extent, extent]
+    :param seed:
+    :return: (N, 4) - x, y, z, intensity | float32
+    """
+    rng = np.random.default_rng(seed)
+    points = np.empty((n_points, 4), dtype=np.float32)
+    points[:, :2] = rng.uniform(-extent, extent, size=(n_points, 2))
+    points[:, 2] = rng.uniform(-3.0, 1.0, size=n_points)
+    points[:, 3] = rng.uniform(0.0, 1.0, size=n_points)
+    return points
+
+
+def make_random_boxes(n_boxes: int, extent: float = 51.2, seed: int = 0) -> np.ndarray:
+    """
+    Make synthetic boxes with car-like sizes
+    :param n_boxes:
+    :param extent: boxes' center x, y are drawn uniformly in [-extent, extent]
+    :param seed:
+    :return: (B, 7) - center_x, center_y, center_z, dx, dy, dz, yaw
+    """
+    rng = np.random.default_rng(seed)
+    boxes = np.empty((n_boxes, 7))
+    boxes[:, :2] = rng.uniform(-extent, extent, size=(n_boxes, 2))
+    boxes[:, 2] = rng.uniform(-2.0, 0.0, size=n_boxes)
+    boxes[:, 3: 6] = rng.uniform([3.5, 1.6, 1.4], [5.5, 2.2, 2.0], size=(n_boxes, 3))
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, size=n_boxes)
+    return boxes
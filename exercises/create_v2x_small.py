@@ -1,100 +1,132 @@
-from nuscenes import NuScenes
+import argparse
 import json
+import os
 import os.path as osp
-import subprocess
+import shutil
+from typing import Callable, Dict, Iterator, Sequence, Set
 
 
-CHOSEN_SCENE_INDICES = [0]
-CHOSEN_SCENE_TOKENS = ['ce0d35zgspb9w90ytv0x9ik8bb6a1z7h']
+DEFAULT_SCENE_TOKENS = ['ce0d35zgspb9w90ytv0x9ik8bb6a1z7h']
 DATA_ROOT = '../data/v2x-sim/v1.0-mini'
 JSON_OUT = '../data/v2x-sim/v1.0-small'
-
-
-def filter_scene():
-    with open(osp.join(DATA_ROOT, 'scene.json')) as f:
-        data = json.load(f)
-    remove_indices = [idx for idx, scene in enumerate(data) if scene['token'] not in CHOSEN_SCENE_TOKENS]
-    for idx in reversed(remove_indices):
-        del data[idx]
-
-    with open(osp.join(JSON_OUT, 'scene.json'), 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
-
-def filter_log():
-    with open(osp.join(JSON_OUT, 'scene.json')) as f:
-        scenes = json.load(f)
-
-    kept_log_tokens = [scene['log_token'] for scene in scenes]
-
-    with open(osp.join(DATA_ROOT, 'log.json')) as f:
-        logs = json.load(f)
-    remove_log_indices = [idx for idx, log in enumerate(logs) if log['token'] not in kept_log_tokens]
-    for idx in reversed(remove_log_indices):
-        del logs[idx]
-
-    with open(osp.join(JSON_OUT, 'log.json'), 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=4)
-
-
-def filter_sample():
-    with open(osp.join(DATA_ROOT, 'sample.json')) as f:
-        samples = json.load(f)
-    remove_sample_indices = [idx for idx, sample in enumerate(samples)
-                             if sample['scene_token'] not in CHOSEN_SCENE_TOKENS]
-    for idx in reversed(remove_sample_indices):
-        del samples[idx]
-
-    with open(osp.join(JSON_OUT, 'sample.json'), 'w', encoding='utf-8') as f:
-        json.dump(samples, f, ensure_ascii=False, indent=4)
-
-
-def filter_sample_data():
-    with open(osp.join(JSON_OUT, 'sample.json')) as f:
-        samples = json.load(f)
-
-    chosen_sample_tokens = [sample['token'] for sample in samples]
-
-    with open(osp.join(DATA_ROOT, 'sample_data.json')) as f:
-        sample_datas = json.load(f)
-    remove_sd_indices = [idx for idx, sd in enumerate(sample_datas)
-                             if sd['sample_token'] not in chosen_sample_tokens]
-    for idx in reversed(remove_sd_indices):
-        del sample_datas[idx]
-
-    with open(osp.join(JSON_OUT, 'sample_data.json'), 'w', encoding='utf-8') as f:
-        json.dump(sample_datas, f, ensure_ascii=False, indent=4)
-
-
-def filter_sample_annotation():
-    with open(osp.join(JSON_OUT, 'sample.json')) as f:
-        samples = json.load(f)
-
-    chosen_sample_tokens = [sample['token'] for sample in samples]
-
-    with open(osp.join(DATA_ROOT, 'sample_annotation.json')) as f:
-        sample_annos = json.load(f)
-    remove_sd_indices = [idx for idx, anno in enumerate(sample_annos)
-                             if anno['sample_token'] not in chosen_sample_tokens]
-    for idx in reversed(remove_sd_indices):
-        del sample_annos[idx]
-
-    with open(osp.join(JSON_OUT, 'sample_annotation.json'), 'w', encoding='utf-8') as f:
-        json.dump(sample_annos, f, ensure_ascii=False, indent=4)
-
-
-def copy_unfiltered_json_files():
-    unfiltered_files = ['attribute.json', 'calibrated_sensor.json', 'category.json', 'ego_pose.json', 'instance.json',
-                        'lidarseg.json', 'map.json', 'sensor.json', 'visibility.json']
-    for filename in unfiltered_files:
-        cmd_out = subprocess.run(['cp', osp.join(DATA_ROOT, filename), osp.join(JSON_OUT, filename)],
-                                 stdout=subprocess.PIPE)
+UNFILTERED_FILES = ['attribute.json', 'category.json', 'instance.json', 'map.json', 'sensor.json', 'visibility.json']
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 22) -> Iterator[dict]:
+    """
+    Stream the records of a file holding a JSON array, without loading the whole file
+    :param path:
+    :param chunk_size: number of characters read at once
+    :return: iterator of records
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        pos = buffer.index('[') + 1
+        is_eof = False
+        while True:
+            # skip separators between records
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or is_eof:
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                is_eof = len(buffer) == 0
+            if is_eof or buffer[pos] == ']':
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the record is cut by the end of the buffer, read more
+                more = f.read(chunk_size)
+                if len(more) == 0:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield record
+            pos = end
+
+
+def filter_table(name: str, keep: Callable[[dict], bool], data_root: str, json_out: str,
+                 collected_keys: Sequence[str] = ()) -> Dict[str, Set[str]]:
+    """
+    Stream a table & write the records to keep as compact JSON, one record per line. Kept records are not held in
+    memory, only the values of collected_keys
+    :param name: name of the table (e.g. sample)
+    :param keep: tell if a record is kept
+    :param data_root: directory of the input tables
+    :param json_out: directory of the output tables
+    :param collected_keys: keys whose values in kept records are collected (e.g. token)
+    :return: {key: values of key in kept records} for key in collected_keys
+    """
+    collected = {key: set() for key in collected_keys}
+    n_kept = 0
+    with open(osp.join(json_out, f'{name}.json'), 'w', encoding='utf-8') as f:
+        f.write('[')
+        for record in iter_json_array(osp.join(data_root, f'{name}.json')):
+            if keep(record):
+                f.write(',\n' if n_kept > 0 else '\n')
+                json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+                n_kept += 1
+                for key, values in collected.items():
+                    values.add(record[key])
+        f.write('\n]\n')
+    print(f'{name}: kept {n_kept} records')
+    return collected
+
+
+def create_subset(scene_tokens: Set[str], data_root: str, json_out: str) -> None:
+    """
+    Filter the tables of a split to the chosen scenes. Tables are filtered in the order of their dependency, each
+    one being read once, & records are looked up by token in sets
+    :param scene_tokens: tokens of chosen scenes
+    :param data_root: directory of the input tables
+    :param json_out: directory of the output tables
+    """
+    os.makedirs(json_out, exist_ok=True)
+    scenes = filter_table('scene', lambda rec: rec['token'] in scene_tokens, data_root, json_out,
+                          ('token', 'log_token'))
+    assert scenes['token'] == scene_tokens, f"scenes not found: {scene_tokens - scenes['token']}"
+    log_tokens = scenes['log_token']
+    filter_table('log', lambda rec: rec['token'] in log_tokens, data_root, json_out)
+
+    sample_tokens = filter_table('sample', lambda rec: rec['scene_token'] in scene_tokens, data_root, json_out,
+                                 ('token',))['token']
+    sample_datas = filter_table('sample_data', lambda rec: rec['sample_token'] in sample_tokens, data_root, json_out,
+                                ('token', 'calibrated_sensor_token', 'ego_pose_token'))
+    filter_table('sample_annotation', lambda rec: rec['sample_token'] in sample_tokens, data_root, json_out)
+
+    sd_tokens = sample_datas['token']
+    calib_tokens = sample_datas['calibrated_sensor_token']
+    ego_pose_tokens = sample_datas['ego_pose_token']
+    filter_table('calibrated_sensor', lambda rec: rec['token'] in calib_tokens, data_root, json_out)
+    filter_table('ego_pose', lambda rec: rec['token'] in ego_pose_tokens, data_root, json_out)
+    if osp.isfile(osp.join(data_root, 'lidarseg.json')):
+        filter_table('lidarseg', lambda rec: rec['sample_data_token'] in sd_tokens, data_root, json_out)
+
+    for filename in UNFILTERED_FILES:
+        if osp.isfile(osp.join(data_root, filename)):
+            shutil.copyfile(osp.join(data_root, filename), osp.join(json_out, filename))
 
 
 if __name__ == '__main__':
-    # filter_scene()
-    # filter_log()
-    # filter_sample()
-    # filter_sample_data()
-    # filter_sample_annotation()
-    copy_unfiltered_json_files()
+    parser = argparse.ArgumentParser(description='create a subset of a V2X-Sim split made of chosen scenes')
+    parser.add_argument('--data_root', type=str, default=DATA_ROOT, help='directory of the tables of the split')
+    parser.add_argument('--json_out', type=str, default=JSON_OUT, help='directory of the tables of the subset')
+    parser.add_argument('--scene_tokens', type=str, nargs='*', default=[],
+                        help='default: DEFAULT_SCENE_TOKENS if no scene is chosen')
+    parser.add_argument('--scene_indices', type=int, nargs='*', default=[],
+                        help='indices of scenes in scene.json, combined with scene_tokens')
+    args = parser.parse_args()
+
+    chosen_scene_tokens = set(args.scene_tokens)
+    if len(args.scene_indices) > 0:
+        chosen_indices = set(args.scene_indices)
+        chosen_scene_tokens.update(scene['token'] for idx, scene in
+                                   enumerate(iter_json_array(osp.join(args.data_root, 'scene.json')))
+                                   if idx in chosen_indices)
+    if len(chosen_scene_tokens) == 0:
+        chosen_scene_tokens = set(DEFAULT_SCENE_TOKENS)
+    create_subset(chosen_scene_tokens, args.data_root, args.json_out)
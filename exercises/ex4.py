@@ -4,7 +4,8 @@ from exercises.utils import *
 from armen_v2x.dataset.v2x_sim.v2x_sim_utils import get_annotated_boxes_in_sensor_frame, get_available_point_clouds, \
     CLASS_COLORS
 from armen_v2x.utils.visualization import show_point_cloud
-from armen_v2x.utils.geometry import orthogonal_projection, get_points_in_range
+from armen_v2x.utils.geometry import crop_and_project
+from armen_v2x.utils.bev import BEVRasterizer
 
 
 def main():
@@ -22,18 +23,13 @@ def main():
     point_cloud_range = np.array([-51.2, -51.2, -25.0, 51.2, 51.2, 3.0])
     bev_resolution = 0.2
     bev_imsize = np.ceil((point_cloud_range[3: 5] - point_cloud_range[:2]) / bev_resolution).astype(int)  # (width, height)
-    points = get_points_in_range(points, point_cloud_range)
-    pixels, indices_pix2points = orthogonal_projection(points, point_cloud_range, bev_resolution)
+    points, pixels, indices_pix2points = crop_and_project(points, point_cloud_range, bev_resolution)
 
     bev_occupancy = np.zeros((bev_imsize[1], bev_imsize[0]))
     # TODO: use `pixels` to assign white color (255) to occupied pixels of `bev_occupancy`
 
-    bev_intensity = np.zeros((bev_imsize[1], bev_imsize[0]))
-    unq_pixel_ids, counts = np.unique(indices_pix2points, return_counts=True)
-    pixels_intensity = np.zeros(pixels.shape[0])
-    np.add.at(pixels_intensity, indices_pix2points, points[:, 3])
-    pixels_intensity /= counts
-    bev_intensity[pixels[:, 1], pixels[:, 0]] = pixels_intensity
+    rasterizer = BEVRasterizer(point_cloud_range, bev_resolution)
+    bev_intensity = rasterizer(points)[rasterizer.channel_idx('mean_intensity')]
 
     fig, ax = plt.subplots(1, 2)
     for i in range(2):